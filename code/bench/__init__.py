@@ -0,0 +1,8 @@
+"""
+性能基准 (Benchmark)
+全部离线运行：使用临时 SQLite 数据库，不依赖 MySQL 和网络。
+在 code 目录下执行，例如：
+    python -m bench.bench_chat_list
+全部一起跑并输出 JSON (跨版本 diff 用)：
+    python -m bench.run_all --out result.json
+"""
@@ -0,0 +1,102 @@
+"""
+追加消息的基准：单个会话的历史从 10 条增长到 10k 条时，
+POST /messages (返回整个 ChatDisplay) 和 POST /messages/delta (只返回新消息) 的延迟和响应大小。
+
+每次测量后删掉刚追加的消息，保证每个档位的历史条数不变。
+
+    python -m bench.bench_add_message [--sizes 10,100,1000,10000] [--out result.json]
+"""
+import argparse
+import asyncio
+import time
+
+from sqlalchemy import delete
+
+from biz.chat.db_models import User, Chat, ChatMessage
+from bench.common import make_sqlite, make_app_client, auth_headers, summarize, write_json
+
+USER_ID = 1
+ENDPOINTS = [
+    ("add_message_full", "/api/v1/chat/messages"),
+    ("add_message_delta", "/api/v1/chat/messages/delta"),
+]
+
+
+def seed(engine, chat_id: int, n: int) -> int:
+    """给会话写入 n 条历史 (user / assistant 交替)，返回最后一条的 msg_id"""
+    rows = [
+        {
+            "chat_id": chat_id,
+            "role": "user" if i % 2 == 0 else "assistant",
+            "content": f"第 {i} 条消息，" + "内容" * 40,
+            "create_time": str(1735689600 + i),
+        }
+        for i in range(n)
+    ]
+    with engine.begin() as conn:
+        for i in range(0, len(rows), 5000):
+            conn.execute(ChatMessage.__table__.insert(), rows[i:i + 5000])
+        conn.execute(
+            Chat.__table__.update().where(Chat.chat_id == chat_id),
+            {"messages_num": n, "last_message": rows[-1]["content"][:100] if rows else ""}
+        )
+        return conn.execute(ChatMessage.__table__.select().with_only_columns(ChatMessage.msg_id)
+                            .order_by(ChatMessage.msg_id.desc()).limit(1)).scalar() or 0
+
+
+async def measure_endpoint(client, engine, url, chat_id, lastMsgId, repeat, warmup):
+    samples = []
+    size = 0
+    body = {"chat_id": chat_id, "role": "user", "content": "新的一条消息"}
+    for i in range(warmup + repeat):
+        start = time.perf_counter()
+        resp = await client.post(url, json=body, headers=auth_headers(USER_ID))
+        elapsed = (time.perf_counter() - start) * 1000
+        resp.raise_for_status()
+        size = len(resp.content)
+        if i >= warmup:
+            samples.append(elapsed)
+        # 还原历史条数
+        with engine.begin() as conn:
+            conn.execute(delete(ChatMessage).where(ChatMessage.chat_id == chat_id, ChatMessage.msg_id > lastMsgId))
+    return dict(summarize(samples), response_bytes=size)
+
+
+async def run(sizes, repeat, warmup):
+    results = {"bench": "add_message", "cases": []}
+    for n in sizes:
+        engine, _ = make_sqlite(f"add_message_{n}.db")
+        with engine.begin() as conn:
+            conn.execute(User.__table__.insert(), {"uid": USER_ID, "user_name": "bench", "password": "x"})
+            chat_id = conn.execute(Chat.__table__.insert(), {
+                "title": "bench", "creator_id": USER_ID, "messages_num": 0,
+                "is_pinned": 0, "is_deleted": 0, "is_archived": 0,
+            }).inserted_primary_key[0]
+        lastMsgId = seed(engine, chat_id, n)
+
+        client, async_engine = make_app_client(engine)
+        case = {"history": n}
+        try:
+            for name, url in ENDPOINTS:
+                case[name] = await measure_endpoint(client, engine, url, chat_id, lastMsgId, repeat, warmup)
+        finally:
+            await client.aclose()
+            await async_engine.dispose()
+            engine.dispose()
+        results["cases"].append(case)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="追加消息基准")
+    parser.add_argument("--sizes", default="10,100,1000,10000")
+    parser.add_argument("--repeat", type=int, default=30)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args()
+    sizes = [int(x) for x in args.sizes.split(",")]
+    write_json(asyncio.run(run(sizes, args.repeat, args.warmup)), args.out)
+
+
+if __name__ == "__main__":
+    main()
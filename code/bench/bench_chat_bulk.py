@@ -0,0 +1,80 @@
+"""
+批量会话操作的基准：处理 N 个会话时
+- 逐个调用  N 次 POST /chats、N 次 PUT /chats/{id}
+- 批量接口  1 次 POST /chats/bulk、1 次 PATCH /chats
+对比总耗时 (进程内应用 + 临时 SQLite，不经过网络，真实部署还要再加上 N 次网络往返)
+
+    python -m bench.bench_chat_bulk [--chats 10,100,200] [--out result.json]
+"""
+import argparse
+import asyncio
+import time
+
+from biz.chat.db_models import User
+from bench.common import make_sqlite, make_app_client, auth_headers, write_json
+
+USER_ID = 1
+
+
+async def timed(fn):
+    start = time.perf_counter()
+    await fn()
+    return round((time.perf_counter() - start) * 1000, 3)
+
+
+async def run_case(n: int):
+    engine, SessionLocal = make_sqlite(f"bulk_{n}.db")
+    with SessionLocal() as db:
+        db.add(User(uid=USER_ID, user_name="bench", password="x"))
+        db.commit()
+    client, async_engine = make_app_client(engine)
+    headers = auth_headers(USER_ID)
+    ids = []
+
+    async def create_each():
+        for i in range(n):
+            r = await client.post("/api/v1/chat/chats", json={"title": f"会话 {i}"}, headers=headers)
+            ids.append(r.json()["chat_id"])
+
+    async def create_bulk():
+        r = await client.post("/api/v1/chat/chats/bulk", json={"chats": [{"title": f"会话 {i}"} for i in range(n)]}, headers=headers)
+        assert r.status_code == 200 and len(r.json()) == n
+
+    async def update_each():
+        for chat_id in ids:
+            r = await client.put(f"/api/v1/chat/chats/{chat_id}", json={"is_archived": 1}, headers=headers)
+            assert r.status_code == 200
+
+    async def update_bulk():
+        r = await client.patch("/api/v1/chat/chats", json={"chat_ids": ids, "is_archived": 0}, headers=headers)
+        assert len(r.json()["updated"]) == n
+
+    case = {
+        "chats": n,
+        "create_each_ms": await timed(create_each),
+        "create_bulk_ms": await timed(create_bulk),
+        "update_each_ms": await timed(update_each),
+        "update_bulk_ms": await timed(update_bulk),
+    }
+    case["create_speedup"] = round(case["create_each_ms"] / case["create_bulk_ms"], 1)
+    case["update_speedup"] = round(case["update_each_ms"] / case["update_bulk_ms"], 1)
+    await client.aclose()
+    await async_engine.dispose()
+    engine.dispose()
+    return case
+
+
+async def run(sizes):
+    return {"bench": "chat_bulk", "cases": [await run_case(n) for n in sizes]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量会话操作基准")
+    parser.add_argument("--chats", default="10,100,200")
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args()
+    write_json(asyncio.run(run([int(x) for x in args.chats.split(",")])), args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+会话列表 (user_chat_summaries_stmt + split_chat_page，即 get_user_chat_summaries) 的基准：
+单个用户的会话数从 100 增长到 100k，首页和深分页的延迟应保持平稳。
+
+    python -m bench.bench_chat_list [--sizes 100,1000,10000,100000] [--out result.json]
+"""
+import argparse
+from datetime import datetime, timedelta
+
+from biz.chat.db_models import Chat
+from biz.chat import chat_crud
+from bench.common import make_sqlite, measure, write_json
+
+USER_ID = 1
+PAGE_SIZE = 50
+
+
+def seed(engine, n: int) -> None:
+    """给 USER_ID 写入 n 个会话 (5% 置顶)，另外写入 n/10 个其他用户的会话"""
+    base = datetime(2025, 1, 1)
+    rows = [
+        {
+            "title": f"chat {i}",
+            "creator_id": USER_ID,
+            "is_pinned": 1 if i % 20 == 0 else 0,
+            "is_deleted": 1 if i % 50 == 0 else 0,
+            "is_archived": 0,
+            "messages_num": 0,
+            "last_message": "",
+            # 每 10 个会话共用一个时间，覆盖 update_time 相同的情况
+            "update_time": base + timedelta(seconds=i // 10),
+        }
+        for i in range(n)
+    ]
+    rows += [dict(r, creator_id=USER_ID + 1) for r in rows[: n // 10]]
+    with engine.begin() as conn:
+        for i in range(0, len(rows), 5000):
+            conn.execute(Chat.__table__.insert(), rows[i:i + 5000])
+
+
+def summaries(db, cursor):
+    """和 chat_crud_async.get_user_chat_summaries 一样的查询，用同步 Session 执行"""
+    rows = db.execute(chat_crud.user_chat_summaries_stmt(USER_ID, cursor, PAGE_SIZE)).scalars().all()
+    return chat_crud.split_chat_page(list(rows), PAGE_SIZE)
+
+
+def run(sizes):
+    results = {"bench": "chat_list", "page_size": PAGE_SIZE, "cases": []}
+    for n in sizes:
+        engine, SessionLocal = make_sqlite(f"chat_list_{n}.db")
+        seed(engine, n)
+        db = SessionLocal()
+        try:
+            # 深分页的游标：取列表中间位置的那一条
+            middle = db.query(Chat)\
+                .filter(Chat.creator_id == USER_ID, Chat.is_deleted == 0)\
+                .order_by(Chat.is_pinned.desc(), Chat.update_time.desc(), Chat.chat_id.desc())\
+                .offset(n // 2)\
+                .first()
+            deep_cursor = chat_crud.encode_chat_cursor(middle) if middle else None
+
+            first = measure(lambda: summaries(db, None))
+            deep = measure(lambda: summaries(db, deep_cursor))
+        finally:
+            db.close()
+            engine.dispose()
+        results["cases"].append({"chats": n, "first_page": first, "deep_page": deep})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="会话列表分页基准")
+    parser.add_argument("--sizes", default="100,1000,10000,100000")
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args()
+    sizes = [int(x) for x in args.sizes.split(",")]
+    write_json(run(sizes), args.out)
+
+
+if __name__ == "__main__":
+    main()
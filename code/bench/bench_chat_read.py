@@ -0,0 +1,103 @@
+"""
+读接口的基准：延迟和响应大小
+- GET /chats (get_user_chats，带全部历史) 对比 GET /chats/summary，会话数 10 ~ 1000，每个会话 MSGS_PER_CHAT 条消息
+- GET /history/{id} (get_history，全量) 对比 GET /history/{id}/page，历史 10 ~ 10k 条
+
+    python -m bench.bench_chat_read [--chats 10,100,1000] [--history 10,100,1000,10000] [--out result.json]
+"""
+import argparse
+import asyncio
+
+from biz.chat.db_models import User, Chat, ChatMessage
+from bench.common import make_sqlite, make_app_client, auth_headers, measure_async, write_json
+
+USER_ID = 1
+MSGS_PER_CHAT = 10
+API = "/api/v1/chat"
+
+
+def seed(engine, chats: int, msgsPerChat: int):
+    """写入 chats 个会话，每个 msgsPerChat 条消息，返回 chat_id 列表"""
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert(), {"uid": USER_ID, "user_name": "bench", "password": "x"})
+        conn.execute(Chat.__table__.insert(), [
+            {
+                "title": f"chat {i}", "creator_id": USER_ID, "messages_num": msgsPerChat,
+                "is_pinned": 0, "is_deleted": 0, "is_archived": 0, "last_message": "",
+            }
+            for i in range(chats)
+        ])
+        ids = [r[0] for r in conn.execute(Chat.__table__.select().with_only_columns(Chat.chat_id))]
+        rows = [
+            {
+                "chat_id": cid,
+                "role": "user" if i % 2 == 0 else "assistant",
+                "content": f"第 {i} 条消息，" + "内容" * 40,
+                "create_time": str(1735689600 + i),
+            }
+            for cid in ids for i in range(msgsPerChat)
+        ]
+        for i in range(0, len(rows), 5000):
+            conn.execute(ChatMessage.__table__.insert(), rows[i:i + 5000])
+    return ids
+
+
+async def timed_get(client, url, repeat):
+    headers = auth_headers(USER_ID)
+    size = 0
+
+    async def call():
+        nonlocal size
+        resp = await client.get(url, headers=headers)
+        resp.raise_for_status()
+        size = len(resp.content)
+
+    stats = await measure_async(call, repeat=repeat)
+    return dict(stats, response_bytes=size)
+
+
+async def run_case(name, chats, msgsPerChat, urls, repeat):
+    engine, _ = make_sqlite(f"{name}.db")
+    ids = seed(engine, chats, msgsPerChat)
+    client, async_engine = make_app_client(engine)
+    try:
+        return {key: await timed_get(client, url.format(chat_id=ids[0]), repeat) for key, url in urls}
+    finally:
+        await client.aclose()
+        await async_engine.dispose()
+        engine.dispose()
+
+
+async def run(chatSizes, historySizes, repeat):
+    results = {"bench": "chat_read", "msgs_per_chat": MSGS_PER_CHAT, "chat_list": [], "history": []}
+    for n in chatSizes:
+        case = await run_case(f"chat_read_list_{n}", n, MSGS_PER_CHAT, [
+            ("get_user_chats", f"{API}/chats"),
+            ("chat_summaries", f"{API}/chats/summary?limit=50"),
+        ], repeat)
+        results["chat_list"].append(dict(chats=n, **case))
+    for n in historySizes:
+        case = await run_case(f"chat_read_history_{n}", 1, n, [
+            ("get_history", API + "/history/{chat_id}"),
+            ("history_page", API + "/history/{chat_id}/page?limit=50"),
+        ], repeat)
+        results["history"].append(dict(messages=n, **case))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="会话列表 / 历史消息读取基准")
+    parser.add_argument("--chats", default="10,100,1000")
+    parser.add_argument("--history", default="10,100,1000,10000")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args()
+    write_json(asyncio.run(run(
+        [int(x) for x in args.chats.split(",")],
+        [int(x) for x in args.history.split(",")],
+        args.repeat,
+    )), args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+冷存储的基准：一批会话里大部分长期不活跃 (默认 80%)，冷冻前后对比
+- 热表大小  chat_message (含索引) 和 FTS5 索引占用的字节数 (dbstat，FTS5 冷冻后保留，冷会话照样能搜到)，以及 VACUUM 之后的文件大小
+- 冷表大小  chat_archive 的字节数，和压缩前 JSON 的比例
+- 冷冻速度  ArchiveSweeper 一轮的耗时
+- 读取延迟  热会话 / 冷会话读取全部历史 (冷会话要解压)，以及往冷会话追加消息 (先搬回) 的耗时
+
+    python -m bench.bench_cold_storage [--chats 1000] [--messages 50] [--idle 0.8] [--repeat 30] [--out result.json]
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+
+from sqlalchemy import bindparam, text, update
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from biz.chat.db_models import User, Chat, ChatMessage
+from biz.chat import chat_archive, chat_search
+from biz.chat import chat_crud_async
+from biz.chat.chat_archive import ArchiveSweeper, ARCHIVE_STATS
+from biz.chat.chat_schemas import ChatMessageCreate
+from tool.db_session import toShow, applySqliteProfile
+from tool.TokenTool import TokenTool
+from bench.common import make_sqlite, measure_async, write_json
+
+USER_ID = 1
+# 造数据用的词表：有重复的自然语言 + 代码片段，比纯随机字符更接近真实对话的压缩率
+WORDS = (
+    "我们 可以 这个 问题 需要 先 看一下 数据库 索引 查询 性能 优化 部署 服务器 配置 文件 日志 "
+    "错误 原因 可能 是 因为 没有 然后 再 试试 结果 返回 接口 前端 后端 用户 会话 消息 模型 "
+    "def return import self None True False for in if else async await select where order by "
+    "the a to of and is that it for you this with be are can not on as use your have"
+).split()
+TABLES = ("chat_message", "ix_chat_message_chat_msg", "ix_chat_message_chat_tokens", "chat_archive")
+
+
+def content(rnd) -> str:
+    return " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(20, 120)))
+
+
+def seed(engine, chats: int, messages: int, idle: float):
+    """Core 批量写入；前 idle 比例的会话 update_time 设成一年前 (冷冻任务会选中它们)"""
+    rnd = random.Random(42)
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert(), {"uid": USER_ID, "user_name": "bench", "password": "x"})
+        conn.execute(Chat.__table__.insert(), [
+            {"title": f"会话 {i}", "creator_id": USER_ID, "messages_num": messages, "is_pinned": 0,
+             "is_deleted": 0, "is_archived": 0, "last_message": "", "tokens_num": 0}
+            for i in range(chats)
+        ])
+        rows, totals = [], {}
+        for i in range(chats * messages):
+            chat_id = i % chats + 1
+            body = content(rnd)
+            count = TokenTool.countMessage(body)
+            offset = totals.get(chat_id, 0)
+            totals[chat_id] = offset + count
+            rows.append({
+                "chat_id": chat_id, "role": "user" if i % 2 == 0 else "assistant", "content": body,
+                "token_count": count, "token_offset": offset, "create_time": str(1735689600 + i),
+            })
+        for i in range(0, len(rows), 5000):
+            conn.execute(ChatMessage.__table__.insert(), rows[i:i + 5000])
+        conn.execute(
+            update(Chat).where(Chat.chat_id == bindparam("b_id")).values(tokens_num=bindparam("b_tokens")),
+            [{"b_id": k, "b_tokens": v} for k, v in totals.items()],
+        )
+        conn.execute(
+            update(Chat).where(Chat.chat_id <= int(chats * idle)).values(update_time=text("'2024-01-01 00:00:00'"))
+        )
+
+
+def table_bytes(engine):
+    """各个 btree 实际占用的字节数 (不含空闲页)；FTS5 的影子表合计成 fts"""
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql("SELECT name, sum(pgsize) FROM dbstat GROUP BY name").all()
+    sizes = {name: size for name, size in rows}
+    result = {name: sizes.get(name, 0) for name in TABLES}
+    result["fts"] = sum(size for name, size in sizes.items() if name.startswith("chat_message_fts"))
+    result["hot_total"] = sum(result[n] for n in TABLES[:3]) + result["fts"]
+    return result
+
+
+def file_bytes(engine):
+    """VACUUM 之后的数据库文件大小"""
+    with engine.connect() as conn:
+        conn.exec_driver_sql("VACUUM")
+    return os.path.getsize(engine.url.database)
+
+
+async def run(chats: int, messages: int, idle: float, repeat: int):
+    engine, SessionLocal = make_sqlite("cold.db")
+    seed(engine, chats, messages, idle)
+    chat_search.ensure_search_index(engine)
+    before = table_bytes(engine)
+    before["file"] = file_bytes(engine)
+
+    for key in ARCHIVE_STATS:
+        ARCHIVE_STATS[key] = 0
+    sweeper = ArchiveSweeper(idleDays=30, batchSize=chats, sessionFactory=SessionLocal)
+    start = time.perf_counter()
+    frozen = await sweeper.sweepOnce()
+    sweepSeconds = time.perf_counter() - start
+
+    after = table_bytes(engine)
+    after["file"] = file_bytes(engine)
+
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{engine.url.database}", json_serializer=toShow)
+    applySqliteProfile(async_engine.sync_engine)
+    Session = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+    hotId, coldId = chats, 1
+
+    async def read(chat_id):
+        async with Session() as db:
+            await chat_crud_async.get_chat_history(db, chat_id)
+
+    hot = await measure_async(lambda: read(hotId), repeat=repeat)
+    cold = await measure_async(lambda: read(coldId), repeat=repeat)
+
+    # 往冷会话追加：每次换一个冷会话 (追加后就变成热的了)
+    nextCold = iter(range(2, int(chats * idle) + 1))
+
+    async def append_cold():
+        async with Session() as db:
+            await chat_crud_async.append_message(db, ChatMessageCreate(chat_id=next(nextCold), role="user", content="继续"))
+
+    async def append_hot():
+        async with Session() as db:
+            await chat_crud_async.append_message(db, ChatMessageCreate(chat_id=hotId, role="user", content="继续"))
+
+    appendHot = await measure_async(append_hot, repeat=repeat)
+    appendCold = await measure_async(append_cold, repeat=min(repeat, int(chats * idle) - 5), warmup=1)
+
+    await async_engine.dispose()
+    engine.dispose()
+    return {
+        "bench": "cold_storage",
+        "codec": chat_archive.CODEC,
+        "level": chat_archive.LEVEL,
+        "chats": chats,
+        "messages_per_chat": messages,
+        "frozen_chats": frozen,
+        "sweep_s": round(sweepSeconds, 3),
+        "sweep_chats_per_s": round(frozen / sweepSeconds, 1) if sweepSeconds else None,
+        "compression_ratio": round(ARCHIVE_STATS["raw_bytes"] / ARCHIVE_STATS["stored_bytes"], 2)
+        if ARCHIVE_STATS["stored_bytes"] else None,
+        "bytes_before": before,
+        "bytes_after": after,
+        "hot_reduction": round(1 - after["hot_total"] / before["hot_total"], 3),
+        "file_reduction": round(1 - after["file"] / before["file"], 3),
+        "read_hot_ms": hot,
+        "read_cold_ms": cold,
+        "append_hot_ms": appendHot,
+        "append_cold_ms": appendCold,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="冷存储基准")
+    parser.add_argument("--chats", type=int, default=1000)
+    parser.add_argument("--messages", type=int, default=50)
+    parser.add_argument("--idle", type=float, default=0.8, help="长期不活跃的会话比例")
+    parser.add_argument("--repeat", type=int, default=30)
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args()
+    write_json(asyncio.run(run(args.chats, args.messages, args.idle, args.repeat)), args.out)
+
+
+if __name__ == "__main__":
+    main()
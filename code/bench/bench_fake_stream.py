@@ -0,0 +1,82 @@
+"""
+流式输出的基准：N 个并发流同时请求 /fakeLLM/v1/chat/completions，
+统计首字节时间 (TTFB)、每个流的帧速率和总帧速率。
+
+直接按 ASGI 协议调用进程内的应用 (见 common.asgi_stream)，不经过网络。
+假模型每个字符之间 sleep 10ms，理想情况下单流约 100 帧/秒，
+并发上去后帧速率下降或 TTFB 变长就说明事件循环被占满了。
+
+    python -m bench.bench_fake_stream [--concurrency 1,10,100] [--coalesce-ms 0] [--out result.json]
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from bench.common import asgi_stream, summarize, write_json
+
+URL = "/fakeLLM/v1/chat/completions"
+
+
+async def one_stream(app, body: bytes):
+    """跑完一个流，返回 (首字节秒数, 帧数, 字节数, 总秒数)"""
+    ttfb = None
+    frames = size = 0
+    elapsed = 0.0
+    async for elapsed, chunk in asgi_stream(app, "POST", URL, body):
+        if ttfb is None:
+            ttfb = elapsed
+        frames += chunk.count(b"data: ")
+        size += len(chunk)
+    return ttfb or 0.0, frames, size, elapsed
+
+
+async def run(levels, coalesceMs, coalesceChars):
+    from biz.MainServer import app
+
+    body = json.dumps({
+        "model": "fake-model",
+        "stream": True,
+        "stream_options": {"coalesce_ms": coalesceMs, "coalesce_chars": coalesceChars},
+    }).encode()
+    results = {
+        "bench": "fake_stream",
+        "coalesce_ms": coalesceMs,
+        "coalesce_chars": coalesceChars,
+        "cases": [],
+    }
+    for n in levels:
+        cpuStart = time.process_time()
+        start = time.perf_counter()
+        streams = await asyncio.gather(*(one_stream(app, body) for _ in range(n)))
+        wall = time.perf_counter() - start
+        cpu = time.process_time() - cpuStart
+
+        frames = sum(s[1] for s in streams)
+        results["cases"].append({
+            "streams": n,
+            "ttfb": summarize([s[0] * 1000 for s in streams]),
+            "stream_time": summarize([s[3] * 1000 for s in streams]),
+            "frames_per_stream": streams[0][1],
+            "bytes_per_stream": streams[0][2],
+            "frames_per_sec_per_stream": round(statistics.fmean(s[1] / s[3] for s in streams), 1),
+            "frames_per_sec_total": round(frames / wall, 1),
+            "cpu_ms_per_stream": round(cpu * 1000 / n, 3),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="假模型流式输出并发基准")
+    parser.add_argument("--concurrency", default="1,10,100")
+    parser.add_argument("--coalesce-ms", type=int, default=0)
+    parser.add_argument("--coalesce-chars", type=int, default=0)
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args()
+    levels = [int(x) for x in args.concurrency.split(",")]
+    write_json(asyncio.run(run(levels, args.coalesce_ms, args.coalesce_chars)), args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+登录吞吐的基准：并发 POST /users/login，bcrypt 在 PasswordTool 的进程池里执行。
+统计每秒登录数和单次登录延迟，以及同时在跑的进程池队列深度。
+
+    python -m bench.bench_login [--concurrency 1,4,16] [--logins 64] [--out result.json]
+"""
+import argparse
+import asyncio
+import time
+
+from biz.chat.db_models import User
+from tool.PasswordTool import PasswordTool, buildContext
+from bench.common import make_sqlite, make_app_client, summarize, write_json
+
+USERS = 16
+PASSWORD = "bench-password"
+
+
+def seed(engine) -> None:
+    """USERS 个用户共用一个哈希 (只算一次，和配置的代价因子一致)"""
+    hashed = buildContext(PasswordTool.rounds()).hash(PASSWORD)
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert(), [
+            {"user_name": f"bench{i}", "password": hashed, "status": 0} for i in range(USERS)
+        ])
+
+
+async def run(levels, logins):
+    engine, _ = make_sqlite("login.db")
+    seed(engine)
+    client, async_engine = make_app_client(engine)
+    PasswordTool.start()
+    results = {
+        "bench": "login",
+        "bcrypt_rounds": PasswordTool.rounds(),
+        "hash_workers": PasswordTool.workers(),
+        "cases": [],
+    }
+    try:
+        # 预热：子进程第一次执行要导入 passlib
+        await client.post("/api/v1/chat/users/login", json={"user_name": "bench0", "password": PASSWORD})
+
+        for n in levels:
+            sem = asyncio.Semaphore(n)
+            samples = []
+            failed = 0
+
+            async def login(i):
+                nonlocal failed
+                async with sem:
+                    start = time.perf_counter()
+                    resp = await client.post("/api/v1/chat/users/login", json={
+                        "user_name": f"bench{i % USERS}", "password": PASSWORD
+                    })
+                    samples.append((time.perf_counter() - start) * 1000)
+                    if resp.status_code != 200:
+                        failed += 1
+
+            start = time.perf_counter()
+            await asyncio.gather(*(login(i) for i in range(logins)))
+            wall = time.perf_counter() - start
+            results["cases"].append({
+                "concurrency": n,
+                "logins": logins,
+                "failed": failed,
+                "logins_per_sec": round(logins / wall, 2),
+                "latency": summarize(samples),
+            })
+    finally:
+        PasswordTool.shutdown()
+        await client.aclose()
+        await async_engine.dispose()
+        engine.dispose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="bcrypt 登录吞吐基准")
+    parser.add_argument("--concurrency", default="1,4,16")
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args()
+    levels = [int(x) for x in args.concurrency.split(",")]
+    write_json(asyncio.run(run(levels, args.logins)), args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+消息合并提交的基准：C 个并发写入方同时追加消息 (分散在多个会话)，
+对比逐条提交 (append_message) 和 MessageBatcher 合并提交的吞吐和单条延迟。
+
+    python -m bench.bench_message_batch [--messages 2000] [--concurrency 1,16,64] [--out result.json]
+"""
+import argparse
+import asyncio
+import time
+
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from biz.chat.db_models import Chat
+from biz.chat.chat_schemas import ChatMessageCreate
+from biz.chat import chat_crud_async
+from biz.chat.chat_batcher import MessageBatcher
+from tool.db_session import toShow, applySqliteProfile
+from bench.common import make_sqlite, summarize, write_json
+
+CHATS = 20
+
+
+async def run_mode(mode, messages, concurrency, windowMs):
+    engine, _ = make_sqlite(f"batch_{mode}_{concurrency}.db")
+    with engine.begin() as conn:
+        conn.execute(Chat.__table__.insert(), [
+            {"title": f"chat {i}", "creator_id": 1, "messages_num": 0,
+             "is_pinned": 0, "is_deleted": 0, "is_archived": 0, "last_message": ""}
+            for i in range(CHATS)
+        ])
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{engine.url.database}", json_serializer=toShow)
+    applySqliteProfile(async_engine.sync_engine)
+    Session = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+    batcher = MessageBatcher(windowMs=windowMs, enabled=True, sessionFactory=Session)
+
+    samples = []
+    counter = iter(range(messages))
+
+    async def writer():
+        async with Session() as db:
+            for i in counter:
+                msg = ChatMessageCreate(chat_id=i % CHATS + 1, role="user", content=f"消息 {i}")
+                start = time.perf_counter()
+                if mode == "batched":
+                    await batcher.submit(msg)
+                else:
+                    await chat_crud_async.append_message(db, msg)
+                samples.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(writer() for _ in range(concurrency)))
+    wall = time.perf_counter() - start
+    await batcher.close()
+    await async_engine.dispose()
+    engine.dispose()
+    return {
+        "mode": mode,
+        "concurrency": concurrency,
+        "messages_per_sec": round(messages / wall, 1),
+        "latency": summarize(samples),
+        "batches": batcher.batches if mode == "batched" else messages,
+    }
+
+
+async def run(messages, levels, windowMs):
+    results = {"bench": "message_batch", "messages": messages, "chats": CHATS, "window_ms": windowMs, "cases": []}
+    for c in levels:
+        for mode in ("single", "batched"):
+            results["cases"].append(await run_mode(mode, messages, c, windowMs))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="消息合并提交基准")
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--concurrency", default="1,16,64")
+    parser.add_argument("--window-ms", type=int, default=5)
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args()
+    levels = [int(x) for x in args.concurrency.split(",")]
+    write_json(asyncio.run(run(args.messages, levels, args.window_ms)), args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+已删除会话清理的基准：一半会话已删除并过了宽限期 (其中一部分在冷存储里)，
+清理期间另一半会话持续有消息追加，对比
+- 清理速度  会话 / 消息每秒，单个事务最长耗时 (持锁时间的上限)
+- 对写入的影响  清理前 / 清理期间追加消息的延迟
+- 正确性  清理后已删除会话的消息、冷存储、FTS5 行全部消失，未删除会话的消息数不变
+
+    python -m bench.bench_purge [--chats 400] [--messages 100] [--pause-ms 20] [--out result.json]
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from sqlalchemy import bindparam, func, select, text, update
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from biz.chat.db_models import User, Chat, ChatMessage, ChatArchive
+from biz.chat import chat_crud_async, chat_search
+from biz.chat.chat_archive import freeze_chat
+from biz.chat.chat_purge import ChatPurger
+from biz.chat.chat_schemas import ChatMessageCreate
+from tool.db_session import toShow, applySqliteProfile
+from bench.common import make_sqlite, summarize, write_json
+
+USER_ID = 1
+
+
+def seed(engine, SessionLocal, chats: int, messages: int):
+    """偶数号会话标记为一年前删除，其中每 4 个冷冻一个"""
+    rnd = random.Random(7)
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert(), {"uid": USER_ID, "user_name": "bench", "password": "x"})
+        conn.execute(Chat.__table__.insert(), [
+            {"title": f"会话 {i}", "creator_id": USER_ID, "messages_num": messages, "is_pinned": 0,
+             "is_deleted": 0, "is_archived": 0, "last_message": ""}
+            for i in range(chats)
+        ])
+        rows = [
+            {"chat_id": i % chats + 1, "role": "user", "create_time": str(1735689600 + i),
+             "content": " ".join(rnd.choice("数据 索引 查询 部署 模型 the cache lock query".split()) for _ in range(30))}
+            for i in range(chats * messages)
+        ]
+        for i in range(0, len(rows), 5000):
+            conn.execute(ChatMessage.__table__.insert(), rows[i:i + 5000])
+    chat_search.ensure_search_index(engine)
+    with SessionLocal() as db:
+        for chat_id in range(2, chats + 1, 8):
+            freeze_chat(db, chat_id)
+    with engine.begin() as conn:
+        conn.execute(
+            update(Chat).where(Chat.chat_id == bindparam("b_id"))
+            .values(is_deleted=1, update_time=text("'2024-01-01 00:00:00'")),
+            [{"b_id": i} for i in range(2, chats + 1, 2)],
+        )
+
+
+def leftovers(engine, chats: int):
+    with engine.connect() as conn:
+        deleted = list(range(2, chats + 1, 2))
+        live = list(range(1, chats + 1, 2))
+        return {
+            "chats": conn.execute(select(func.count()).where(Chat.chat_id.in_(deleted))).scalar(),
+            "messages": conn.execute(select(func.count()).where(ChatMessage.chat_id.in_(deleted))).scalar(),
+            "archives": conn.execute(select(func.count()).where(ChatArchive.chat_id.in_(deleted))).scalar(),
+            "fts_rows": conn.exec_driver_sql(
+                f"SELECT count(*) FROM chat_message_fts WHERE chat_id IN ({','.join(map(str, deleted))})"
+            ).scalar(),
+            "live_messages": conn.execute(select(func.count()).where(ChatMessage.chat_id.in_(live))).scalar(),
+        }
+
+
+async def run(chats: int, messages: int, pauseMs: int, messageBatch: int):
+    engine, SessionLocal = make_sqlite("purge.db")
+    seed(engine, SessionLocal, chats, messages)
+    before = leftovers(engine, chats)
+
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{engine.url.database}", json_serializer=toShow)
+    applySqliteProfile(async_engine.sync_engine)
+    Session = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+    appended = 0
+
+    async def writer(samples, stop):
+        nonlocal appended
+        rnd = random.Random(1)
+        while not stop.is_set():
+            start = time.perf_counter()
+            async with Session() as db:
+                await chat_crud_async.append_message(db, ChatMessageCreate(
+                    chat_id=rnd.randrange(1, chats + 1, 2), role="user", content="清理期间的新消息"))
+            samples.append((time.perf_counter() - start) * 1000)
+            appended += 1
+            await asyncio.sleep(0.005)
+
+    # 清理前的写入延迟
+    idle, stop = [], asyncio.Event()
+    task = asyncio.create_task(writer(idle, stop))
+    await asyncio.sleep(2)
+    stop.set()
+    await task
+
+    purger = ChatPurger(graceDays=30, chatBatch=50, messageBatch=messageBatch, pauseMs=pauseMs,
+                        sessionFactory=SessionLocal)
+    busy, stop = [], asyncio.Event()
+    task = asyncio.create_task(writer(busy, stop))
+    start = time.perf_counter()
+    purged = await purger.purgeOnce()
+    seconds = time.perf_counter() - start
+    stop.set()
+    await task
+
+    after = leftovers(engine, chats)
+    await async_engine.dispose()
+    engine.dispose()
+    return {
+        "bench": "purge",
+        "chats": chats,
+        "messages_per_chat": messages,
+        "pause_ms": pauseMs,
+        "message_batch": messageBatch,
+        "purged_chats": purged,
+        "purge_s": round(seconds, 3),
+        "chats_per_s": round(purged / seconds, 1),
+        "messages_per_s": round(purger.messages / seconds, 1),
+        "stats": purger.getStats(),
+        "append_idle_ms": summarize(idle),
+        "append_during_purge_ms": summarize(busy),
+        "before": before,
+        "after": after,
+        "ok": after["chats"] == after["messages"] == after["archives"] == after["fts_rows"] == 0
+        and after["live_messages"] == before["live_messages"] + appended,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="已删除会话清理基准")
+    parser.add_argument("--chats", type=int, default=400)
+    parser.add_argument("--messages", type=int, default=100)
+    parser.add_argument("--pause-ms", type=int, default=20)
+    parser.add_argument("--message-batch", type=int, default=1000)
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args()
+    write_json(asyncio.run(run(args.chats, args.messages, args.pause_ms, args.message_batch)), args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+全文搜索的基准：消息数 1k ~ 100k (查询词出现在约 1% 的消息里)，对比
+- like    LIKE '%词%' 全表扫描 (没有索引时的做法，作为基线，不排序相关度)
+- fts     SQLite FTS5 (ngram 分词)
+- memory  进程内倒排索引 (首次搜索的建索引耗时单独统计)
+另外给出建索引 (存量补齐) 的耗时。
+
+    python -m bench.bench_search [--messages 1000,10000,100000] [--repeat 20] [--out result.json]
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from sqlalchemy import select, and_
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from biz.chat.db_models import User, Chat, ChatMessage
+from biz.chat import chat_search
+from tool.db_session import toShow, applySqliteProfile
+from bench.common import make_sqlite, measure_async, write_json
+
+USER_ID = 1
+CHATS = 100
+# 查询词在语料里的出现比例大约 1% (更接近真实数据：大部分消息不包含某个具体的词)
+QUERIES = ["机器学习", "数据库 索引", "python", "部署"]
+HIT_RATE = 0.01
+COMMON = "的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而方后多定行学法所民得经十三之进着等部度家电力里如水化高自二理起小物现实加量都两体制机当使点从业本去把性好应开它合还因由其些然前外天政四日那社义事平形相全表间样与关各重新线内数正心反你明看原又么利比或但质气第向道命此变条只没结解问意建月公无系军很情者最立代想已通并提直题党程展五果料象员革位入常文总次品式活设及管特件长求老头基资边流路级少图山统接知较将组见计别她手角期根论运农指几九区强放决西被干做必战先回则任取据处理府研质信"
+
+
+def make_words(rnd, n):
+    """随机拼出 n 个 2~4 字的中文词，模拟一个比较大的词表"""
+    return ["".join(rnd.choice(COMMON) for _ in range(rnd.randint(2, 4))) for _ in range(n)]
+
+
+def seed(engine, messages: int):
+    """Core 批量写入 (不触发 ORM 事件)，之后由 ensure_search_index 补齐索引"""
+    rnd = random.Random(42)
+    words = make_words(rnd, 5000)
+    queryWords = [w for q in QUERIES for w in q.split()]
+
+    def content():
+        parts = [rnd.choice(words) for _ in range(20)]
+        for w in queryWords:
+            if rnd.random() < HIT_RATE:
+                parts[rnd.randrange(len(parts))] = w
+        return "，".join(parts)
+
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert(), {"uid": USER_ID, "user_name": "bench", "password": "x"})
+        conn.execute(Chat.__table__.insert(), [
+            {"title": f"会话 {i}", "creator_id": USER_ID, "messages_num": 0,
+             "is_pinned": 0, "is_deleted": 0, "is_archived": 0, "last_message": ""}
+            for i in range(CHATS)
+        ])
+        rows = [
+            {
+                "chat_id": i % CHATS + 1,
+                "role": "user" if i % 2 == 0 else "assistant",
+                "content": content(),
+                "create_time": str(1735689600 + i),
+            }
+            for i in range(messages)
+        ]
+        for i in range(0, len(rows), 5000):
+            conn.execute(ChatMessage.__table__.insert(), rows[i:i + 5000])
+
+
+async def run_case(messages: int, repeat: int):
+    engine, _ = make_sqlite(f"search_{messages}.db")
+    # make_sqlite 建表时已经建好 FTS5 虚表，这里只计补齐耗时
+    seed(engine, messages)
+    start = time.perf_counter()
+    chat_search.ensure_search_index(engine)
+    indexSeconds = time.perf_counter() - start
+
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{engine.url.database}", json_serializer=toShow)
+    applySqliteProfile(async_engine.sync_engine)
+    Session = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+    case = {"messages": messages, "fts_backfill_s": round(indexSeconds, 3)}
+
+    async def like():
+        async with Session() as db:
+            for q in QUERIES:
+                await db.execute(
+                    select(ChatMessage.msg_id)
+                    .join(Chat, Chat.chat_id == ChatMessage.chat_id)
+                    .where(and_(Chat.creator_id == USER_ID, Chat.is_deleted == 0,
+                                ChatMessage.content.like(f"%{q.split()[0]}%")))
+                    .order_by(ChatMessage.msg_id.desc())
+                    .limit(20)
+                )
+
+    async def search():
+        async with Session() as db:
+            for q in QUERIES:
+                await chat_search.search(db, USER_ID, q, 0, 20)
+
+    case["like_ms"] = await measure_async(like, repeat=repeat)
+    chat_search._backends.clear()
+    case["fts_ms"] = await measure_async(search, repeat=repeat)
+
+    chat_search.BACKEND = "memory"
+    chat_search._backends.clear()
+    try:
+        start = time.perf_counter()
+        await search()
+        case["memory_build_s"] = round(time.perf_counter() - start, 3)
+        case["memory_ms"] = await measure_async(search, repeat=repeat)
+    finally:
+        chat_search.BACKEND = "auto"
+        chat_search._backends.clear()
+        chat_search._memoryIndexes.clear()
+
+    await async_engine.dispose()
+    engine.dispose()
+    return case
+
+
+async def run(sizes, repeat):
+    results = {"bench": "search", "queries_per_call": len(QUERIES), "cases": []}
+    for n in sizes:
+        results["cases"].append(await run_case(n, repeat))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="全文搜索基准")
+    parser.add_argument("--messages", default="1000,10000,100000")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args()
+    write_json(asyncio.run(run([int(x) for x in args.messages.split(",")], args.repeat)), args.out)
+
+
+if __name__ == "__main__":
+    main()
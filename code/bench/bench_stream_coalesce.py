@@ -0,0 +1,79 @@
+"""
+SSE 合并输出的基准：对比逐字符一帧 (当前行为) 和按时间窗口 / 字符数合并后的
+帧数、传输字节数和编码吞吐。
+
+    python -m bench.bench_stream_coalesce [--sleep 0.002] [--out result.json]
+"""
+import argparse
+import asyncio
+import time
+
+from tool.LLMTool import LLMTool
+from biz.llm.FakeLLMApi import text_poem
+from bench.common import write_json
+
+# (名称, flushMs, maxChars)
+POLICIES = [
+    ("per_char", 0, 0),
+    ("window_20ms", 20, 0),
+    ("chars_64", 0, 64),
+    ("window_20ms_chars_64", 20, 64),
+]
+
+
+async def drain(flushMs: int, maxChars: int, sleepTime: float):
+    """跑完一次完整输出，返回 (帧数, 字节数, 耗时秒, CPU 秒)"""
+    frames = 0
+    size = 0
+    start = time.perf_counter()
+    cpuStart = time.process_time()
+    if flushMs > 0 or maxChars > 0:
+        gen = LLMTool.putCoalesced(text_poem, sleepTime=sleepTime, flushMs=flushMs, maxChars=maxChars)
+    else:
+        gen = LLMTool.putChar(text_poem, sleepTime=sleepTime)
+    async for frame in gen:
+        frames += 1
+        size += len(frame)
+    return frames, size, time.perf_counter() - start, time.process_time() - cpuStart
+
+
+async def run(sleepTime: float, rounds: int):
+    results = {
+        "bench": "stream_coalesce",
+        "text_chars": len(text_poem),
+        "text_bytes": len(text_poem.encode("utf-8")),
+        "sleep_per_char": sleepTime,
+        "cases": [],
+    }
+    for name, flushMs, maxChars in POLICIES:
+        # 按模拟的生成速度输出 rounds 次，统计帧数、字节数和服务端 CPU
+        frames = size = 0
+        elapsed = cpu = 0.0
+        for _ in range(rounds):
+            f, b, e, c = await drain(flushMs, maxChars, sleepTime)
+            frames, size = f, b
+            elapsed += e
+            cpu += c
+        results["cases"].append({
+            "policy": name,
+            "frames": frames,
+            "bytes_on_wire": size,
+            "overhead_ratio": round(size / results["text_bytes"], 2),
+            "stream_seconds": round(elapsed / rounds, 3),
+            "frames_per_sec": round(frames * rounds / elapsed, 1),
+            "cpu_ms_per_stream": round(cpu * 1000 / rounds, 3),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SSE 合并输出基准")
+    parser.add_argument("--sleep", type=float, default=0.002, help="模拟每个字符的生成间隔 (秒)")
+    parser.add_argument("--rounds", type=int, default=3, help="每种策略重复的次数")
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args()
+    write_json(asyncio.run(run(args.sleep, args.rounds)), args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+流式 chunk 编码的基准：对比 LLMTool.getChunk (每个增量构造 dict + json.dumps)
+和 StreamEncoder (预渲染前后缀，只转义增量) 的单帧耗时和帧大小。
+
+    python -m bench.bench_stream_encoder [--out result.json]
+"""
+import argparse
+import time
+
+import tool.LLMTool as llmTool
+from tool.LLMTool import LLMTool, StreamEncoder
+from biz.llm.FakeLLMApi import text_poem
+from bench.common import write_json
+
+
+def perFrame(fn, deltas, rounds: int):
+    """返回 (每帧微秒, 每帧平均字节数)"""
+    size = sum(len(fn(d)) for d in deltas)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for d in deltas:
+            fn(d)
+    elapsed = time.perf_counter() - start
+    return round(elapsed * 1e6 / (rounds * len(deltas)), 3), round(size / len(deltas), 1)
+
+
+def run(rounds: int):
+    deltas = list(text_poem)
+    results = {"bench": "stream_encoder", "frames": len(deltas), "orjson": llmTool.orjson is not None, "cases": []}
+
+    def legacy(d):
+        return f"data: {LLMTool.getChunk(d)}\n\n".encode("utf-8")
+
+    encoder = StreamEncoder()
+    for name, fn in [("getChunk", legacy), ("StreamEncoder", encoder.encode)]:
+        us, avg = perFrame(fn, deltas, rounds)
+        results["cases"].append({"encoder": name, "us_per_frame": us, "bytes_per_frame": avg})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="流式 chunk 编码基准")
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args()
+    write_json(run(args.rounds), args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+基准测试的公共工具：临时数据库、进程内应用客户端、计时、结果输出
+"""
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+
+from tool.db_session import Base, toShow, get_async_db, applySqliteProfile
+import biz.chat.db_models  # 确保模型被 Base 注册
+
+
+def make_sqlite(name: str = "bench.db"):
+    """
+    在临时目录创建一个全新的 SQLite 数据库并建表 (使用和线上相同的 SQLite 性能配置)
+    返回: (engine, SessionLocal)
+    """
+    path = os.path.join(tempfile.mkdtemp(prefix="mta-bench-"), name)
+    engine = create_engine(
+        f"sqlite:///{path}",
+        json_serializer=toShow,
+        connect_args={"check_same_thread": False},
+    )
+    applySqliteProfile(engine)
+    Base.metadata.create_all(bind=engine)
+    return engine, sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def make_app_client(engine):
+    """
+    让进程内的 FastAPI 应用使用 engine 对应的 SQLite 文件 (异步驱动)，
+    返回 (httpx.AsyncClient, async_engine)。请求走 ASGI transport，不经过网络。
+    不会触发 lifespan，所以不会去连配置里的 MySQL。
+    """
+    import httpx
+    from biz.MainServer import app
+
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{engine.url.database}", json_serializer=toShow)
+    applySqliteProfile(async_engine.sync_engine)
+    AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+
+    async def override_db():
+        async with AsyncSessionLocal() as db:
+            yield db
+
+    app.dependency_overrides[get_async_db] = override_db
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+    return client, async_engine
+
+
+async def asgi_stream(app, method: str, path: str, body: bytes = b"", headers: Optional[Dict[str, str]] = None):
+    """
+    直接按 ASGI 协议调用应用，逐块产出 (距请求开始的秒数, 响应体字节)。
+    httpx 的 ASGITransport 会把整个响应收完才返回，测不出首字节时间，所以流式接口用这个。
+    """
+    import asyncio
+
+    raw_headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    raw_headers += [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()]
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": method, "scheme": "http", "path": path, "raw_path": path.encode(),
+        "query_string": b"", "root_path": "", "headers": raw_headers,
+        "client": ("127.0.0.1", 0), "server": ("bench", 80),
+    }
+    queue: "asyncio.Queue" = asyncio.Queue()
+    sent = False
+    start = time.perf_counter()
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await asyncio.Event().wait()  # 客户端不会断开
+
+    async def send(message):
+        if message["type"] == "http.response.start" and message["status"] >= 400:
+            raise RuntimeError(f"{path} 返回 {message['status']}")
+        if message["type"] == "http.response.body":
+            if message.get("body"):
+                queue.put_nowait((time.perf_counter() - start, message["body"]))
+            if not message.get("more_body", False):
+                queue.put_nowait(None)
+
+    task = asyncio.create_task(app(scope, receive, send))
+    try:
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            yield item
+        await task
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+def auth_headers(uid: int) -> Dict[str, str]:
+    """直接签发 token，跳过 bcrypt 登录 (登录本身由 bench_login 单独测)"""
+    from biz.chat.chat_auth import issue_token
+    return {"Authorization": f"Bearer {issue_token(uid)[0]}"}
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """耗时样本 (毫秒) 的统计"""
+    samples = sorted(samples)
+    return {
+        "p50_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(samples[max(int(len(samples) * 0.95) - 1, 0)], 3),
+        "mean_ms": round(statistics.fmean(samples), 3),
+    }
+
+
+def measure(fn: Callable[[], object], repeat: int = 50, warmup: int = 3) -> Dict[str, float]:
+    """多次执行 fn，返回耗时统计 (毫秒)"""
+    for _ in range(warmup):
+        fn()
+    samples: List[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return summarize(samples)
+
+
+async def measure_async(fn: Callable[[], Awaitable[object]], repeat: int = 50, warmup: int = 3) -> Dict[str, float]:
+    """measure 的异步版本"""
+    for _ in range(warmup):
+        await fn()
+    samples: List[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return summarize(samples)
+
+
+def environment() -> Dict[str, str]:
+    """运行环境，写进结果里，diff 时能看出是不是同一台机器 / 同一个版本"""
+    try:
+        rev = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, timeout=5,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except Exception:
+        rev = ""
+    return {
+        "git_rev": rev,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": str(os.cpu_count()),
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+
+def write_json(results: Dict, out: Optional[str]) -> None:
+    """打印结果；指定 out 时同时写入 JSON 文件，方便跨版本 diff"""
+    text = json.dumps(results, ensure_ascii=False, indent=2)
+    print(text)
+    if out:
+        with open(out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
@@ -0,0 +1,48 @@
+"""
+一次跑完全部基准，结果合并成一个 JSON (带 git 版本和机器信息)，方便跨版本 diff：
+
+    python -m bench.run_all --out bench-$(git rev-parse --short HEAD).json
+    python -m bench.run_all --quick      # 缩小规模，几十秒内跑完，用来检查脚本本身
+
+全部离线运行：临时 SQLite + 进程内应用，不需要 MySQL 和网络。
+"""
+import argparse
+import asyncio
+
+from bench import (
+    bench_add_message, bench_chat_read, bench_chat_list,
+    bench_fake_stream, bench_login, bench_stream_coalesce, bench_stream_encoder,
+)
+from bench.common import environment, write_json
+
+
+async def run(quick: bool):
+    results = {"environment": environment(), "quick": quick}
+    if quick:
+        results["add_message"] = await bench_add_message.run([10, 1000], repeat=5, warmup=1)
+        results["chat_read"] = await bench_chat_read.run([10, 100], [10, 1000], repeat=5)
+        results["chat_list"] = bench_chat_list.run([100, 10000])
+        results["fake_stream"] = await bench_fake_stream.run([1, 10], 0, 0)
+        results["login"] = await bench_login.run([1, 4], logins=8)
+    else:
+        results["add_message"] = await bench_add_message.run([10, 100, 1000, 10000], repeat=30, warmup=3)
+        results["chat_read"] = await bench_chat_read.run([10, 100, 1000], [10, 100, 1000, 10000], repeat=20)
+        results["chat_list"] = bench_chat_list.run([100, 1000, 10000, 100000])
+        results["fake_stream"] = await bench_fake_stream.run([1, 10, 100], 0, 0)
+        results["fake_stream_coalesced"] = await bench_fake_stream.run([1, 10, 100], 20, 64)
+        results["login"] = await bench_login.run([1, 4, 16], logins=64)
+    results["stream_coalesce"] = await bench_stream_coalesce.run(0.002, 1 if quick else 3)
+    results["stream_encoder"] = bench_stream_encoder.run(2000 if quick else 20000)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="运行全部基准")
+    parser.add_argument("--quick", action="store_true", help="缩小规模，只检查脚本能否跑通")
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args()
+    write_json(asyncio.run(run(args.quick)), args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""
+并发追加的压力测试 (正确性检查，不是性能基准)：
+同一个会话上 N 个写入方同时追加消息，中间穿插修改会话 (改名 / 置顶)，
+检查乐观锁 (Chat.version + 重试) 下没有任何一次写入丢失：
+
+- chat_message 里正好 N 条，且每条内容都在
+- messages_num == N
+- version == 1 (创建) + N (追加) + 修改次数
+
+写入走 chat_crud_async (每个协程一个 AsyncSession)，和 API 用的是同一份实现。
+
+清理竞争 (purge_*)：一半会话已删除并过了宽限期，后台清理 (ChatPurger.purgeOnce) 运行的同时，
+写入方往所有会话追加消息 (偶尔也追加到已删除的)，另有一个协程尝试恢复部分已删除会话。
+async (直接追加) / batch (MessageBatcher 合并提交) 两种写入方式各测一遍，检查：
+
+- 未删除和恢复成功的会话都还在，且消息数 == 原有 + 追加成功的条数
+- 没有被清理掉的会话 (包括追加后刷新了删除时间的) 同样满足上面的条数
+- 被清理掉的只有已删除且没有恢复的会话，不会留下删了一半的会话
+
+每个用例最后对全库做一致性断言：每个会话的消息行数 == messages_num，
+token_offset 是前面消息 token_count 的前缀和 (从 0 开始连续)，tokens_num == token_count 之和，
+没有指向不存在会话的消息。任何一项不满足进程以 1 退出。
+
+    python -m bench.stress_chat_append [--writers 50] [--updates 10] [--rounds 3]
+                                       [--purge-chats 20] [--history 30] [--appends 5] [--out result.json]
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import select, update, func
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from biz.chat.db_models import Chat, ChatMessage
+from biz.chat.chat_schemas import ChatMessageCreate, ChatUpdate
+from biz.chat import chat_crud_async
+from biz.chat.chat_crud import CAS_STATS
+from biz.chat.chat_batcher import MessageBatcher
+from biz.chat.chat_purge import ChatPurger
+from tool.db_session import toShow, applySqliteProfile
+from bench.common import make_sqlite, write_json
+
+
+def _new_chat(SessionLocal) -> int:
+    with SessionLocal() as db:
+        chat = Chat(title="stress", creator_id=1, messages_num=0, is_pinned=0, is_deleted=0, is_archived=0)
+        db.add(chat)
+        db.commit()
+        return chat.chat_id
+
+
+def _assert_invariants(SessionLocal) -> None:
+    """全库一致性断言 (不满足时抛 AssertionError)，本脚本的会话都不在冷存储里"""
+    with SessionLocal() as db:
+        chats = {c.chat_id: c for c in db.execute(select(Chat)).scalars()}
+        messages = defaultdict(list)
+        for chat_id, count, offset in db.execute(
+            select(ChatMessage.chat_id, ChatMessage.token_count, ChatMessage.token_offset).order_by(ChatMessage.msg_id)
+        ):
+            messages[chat_id].append((count, offset))
+
+    orphans = sorted(set(messages) - set(chats))
+    assert not orphans, f"会话 {orphans[:10]} 已经不存在，消息还在"
+    for chat_id, chat in chats.items():
+        rows = messages.get(chat_id, [])
+        assert len(rows) == chat.messages_num, f"会话 {chat_id}: {len(rows)} 条消息，messages_num = {chat.messages_num}"
+        total = 0
+        for i, (count, offset) in enumerate(rows):
+            assert offset == total, f"会话 {chat_id} 第 {i} 条消息: token_offset = {offset}，前面的 token 数之和 = {total}"
+            total += count
+        assert total == (chat.tokens_num or 0), f"会话 {chat_id}: token_count 之和 {total}，tokens_num = {chat.tokens_num}"
+
+
+def _violation(check, *args) -> Optional[str]:
+    """执行断言，返回第一个不满足的条件 (全部满足返回 None)"""
+    try:
+        check(*args)
+    except AssertionError as e:
+        return str(e)
+    return None
+
+
+def _check(SessionLocal, chat_id: int, writers: int, updates: int) -> dict:
+    with SessionLocal() as db:
+        chat = db.get(Chat, chat_id)
+        contents = {c for (c,) in db.execute(select(ChatMessage.content).where(ChatMessage.chat_id == chat_id))}
+        rows = db.execute(select(func.count()).select_from(ChatMessage).where(ChatMessage.chat_id == chat_id)).scalar()
+    expected = {f"消息 {i}" for i in range(writers)}
+    violation = _violation(_assert_invariants, SessionLocal)
+    return {
+        "rows": rows,
+        "messages_num": chat.messages_num,
+        "version": chat.version,
+        "missing": len(expected - contents),
+        "violation": violation,
+        "ok": rows == writers and chat.messages_num == writers and violation is None
+              and not (expected - contents) and chat.version == 1 + writers + updates,
+    }
+
+
+async def run_async(engine, SessionLocal, writers: int, updates: int) -> dict:
+    chat_id = _new_chat(SessionLocal)
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{engine.url.database}", json_serializer=toShow)
+    applySqliteProfile(async_engine.sync_engine)
+    Session = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+    errors = []
+
+    async def append(i):
+        async with Session() as db:
+            try:
+                await chat_crud_async.append_message(db, ChatMessageCreate(chat_id=chat_id, role="user", content=f"消息 {i}"))
+            except Exception as e:
+                errors.append(repr(e))
+
+    async def modify(i):
+        async with Session() as db:
+            try:
+                await chat_crud_async.update_chat_status(db, chat_id, ChatUpdate(title=f"改名 {i}", is_pinned=i % 2))
+            except Exception as e:
+                errors.append(repr(e))
+
+    start = time.perf_counter()
+    await asyncio.gather(*[append(i) for i in range(writers)], *[modify(i) for i in range(updates)])
+    wall = time.perf_counter() - start
+    await async_engine.dispose()
+    return {"wall_s": round(wall, 3), "errors": errors[:5], **_check(SessionLocal, chat_id, writers, updates)}
+
+
+async def _seed_purge(SessionLocal, Session, chats: int, history: int) -> Tuple[List[int], List[int]]:
+    """建 chats 个各有 history 条消息的会话，后一半标记为一年多以前删除；返回 (未删除, 已删除)"""
+    chat_ids = [_new_chat(SessionLocal) for _ in range(chats)]
+    async with Session() as db:
+        for chat_id in chat_ids:
+            for i in range(history):
+                await chat_crud_async.append_message(
+                    db, ChatMessageCreate(chat_id=chat_id, role="user", content=f"历史 {i} " * (i % 7 + 1)))
+    live, dead = chat_ids[:chats // 2], chat_ids[chats // 2:]
+    with SessionLocal() as db:
+        db.execute(update(Chat).where(Chat.chat_id.in_(dead)).values(is_deleted=1, update_time=datetime(2020, 1, 1)))
+        db.commit()
+    return live, dead
+
+
+async def run_purge_race(engine, SessionLocal, mode: str, chats: int, history: int, writers: int, appends: int) -> dict:
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{engine.url.database}", json_serializer=toShow)
+    applySqliteProfile(async_engine.sync_engine)
+    Session = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+    live, dead = await _seed_purge(SessionLocal, Session, chats, history)
+    batcher = MessageBatcher(windowMs=2, enabled=True, sessionFactory=Session) if mode == "batch" else None
+    acked, restored, errors = Counter(), set(), []
+
+    async def append(msg_in):
+        if mode == "async":
+            async with Session() as db:
+                await chat_crud_async.append_message(db, msg_in)
+        else:
+            await batcher.submit(msg_in)
+
+    # 已删除的会话三等分：一份清理期间尝试恢复，一份偶尔有追加，一份不碰
+    to_restore, to_append = dead[::3], dead[1::3]
+
+    async def writer(w):
+        rnd = random.Random(w)
+        for i in range(appends):
+            # 偶尔追加到已删除的会话：认领前成功 (刷新删除时间，这一轮不再清理)，认领后报不存在
+            chat_id = rnd.choice(to_append if rnd.random() < 0.1 else live)
+            try:
+                await append(ChatMessageCreate(chat_id=chat_id, role="assistant", content=f"写入方 {w} 第 {i} 条"))
+                acked[chat_id] += 1
+            except ValueError as e:
+                if chat_id in live:
+                    errors.append(repr(e))
+            except Exception as e:
+                errors.append(repr(e))
+
+    async def restorer():
+        # 清理期间恢复一部分已删除会话：认领前恢复成功的必须完整保留，认领后的返回不存在
+        for chat_id in to_restore:
+            await asyncio.sleep(0.005)
+            async with Session() as db:
+                if await chat_crud_async.update_chat_status(db, chat_id, ChatUpdate(is_deleted=0)):
+                    restored.add(chat_id)
+
+    purger = ChatPurger(graceDays=30, chatBatch=2, messageBatch=5, pauseMs=1, sessionFactory=SessionLocal)
+    start = time.perf_counter()
+    purged, *_ = await asyncio.gather(purger.purgeOnce(), restorer(), *[writer(w) for w in range(writers)])
+    wall = time.perf_counter() - start
+    if batcher:
+        await batcher.close()
+    await async_engine.dispose()
+
+    with SessionLocal() as db:
+        existing = set(db.execute(select(Chat.chat_id)).scalars())
+        rows = dict(db.execute(select(ChatMessage.chat_id, func.count()).group_by(ChatMessage.chat_id)).all())
+
+    def check():
+        _assert_invariants(SessionLocal)
+        for chat_id in live + sorted(restored):
+            assert chat_id in existing, f"会话 {chat_id} 没有删除 (或已恢复)，却被清理了"
+        for chat_id in sorted(existing & set(live + dead)):
+            assert rows.get(chat_id, 0) == history + acked[chat_id], \
+                f"会话 {chat_id}: {rows.get(chat_id, 0)} 条消息，应为 {history} + {acked[chat_id]}"
+
+    violation = _violation(check)
+    return {
+        "wall_s": round(wall, 3),
+        "errors": errors[:5],
+        "purged": purged,
+        "restored": len(restored),
+        "appended": sum(acked.values()),
+        "violation": violation,
+        "ok": violation is None and not errors,
+    }
+
+
+def run(writers: int, updates: int, rounds: int, purgeChats: int, history: int, appends: int) -> dict:
+    engine, SessionLocal = make_sqlite("stress_append.db")
+    results = {"bench": "stress_chat_append", "writers": writers, "updates": updates, "cases": []}
+    for r in range(rounds):
+        for mode in ("async", "purge_async", "purge_batch"):
+            before = dict(CAS_STATS)
+            if mode == "async":
+                case = asyncio.run(run_async(engine, SessionLocal, writers, updates))
+            else:
+                case = asyncio.run(run_purge_race(
+                    engine, SessionLocal, mode[len("purge_"):], purgeChats, history, writers, appends))
+            case.update(mode=mode, round=r,
+                        conflicts=CAS_STATS["conflicts"] - before["conflicts"],
+                        failures=CAS_STATS["failures"] - before["failures"])
+            results["cases"].append(case)
+    engine.dispose()
+    results["ok"] = all(c["ok"] for c in results["cases"])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="并发追加压力测试 (检查有没有写入丢失)")
+    parser.add_argument("--writers", type=int, default=50, help="同时追加的写入方数量")
+    parser.add_argument("--updates", type=int, default=10, help="同时修改会话的次数")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--purge-chats", type=int, default=20, help="清理竞争用例的会话数 (一半已删除)")
+    parser.add_argument("--history", type=int, default=30, help="清理竞争用例每个会话原有的消息数")
+    parser.add_argument("--appends", type=int, default=5, help="清理竞争用例每个写入方追加的条数")
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args()
+    results = run(args.writers, args.updates, args.rounds, args.purge_chats, args.history, args.appends)
+    write_json(results, args.out)
+    sys.exit(0 if results["ok"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,29 @@
+import asyncio
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from tool.LogTool import LogTool
+from tool.PasswordTool import PasswordTool
+from tool.HttpTool import HttpTool
+from tool.MetricsTool import MetricsTool, MetricsMiddleware
 
 from biz.llm.FakeLLMApi  import router as fakeLLMRouter
+from biz.llm.ProxyLLMApi import router as proxyLLMRouter
 
 # 1. 导入数据库工具
-from tool.db_session import init_db, engine, logger as db_logger
+from tool.db_session import init_db, engine, async_engine, getPoolStats, logger as db_logger
 # 2. 导入聊天 API 路由 
 # 旧: from chat.chat_api import router as chat_router
 from biz.chat.chat_api import router as chat_router # 新: chat 在 biz 内部
 
 # 3. 关键：确保模型被 Base 注册 
 import biz.chat.db_models # 新: chat 在 biz 内部
+from biz.chat.chat_migrate import run_migrations
+from biz.chat.chat_batcher import message_batcher
+from biz.chat.chat_archive import archive_sweeper
+from biz.chat.chat_purge import chat_purger
 
 # 获取日志
 log = LogTool.getLog(__name__)
@@ -22,6 +31,7 @@ log = LogTool.getLog(__name__)
 # 定义路由收集相关模块路由
 routerList = [
     fakeLLMRouter,
+    proxyLLMRouter,
     # --- 新增 ---
     chat_router  # 把我们的聊天路由加进去
     # --- 新增结束 ---
@@ -34,22 +44,49 @@ async def lifespan(app: FastAPI):
   # --- 这是应用启动时 ---
     log.info("应用启动...")
     try:
-        log.info("开始初始化数据库...")
-        # 调用 init_db() 来创建表 (如果不存在)
-        init_db()
-        log.info("数据库初始化完成。")
+        if getattr(app.state, "db_ready", False):
+            # 生产模式下主进程 fork 之前已经建好表、跑完迁移，worker 不再重复执行
+            log.info("数据库已由主进程初始化。")
+        else:
+            log.info("开始初始化数据库...")
+            # 调用 init_db() 来创建表 (如果不存在)
+            init_db()
+            log.info("数据库初始化完成。")
+            # 旧版 JSON 历史消息迁移到 chat_message 表 (幂等)
+            run_migrations()
     except Exception as e:
         db_logger.error(f"数据库初始化失败: {e}", exc_info=True)
         # 可以在这里选择是否停止应用
         # raise e
 
+    # 密码哈希进程池 (提前拉起子进程，避免第一次登录变慢)
+    PasswordTool.start()
+    # 消息合并提交 (配置里关闭时不做任何事)
+    message_batcher.start()
+    # 后台定时任务每个部署只跑一份：预加载多 worker 时只在 0 号 worker 里启动 (开发模式单进程，直接启动)
+    runJobs = getattr(app.state, "worker_index", 0) == 0
+    if runJobs:
+        # 归档 / 长期不活跃会话的冷存储 (后台定期压缩搬走消息)
+        archive_sweeper.start()
+        # 过了宽限期的已删除会话，后台分批物理删除
+        chat_purger.start()
+
     yield
   # --- 这是应用关闭时 ---
     log.info("应用关闭...")
+    # 先把还在排队的消息写完，再关连接池
+    await message_batcher.close()
+    await archive_sweeper.close()
+    await chat_purger.close()
+    # 等在途的 bcrypt 任务做完，放到线程里等，不卡住事件循环 (其他请求的收尾还在跑)
+    await asyncio.to_thread(PasswordTool.shutdown)
+    await HttpTool.closeAll()
     try:
         if engine:
             engine.dispose()
-            db_logger.info("数据库连接池已关闭。")
+        if async_engine:
+            await async_engine.dispose()
+        db_logger.info("数据库连接池已关闭。")
     except Exception as e:
         db_logger.error(f"关闭数据库连接池失败: {e}", exc_info=True)
     log.info("应用已关闭。")
@@ -72,6 +109,42 @@ app.add_middleware(
     allow_headers=["*"],  # 允许所有HTTP头
 )
 
+# 请求指标 (耗时直方图 / 在途请求 / 响应大小 / 数据库耗时 / 流式首块时间)
+app.add_middleware(MetricsMiddleware)
+MetricsTool.instrumentEngine(engine)
+MetricsTool.instrumentEngine(async_engine.sync_engine)
+
+def _poolMetrics():
+    # 抓取时顺带输出各个池和缓存的状态
+    from biz.chat.chat_auth import user_cache, token_cache, chat_owner_cache
+    from biz.chat.chat_cache import history_cache, session_cache
+    from biz.chat.chat_crud import CAS_STATS
+    for key, value in PasswordTool.getStats().items():
+        yield "password_pool_" + key, value, {}
+    for name, stats in getPoolStats().items():
+        for key, value in stats.items():
+            yield "db_pool_" + key, value, {"engine": name}
+    for key, value in message_batcher.getStats().items():
+        yield "message_batch_" + key, value, {}
+    for key, value in LogTool.getStats().items():
+        yield "log_queue_" + key, value, {}
+    for key, value in CAS_STATS.items():
+        yield "chat_cas_" + key, value, {}
+    for key, value in archive_sweeper.getStats().items():
+        yield "chat_archive_" + key, value, {}
+    for key, value in chat_purger.getStats().items():
+        yield "chat_purge_" + key, value, {}
+    for name, cache in (("user", user_cache), ("token", token_cache), ("chat_owner", chat_owner_cache),
+                        ("history", history_cache), ("sessions", session_cache)):
+        for key, value in cache.getStats().items():
+            yield "cache_" + key, value, {"cache": name}
+
+MetricsTool.addCollector(_poolMetrics)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(MetricsTool.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 # 加载其它路由
 for curRouter in routerList:
     app.include_router(curRouter)
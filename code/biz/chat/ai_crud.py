@@ -7,6 +7,7 @@ AI Config 模块业务逻辑 (Service Layer) - V3.1 (无加密版)
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from tool.db_session import logger
+from biz.chat import ai_registry
 
 # 导入定义的 Model 和 Schema
 from biz.chat.db_models import AiProviderConfig, AiModelConfig
@@ -41,20 +42,18 @@ def create_provider(db: Session, provider_in: AiProviderCreate, user_id: int = 0
         db.commit()
         db.refresh(db_provider)
         logger.info(f"创建 AI 服务商成功: {provider_in.provider_name}")
+        ai_registry.invalidate()
         return db_provider
     except Exception as e:
         db.rollback()
         logger.error(f"创建 AI 服务商失败: {e}")
         raise e
 
-def get_providers(db: Session, user_id: int) -> List[AiProviderConfig]:
+def get_providers(db: Session, user_id: int) -> List[ai_registry.ProviderEntry]:
     """
-    获取可见的服务商列表
+    获取可见的服务商列表 (读注册表缓存，命中时不访问数据库)
     """
-    return db.query(AiProviderConfig)\
-             .filter((AiProviderConfig.user_id == 0) | (AiProviderConfig.user_id == user_id))\
-             .filter(AiProviderConfig.is_enabled == True)\
-             .all()
+    return ai_registry.get_providers(db, user_id)
 
 def get_provider_by_id(db: Session, provider_id: int) -> Optional[AiProviderConfig]:
     return db.query(AiProviderConfig).filter(AiProviderConfig.id == provider_id).first()
@@ -84,13 +83,14 @@ def create_model(db: Session, model_in: AiModelCreate) -> AiModelConfig:
         db.add(db_model)
         db.commit()
         db.refresh(db_model)
+        ai_registry.invalidate()
         return db_model
     except Exception as e:
         db.rollback()
         logger.error(f"添加模型失败: {e}")
         raise e
 
-def get_models_by_provider(db: Session, provider_id: int) -> List[AiModelConfig]:
-    return db.query(AiModelConfig)\
-             .filter(AiModelConfig.provider_id == provider_id)\
-             .all()
\ No newline at end of file
+def get_models_by_provider(db: Session, provider_id: int) -> List[ai_registry.ModelEntry]:
+    """某个服务商下的模型 (读注册表缓存，命中时不访问数据库)"""
+    return ai_registry.get_models_by_provider(db, provider_id)
+
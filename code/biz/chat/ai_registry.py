@@ -0,0 +1,175 @@
+"""
+AI 服务商 / 模型注册表 (进程内缓存)
+作用：代理接口每个请求都要把 model 解析成 (模型, 服务商)，这里把所有启用的配置
+一次性读进内存，之后解析只是一次字典查找，不再访问数据库。
+
+- 服务商列表 (get_providers) 和某个服务商下的模型 (get_models_by_provider) 也从这里读，
+  同步接口用 Session，代理接口用 AsyncSession，共用同一份缓存
+- create_provider / create_model 写库成功后调用 invalidate()，本进程下次解析时重新加载
+- 多 worker 部署时其他进程感知不到 invalidate，靠 TTL 兜底 (过期后重新加载)
+- 缓存里存的是普通的只读元组，不是 ORM 对象，可以在任意请求、任意 Session 之间共享
+
+配置 ([llm_proxy] 段):
+    registry_ttl  注册表最长缓存秒数 (默认 60)
+"""
+import asyncio
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from biz.chat.db_models import AiProviderConfig, AiModelConfig
+from tool.ConfigTool import ConfigTool
+from tool.db_session import logger
+
+REGISTRY_TTL = ConfigTool.getInt("llm_proxy", "registry_ttl", 60)
+
+
+class ProviderEntry(NamedTuple):
+    id: int
+    user_id: int
+    provider_name: str
+    base_url: str
+    api_key: str
+    is_enabled: bool
+
+
+class ModelEntry(NamedTuple):
+    id: int
+    provider_id: int
+    model_name: str
+    model_id: str
+    max_tokens: int
+    has_vision: bool
+    temperature: float
+    source: int
+    is_enabled: bool
+    create_time: Optional[datetime]
+
+
+Resolved = Tuple[ModelEntry, ProviderEntry]
+
+# (服务商所属 user_id, model_id) -> (模型, 服务商)；user_id 为 0 表示系统级
+_models: Dict[Tuple[int, str], Resolved] = {}
+# 启用的服务商 (按 id 升序)
+_providers: List[ProviderEntry] = []
+# provider_id -> 该服务商下的全部模型 (含未启用的，按 id 升序)
+_byProvider: Dict[int, List[ModelEntry]] = {}
+_loadedAt: float = 0.0   # 0 表示需要重新加载
+_version: int = 0        # 每次 invalidate 加一，防止加载途中的失效被覆盖
+_lock: Optional[asyncio.Lock] = None
+_syncLock = threading.Lock()
+
+
+def providers_stmt():
+    return select(AiProviderConfig).order_by(AiProviderConfig.id)
+
+def models_stmt():
+    return select(AiModelConfig).order_by(AiModelConfig.id)
+
+
+def _build(provider_rows, model_rows) -> None:
+    """用两张表的全部行重建缓存 (整体替换，读的一方不会看到一半的状态)"""
+    global _models, _providers, _byProvider
+    providers = {
+        p.id: ProviderEntry(p.id, p.user_id or 0, p.provider_name, p.base_url,
+                            p.api_key_encrypted or "", bool(p.is_enabled))
+        for p in provider_rows
+    }
+    models: Dict[Tuple[int, str], Resolved] = {}
+    byProvider: Dict[int, List[ModelEntry]] = {}
+    for m in model_rows:
+        model = ModelEntry(
+            m.id, m.provider_id, m.model_name, m.model_id, m.max_tokens,
+            bool(m.has_vision), m.temperature, m.source, bool(m.is_enabled), m.create_time
+        )
+        byProvider.setdefault(model.provider_id, []).append(model)
+        provider = providers.get(model.provider_id)
+        # 解析只看两者都启用的；同一用户下 model_id 重复时，保留先创建的那条
+        if model.is_enabled and provider and provider.is_enabled:
+            models.setdefault((provider.user_id, model.model_id), (model, provider))
+    _models = models
+    _providers = [p for p in providers.values() if p.is_enabled]
+    _byProvider = byProvider
+
+
+# ==========================================
+# Area 1: 加载 / 失效
+# ==========================================
+def invalidate() -> None:
+    """配置变化后调用，下次解析时重新加载"""
+    global _loadedAt, _version
+    _version += 1
+    _loadedAt = 0.0
+
+def _fresh() -> bool:
+    return _loadedAt > 0 and time.monotonic() - _loadedAt < REGISTRY_TTL
+
+def _loaded(version: int) -> None:
+    global _loadedAt
+    # 加载途中又被 invalidate 过，这次结果先用着，但保持过期状态
+    if version == _version:
+        _loadedAt = time.monotonic()
+    logger.info(f"AI 模型注册表已加载: {len(_providers)} 个服务商，{len(_models)} 个可用模型")
+
+async def _ensure_loaded(db: AsyncSession) -> None:
+    global _lock
+    if _fresh():
+        return
+    if _lock is None:
+        _lock = asyncio.Lock()
+    async with _lock:
+        # 排队期间别的请求可能已经加载完了
+        if _fresh():
+            return
+        version = _version
+        providers = (await db.execute(providers_stmt())).scalars().all()
+        models = (await db.execute(models_stmt())).scalars().all()
+        _build(providers, models)
+        _loaded(version)
+
+def _ensure_loaded_sync(db: Session) -> None:
+    """同步接口 (线程池里执行) 用的加载"""
+    if _fresh():
+        return
+    with _syncLock:
+        if _fresh():
+            return
+        version = _version
+        _build(db.execute(providers_stmt()).scalars().all(), db.execute(models_stmt()).scalars().all())
+        _loaded(version)
+
+
+# ==========================================
+# Area 2: 查询
+# ==========================================
+async def resolve_model(db: AsyncSession, model_id: str, user_id: int) -> Optional[Resolved]:
+    """
+    根据请求里的 model 找到对应的模型和服务商，找不到返回 None
+    用户自己的服务商优先于系统级的同名模型
+    """
+    await _ensure_loaded(db)
+    if user_id:
+        hit = _models.get((user_id, model_id))
+        if hit:
+            return hit
+    return _models.get((0, model_id))
+
+async def list_models(db: AsyncSession, user_id: int) -> List[Resolved]:
+    """当前用户可用的模型 (系统级 + 自己的)"""
+    await _ensure_loaded(db)
+    return [v for (owner, _), v in _models.items() if owner == 0 or owner == user_id]
+
+def get_providers(db: Session, user_id: int) -> List[ProviderEntry]:
+    """当前用户可见的启用服务商 (系统级 + 自己的)"""
+    _ensure_loaded_sync(db)
+    return [p for p in _providers if p.user_id == 0 or p.user_id == user_id]
+
+def get_models_by_provider(db: Session, provider_id: int) -> List[ModelEntry]:
+    """某个服务商下的全部模型 (含未启用的)"""
+    _ensure_loaded_sync(db)
+    return list(_byProvider.get(provider_id, []))
@@ -1,92 +1,302 @@
 """
 Chat 模块的 API 路由 (API Layer) - V2.0
-定义 API 的输入输出（Pydantic 模型），并调用 chat_crud.py 里的函数来完成工作。
+定义 API 的输入输出（Pydantic 模型），并调用 chat_crud_async.py 里的函数来完成工作。
+接口全部是 async def，数据库操作走异步会话，不占用线程池。
 接口层 (Controller)
 作用：它是“前台接待”。
 """
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import Response
+from pydantic import TypeAdapter
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 
-from tool.db_session import get_db, logger 
-import biz.chat.chat_crud as chat_crud
+from tool.db_session import get_async_db, logger 
+from tool.PasswordTool import PasswordBusyError
+import biz.chat.chat_crud_async as chat_crud
+from biz.chat import chat_search
+from biz.chat.chat_crud import ChatConflictError
+from biz.chat.chat_batcher import message_batcher, AppendResult
+from biz.chat.chat_cache import history_cache, session_cache, etag_matches, CachedBody
+from biz.chat.chat_auth import (
+    get_current_user, get_current_token, require_chat_owner,
+    issue_token, revoke_token, user_cache,
+)
 
 # 引入新的 Schemas
 from biz.chat.chat_schemas import (
-    UserCreate, UserDisplay, UserLogin,
-    ChatCreate, ChatDisplay, ChatUpdate,
+    UserCreate, UserDisplay, UserLogin, LoginDisplay,
+    ChatCreate, ChatDisplay, ChatUpdate, ChatSummaryPage,
+    ChatBulkCreate, ChatBulkUpdate, ChatBulkResult,
     ChatMessageCreate, # 输入
     MessageItem,       # 仅用于类型引用
+    MessagePage,
+    MessageAppended,
+    SearchPage,
 )
 
 router = APIRouter(prefix="/api/v1/chat", tags=["Chat System"])
 
+# 缓存里存的是序列化好的 JSON，这里直接用 TypeAdapter 生成
+_history_json = TypeAdapter(List[MessageItem])
+_sessions_json = TypeAdapter(List[ChatDisplay])
+
+def _cached_response(entry: CachedBody, if_none_match: Optional[str]) -> Response:
+    """ETag 没变时返回 304 (没有响应体)，否则直接返回缓存的 JSON 字节"""
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
 # ==========================================
 # 1. 用户模块 (User)
+# 除注册/登录外，所有接口都通过 get_current_user 从 token 识别用户
 # ==========================================
 
 @router.post("/users/register", response_model=UserDisplay)
-def register(user: UserCreate, db: Session = Depends(get_db)):
-    if chat_crud.get_user_by_name(db, user.user_name):
+async def register(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    if await chat_crud.get_user_by_name(db, user.user_name):
         raise HTTPException(status_code=400, detail="用户名已存在")
-    return chat_crud.create_user(db, user)
+    try:
+        return await chat_crud.create_user(db, user)
+    except PasswordBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
 
-@router.post("/users/login", response_model=UserDisplay)
-def login(user_login: UserLogin, db: Session = Depends(get_db)):
-    user = chat_crud.verify_login(db, user_login)
+@router.post("/users/login", response_model=LoginDisplay)
+async def login(user_login: UserLogin, db: AsyncSession = Depends(get_async_db)):
+    """登录成功后签发 token，之后的请求都带 Authorization: Bearer <token>"""
+    try:
+        user = await chat_crud.verify_login(db, user_login)
+    except PasswordBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     if not user:
         raise HTTPException(status_code=400, detail="用户名或密码错误")
     # 可以在这里处理 status == 1 (禁用) 的情况
     if user.status == 1:
         raise HTTPException(status_code=403, detail="账号已被禁用")
-    return user
+
+    display = UserDisplay.model_validate(user)
+    user_cache.set(display.uid, display)  # 预热缓存，后续请求直接命中
+    token, expires_at = issue_token(display.uid)
+    return LoginDisplay(**display.model_dump(), access_token=token, expires_at=expires_at)
+
+@router.post("/users/logout")
+async def logout(token: str = Depends(get_current_token), db: AsyncSession = Depends(get_async_db)):
+    """注销：吊销当前 token (写库，所有 worker 都认)"""
+    if not await revoke_token(db, token):
+        raise HTTPException(status_code=401, detail="登录已失效")
+    return {"ok": True}
+
+@router.get("/users/me", response_model=UserDisplay)
+async def get_me(current_user: UserDisplay = Depends(get_current_user)):
+    """当前登录用户"""
+    return current_user
 
 # ==========================================
 # 2. 会话模块 (Chat) - 单表操作
 # ==========================================
 
 @router.post("/chats", response_model=ChatDisplay)
-def create_session(session: ChatCreate, db: Session = Depends(get_db)):
-    """创建新会话"""
-    return chat_crud.create_chat(db, session)
+async def create_session(
+    session: ChatCreate,
+    current_user: UserDisplay = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """创建新会话 (创建者固定为当前登录用户)"""
+    session.creator_id = current_user.uid
+    return await chat_crud.create_chat(db, session)
+
+@router.post("/chats/bulk", response_model=List[ChatDisplay])
+async def bulk_create_sessions(
+    data: ChatBulkCreate,
+    current_user: UserDisplay = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """批量创建会话 (一个事务，一条 INSERT)，创建者固定为当前登录用户，按请求顺序返回"""
+    return await chat_crud.bulk_create_chats(db, current_user.uid, data)
+
+@router.patch("/chats", response_model=ChatBulkResult)
+async def bulk_update_sessions(
+    update_data: ChatBulkUpdate,
+    current_user: UserDisplay = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    批量更新会话 (置顶/删除/归档/改名)，一条 UPDATE 完成
+    只修改属于当前用户的会话，其余的 (不存在或不属于自己) 放在 skipped 里返回
+    """
+    if not update_data.model_dump(exclude={"chat_ids"}, exclude_none=True):
+        raise HTTPException(status_code=400, detail="没有要修改的字段")
+    updated = await chat_crud.bulk_update_chats(db, current_user.uid, update_data)
+    done = set(updated)
+    skipped = [chat_id for chat_id in dict.fromkeys(update_data.chat_ids) if chat_id not in done]
+    return ChatBulkResult(updated=updated, skipped=skipped)
 
 @router.get("/chats", response_model=List[ChatDisplay])
-def get_sessions(user_id: int, db: Session = Depends(get_db)):
-    """获取会话列表 (包含消息预览)"""
-    return chat_crud.get_user_chats(db, user_id)
+async def get_sessions(
+    if_none_match: Optional[str] = Header(None),
+    current_user: UserDisplay = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    获取会话列表 (包含消息预览)
+    支持 ETag / If-None-Match，列表没变时返回 304
+    """
+    uid = current_user.uid
+
+    async def load() -> bytes:
+        chats = await chat_crud.get_user_chats(db, uid)
+        return _sessions_json.dump_json(_sessions_json.validate_python(chats, from_attributes=True))
+
+    entry = await session_cache.get(uid, lambda: chat_crud.get_user_chats_version(db, uid), load)
+    return _cached_response(entry, if_none_match)
+
+@router.get("/chats/summary", response_model=ChatSummaryPage)
+async def get_session_summaries(
+    cursor: Optional[str] = Query(None, description="上一页返回的 next_cursor"),
+    limit: int = Query(50, ge=1, le=200),
+    current_user: UserDisplay = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """获取会话列表 (轻量版：不含消息，只有最后一条消息的预览，游标分页)"""
+    try:
+        items, next_cursor = await chat_crud.get_user_chat_summaries(db, current_user.uid, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return ChatSummaryPage(items=items, next_cursor=next_cursor)
+
+@router.get("/search", response_model=SearchPage)
+async def search_chats(
+    q: str = Query(..., min_length=1, max_length=200, description="搜索词，空格分隔的多个词需要同时出现"),
+    offset: int = Query(0, ge=0, le=1000),
+    limit: int = Query(20, ge=1, le=100),
+    current_user: UserDisplay = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """全文搜索当前用户的会话 (消息内容 + 标题)，按相关度排序"""
+    return await chat_search.search(db, current_user.uid, q, offset, limit)
 
 @router.put("/chats/{chat_id}", response_model=ChatDisplay)
-def update_session(chat_id: int, update_data: ChatUpdate, db: Session = Depends(get_db)):
+async def update_session(
+    chat_id: int,
+    update_data: ChatUpdate,
+    current_user: UserDisplay = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
     """更新会话 (置顶/删除/改名)"""
-    chat = chat_crud.update_chat_status(db, chat_id, update_data)
+    await require_chat_owner(db, chat_id, current_user)
+    try:
+        chat = await chat_crud.update_chat_status(db, chat_id, update_data)
+    except ChatConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     if not chat:
         raise HTTPException(status_code=404, detail="Chat not found")
     return chat
 
 # ==========================================
-# 3. 消息模块 (Message) - JSON 追加
+# 3. 消息模块 (Message) - 追加写入 chat_message 表
 # ==========================================
 
+async def _append(db: AsyncSession, message: ChatMessageCreate) -> AppendResult:
+    """追加一条消息：开启合并提交时交给 message_batcher，否则直接单条提交"""
+    if message_batcher.enabled:
+        return await message_batcher.submit(message)
+    chat, new_msg = await chat_crud.append_message(db, message)
+    return AppendResult(chat.chat_id, new_msg, chat.messages_num, chat.update_time)
+
 @router.post("/messages", response_model=ChatDisplay)
-def send_message(message: ChatMessageCreate, db: Session = Depends(get_db)):
+async def send_message(
+    message: ChatMessageCreate,
+    current_user: UserDisplay = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
     """
     发送消息
     注意：返回值不再是单条 Message，而是更新后的整个 Chat 对象！
     这样前端可以直接用新的 messages 列表覆盖旧的。
     """
+    await require_chat_owner(db, message.chat_id, current_user)
     try:
-        return chat_crud.add_message(db, message)
+        await _append(db, message)
+        return await chat_crud.get_chat(db, message.chat_id)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
+    except ChatConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         logger.error(f"发消息失败: {e}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
+@router.post("/messages/delta", response_model=MessageAppended)
+async def send_message_delta(
+    message: ChatMessageCreate,
+    current_user: UserDisplay = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    发送消息 (增量返回)
+    只返回新追加的消息、它的 msg_id、最新的 messages_num 和 update_time，
+    已经和服务端保持同步的前端用它即可，代价与会话长度无关。
+    """
+    await require_chat_owner(db, message.chat_id, current_user)
+    try:
+        result = await _append(db, message)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ChatConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        logger.error(f"发消息失败: {e}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+    return MessageAppended(
+        chat_id=result.chat_id,
+        msg_id=result.message.msg_id,
+        message=result.message,
+        messages_num=result.messages_num,
+        update_time=result.update_time,
+    )
+
 @router.get("/history/{chat_id}", response_model=List[MessageItem])
-def get_history(chat_id: int, db: Session = Depends(get_db)):
+async def get_history(
+    chat_id: int,
+    if_none_match: Optional[str] = Header(None),
+    current_user: UserDisplay = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
     """
     获取历史消息
-    直接把 Chat 表里的 messages JSON 吐出来
+    按 msg_id 升序返回 chat_message 表里的记录
+    支持 ETag / If-None-Match，会话没变时返回 304
     """
-    return chat_crud.get_chat_history(db, chat_id)
+    await require_chat_owner(db, chat_id, current_user)
 
+    async def load() -> bytes:
+        messages = await chat_crud.get_chat_history(db, chat_id)
+        return _history_json.dump_json(_history_json.validate_python(messages, from_attributes=True))
+
+    entry = await history_cache.get(chat_id, lambda: chat_crud.get_chat_version(db, chat_id), load)
+    return _cached_response(entry, if_none_match)
+
+@router.get("/history/{chat_id}/page", response_model=MessagePage)
+async def get_history_page(
+    chat_id: int,
+    before: Optional[int] = Query(None, description="加载 msg_id 小于它的更早消息"),
+    after: Optional[int] = Query(None, description="加载 msg_id 大于它的更新消息"),
+    limit: int = Query(50, ge=1, le=200),
+    current_user: UserDisplay = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    分页获取历史消息 (游标分页)
+    不传 before/after 时返回最新的 limit 条，前端向上滚动时用 before_cursor 继续加载
+    """
+    if before is not None and after is not None:
+        raise HTTPException(status_code=400, detail="before 和 after 不能同时使用")
+    await require_chat_owner(db, chat_id, current_user)
+    messages, has_more = await chat_crud.get_chat_history_page(db, chat_id, before, after, limit)
+    return MessagePage(
+        messages=messages,
+        has_more=has_more,
+        before_cursor=messages[0].msg_id if messages else before,
+        after_cursor=messages[-1].msg_id if messages else after,
+    )
@@ -0,0 +1,337 @@
+"""
+归档会话的冷存储 (Cold Storage)
+作用：归档的、或者很久没人动过的会话，消息还占着 chat_message 表 (和数据库缓冲池)，
+扫描、备份、建索引都要带上它们，但几乎不会再被读到。
+这里把一个会话的全部消息序列化成 JSON、压缩成一个 blob 存进 chat_archive，chat_message 里对应的行删掉。
+
+- 归档 (is_archived=1) 时立即冷冻，取消归档时搬回 chat_message
+- 后台任务 (ArchiveSweeper) 定期冷冻超过 idle_days 天没有更新的会话，
+  以及在这个功能上线之前就已经归档的会话；只搬存储，不改变会话的归档状态和排序
+- 读历史 / 分页 / 构造上下文时透明解压，接口返回和热数据完全一样
+- 往冷会话里追加消息时，先在同一个事务里搬回 chat_message 再追加
+- msg_id、token_count、token_offset 原样保存和恢复，token 前缀和保持连续
+- 全文搜索不受影响：FTS5 索引和消息表是分开的，冷冻时保留，命中冷会话的消息从这里解压出摘要；
+  MySQL 的 FULLTEXT 随行删除、进程内索引只读 chat_message，这两种后端搜索时另外扫描当前用户的冷会话
+- 消息 ID 不会被复用 (AUTOINCREMENT)，搬回时原样插回，客户端拿到的 msg_id / 分页游标一直有效
+
+压缩：装了 zstandard 时用 zstd，否则用标准库 zlib。每行记录自己的 codec，改配置后旧数据照样能读。
+
+配置 ([archive] 段):
+    codec                   auto (有 zstandard 用 zstd) / zstd / zlib (默认 auto)
+    level                   压缩级别 (默认 zstd 3，zlib 6)
+    sweep_enabled           是否启动后台冷冻任务 (默认 false)；多 worker 部署时只在 0 号 worker 里运行
+    idle_days               多少天没有更新的会话冷冻，0 表示只冷冻已归档的会话 (默认 30)，按数据库的时钟计算
+    sweep_interval_seconds  两轮之间的间隔 (默认 600)
+    sweep_batch             每轮最多冷冻多少个会话 (默认 200)
+"""
+import asyncio
+import json
+import zlib
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select, update, delete, and_, or_
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+
+from biz.chat.db_models import Chat, ChatMessage, ChatArchive
+from biz.chat import chat_search
+from biz.chat.chat_cache import invalidate_chat
+from tool.ConfigTool import ConfigTool
+from tool.db_session import SessionLocal, db_now, logger
+
+try:
+    import zstandard
+except ImportError:  # 可选依赖，没装就用 zlib
+    zstandard = None
+
+CODEC = ConfigTool.get("archive", "codec", "auto")
+if CODEC == "auto":
+    CODEC = "zstd" if zstandard is not None else "zlib"
+elif CODEC == "zstd" and zstandard is None:
+    logger.warning("未安装 zstandard，冷存储改用 zlib 压缩")
+    CODEC = "zlib"
+LEVEL = ConfigTool.getInt("archive", "level", 3 if CODEC == "zstd" else 6)
+
+# 冷冻时保存的消息字段 (blob 里记录字段名，以后加列也能读旧数据)
+_FIELDS = ("msg_id", "role", "content", "token_count", "token_offset", "data", "create_time")
+
+# 冷存储运行指标 (/metrics)
+ARCHIVE_STATS = {"frozen": 0, "thawed": 0, "messages_frozen": 0, "raw_bytes": 0, "stored_bytes": 0}
+
+
+# ==========================================
+# Area 1: 压缩 / 序列化
+# ==========================================
+def compress(raw: bytes) -> bytes:
+    if CODEC == "zstd":
+        return zstandard.ZstdCompressor(level=LEVEL).compress(raw)
+    return zlib.compress(raw, LEVEL)
+
+def decompress(codec: str, blob: bytes) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("冷存储数据是 zstd 压缩的，需要安装 zstandard")
+        return zstandard.ZstdDecompressor().decompress(blob)
+    if codec == "zlib":
+        return zlib.decompress(blob)
+    raise ValueError(f"未知的压缩格式: {codec}")
+
+def pack(rows) -> bytes:
+    """消息行 (按 _FIELDS 的顺序) -> JSON 字节"""
+    return json.dumps(
+        {"fields": _FIELDS, "rows": [list(r) for r in rows]},
+        ensure_ascii=False, separators=(",", ":"),
+    ).encode("utf-8")
+
+def unpack(codec: str, blob: bytes, chat_id: int) -> List[Dict]:
+    """blob -> [{字段: 值}]，带上 chat_id，可以直接插回 chat_message"""
+    doc = json.loads(decompress(codec, blob))
+    fields = doc["fields"]
+    return [dict(zip(fields, row), chat_id=chat_id) for row in doc["rows"]]
+
+
+# ==========================================
+# Area 2: 冷冻 / 搬回 (调用方负责事务和 chat 行)
+# ==========================================
+def freeze_rows(conn, chat_id: int) -> int:
+    """
+    把会话的消息压缩写进 chat_archive，再从 chat_message 和 FTS5 索引里删掉
+    FTS5 索引保留 (冷会话照样能搜到，见 chat_search)
+    不修改 chat 行：is_cold 和版本号由调用方在同一个事务里更新
+    返回: 冷冻的消息条数
+    """
+    rows = conn.execute(
+        select(*(getattr(ChatMessage, f) for f in _FIELDS))
+        .where(ChatMessage.chat_id == chat_id)
+        .order_by(ChatMessage.msg_id)
+    ).all()
+    raw = pack(rows)
+    blob = compress(raw)
+    conn.execute(ChatArchive.__table__.insert().values(
+        chat_id=chat_id, codec=CODEC, blob=blob, raw_size=len(raw), messages_num=len(rows),
+    ))
+    conn.execute(delete(ChatMessage).where(ChatMessage.chat_id == chat_id))
+
+    ARCHIVE_STATS["frozen"] += 1
+    ARCHIVE_STATS["messages_frozen"] += len(rows)
+    ARCHIVE_STATS["raw_bytes"] += len(raw)
+    ARCHIVE_STATS["stored_bytes"] += len(blob)
+    return len(rows)
+
+def thaw_rows(conn, chat_id: int) -> int:
+    """
+    把冷存储里的消息按原来的 msg_id 插回 chat_message，删掉 chat_archive 的行
+    FTS5 里这些消息先删后加 (冷冻时保留了索引，这里保证不重复也不缺)
+    不修改 chat 行 (同 freeze_rows)
+    返回: 搬回的消息条数，会话不在冷存储里返回 0
+    """
+    archive = conn.execute(
+        select(ChatArchive.codec, ChatArchive.blob).where(ChatArchive.chat_id == chat_id)
+    ).first()
+    if archive is None:
+        return 0
+    rows = unpack(archive.codec, archive.blob, chat_id)
+    if rows:
+        conn.execute(ChatMessage.__table__.insert(), rows)
+        chat_search.remove_messages(conn, [r["msg_id"] for r in rows])
+        chat_search.index_messages(conn, rows)
+    conn.execute(delete(ChatArchive).where(ChatArchive.chat_id == chat_id))
+    ARCHIVE_STATS["thawed"] += 1
+    return len(rows)
+
+def set_cold(db: Session, chat: Chat, cold: bool) -> None:
+    """
+    在 db 当前的事务里把会话搬进 / 搬出冷存储，并改 chat.is_cold
+    chat 是 ORM 读出来的 (带版本号)，版本号随调用方的提交加一，并发修改时整个事务回滚重来
+    """
+    if bool(chat.is_cold) == cold:
+        return
+    if cold:
+        freeze_rows(db.connection(), chat.chat_id)
+    else:
+        thaw_rows(db.connection(), chat.chat_id)
+    chat.is_cold = 1 if cold else 0
+
+def freeze_chat(db: Session, chat_id: int, version: Optional[int] = None) -> bool:
+    """
+    冷冻一个会话 (独立事务，后台任务和脚本用)
+    先用 Core UPDATE 改 chat 行 (拿到行锁，版本号加一，update_time 保持不变)，再搬消息
+    version 不为空时只在版本号没变的情况下冷冻，期间被修改过就跳过
+    返回: 是否冷冻成功
+    """
+    stmt = update(Chat)\
+        .where(and_(Chat.chat_id == chat_id, Chat.is_cold == 0))\
+        .values(is_cold=1, version=Chat.version + 1, update_time=Chat.update_time)
+    if version is not None:
+        stmt = stmt.where(Chat.version == version)
+    try:
+        if db.execute(stmt).rowcount != 1:
+            db.rollback()
+            return False
+        freeze_rows(db.connection(), chat_id)
+        db.commit()
+        return True
+    except Exception:
+        db.rollback()
+        raise
+
+
+# ==========================================
+# Area 3: 读取 (只读，不搬回)
+# ==========================================
+def load_cold_messages(conn, chat_ids: List[int]) -> Dict[int, List[ChatMessage]]:
+    """
+    冷会话的全部消息：chat_id -> 按 msg_id 升序的 ChatMessage (游离对象，只读)
+    不在冷存储里的会话不出现在结果里
+    """
+    if not chat_ids:
+        return {}
+    result = conn.execute(
+        select(ChatArchive.chat_id, ChatArchive.codec, ChatArchive.blob)
+        .where(ChatArchive.chat_id.in_(chat_ids))
+    )
+    return {
+        r.chat_id: [ChatMessage(**row) for row in unpack(r.codec, r.blob, r.chat_id)]
+        for r in result
+    }
+
+def attach_cold_messages(db: Session, chats: List[Chat]) -> None:
+    """冷会话的 chat.messages 查出来是空的，换成解压出的消息 (ChatDisplay 读取 chat.messages)"""
+    cold = [c for c in chats if c is not None and c.is_cold]
+    if not cold:
+        return
+    loaded = load_cold_messages(db.connection(), [c.chat_id for c in cold])
+    for chat in cold:
+        set_committed_value(chat, "messages", loaded.get(chat.chat_id, []))
+
+def page_messages(
+    messages: List[ChatMessage],
+    before: Optional[int],
+    after: Optional[int],
+    limit: int
+) -> List[ChatMessage]:
+    """在内存里做和 chat_crud.chat_history_page_stmt 一样的 keyset 分页 (结果交给 split_history_page)"""
+    if after is not None:
+        return [m for m in messages if m.msg_id > after][:limit + 1]
+    if before is not None:
+        messages = [m for m in messages if m.msg_id < before]
+    return messages[::-1][:limit + 1]
+
+def context_messages(messages: List[ChatMessage], budget: int) -> List[ChatMessage]:
+    """和 chat_crud.context_messages_stmt 一样：token_offset >= 总数 - budget"""
+    if not messages:
+        return []
+    total = messages[-1].token_offset + messages[-1].token_count
+    return [m for m in messages if m.token_offset >= total - budget]
+
+
+# ==========================================
+# Area 4: 后台冷冻任务
+# ==========================================
+class ArchiveSweeper:
+    def __init__(
+        self,
+        idleDays: int = 30,
+        intervalSeconds: int = 600,
+        batchSize: int = 200,
+        enabled: bool = False,
+        sessionFactory=None,
+    ):
+        """
+        参数:
+            sessionFactory  同步 Session 工厂，默认 SessionLocal (在线程里执行，不占事件循环)
+        """
+        self.idleDays = idleDays
+        self.interval = intervalSeconds
+        self.batchSize = batchSize
+        self.enabled = enabled
+        self.sessionFactory = sessionFactory or SessionLocal
+        self._task: Optional[asyncio.Task] = None
+        self._stop: Optional[asyncio.Event] = None
+        # 运行指标
+        self.runs = 0
+        self.skipped = 0
+
+    # ---------- 生命周期 ----------
+    def start(self) -> None:
+        """启动后台任务 (应用启动时调用)"""
+        if self.enabled and self._task is None:
+            self._stop = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"冷存储后台任务已启动: idle_days={self.idleDays}, interval={self.interval}s, codec={CODEC}")
+
+    async def close(self) -> None:
+        """停止后台任务；正在冷冻的那一批做完再退出"""
+        if self._task is None:
+            return
+        self._stop.set()
+        await self._task
+        self._task = None
+        logger.info(f"冷存储后台任务已关闭: 共冷冻 {ARCHIVE_STATS['frozen']} 个会话")
+
+    def getStats(self) -> Dict[str, int]:
+        return {"runs": self.runs, "skipped": self.skipped, **ARCHIVE_STATS}
+
+    async def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                await self.sweepOnce()
+            except Exception as e:
+                logger.error(f"冷存储后台任务出错: {e}", exc_info=True)
+            try:
+                await asyncio.wait_for(self._stop.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    # ---------- 冷冻 ----------
+    async def sweepOnce(self) -> int:
+        """执行一轮，返回冷冻的会话数"""
+        frozen = await asyncio.to_thread(self._sweep)
+        self.runs += 1
+        # 缓存只在事件循环里操作
+        for chat_id, creator_id in frozen:
+            invalidate_chat(chat_id, creator_id)
+        if frozen:
+            logger.info(f"冷存储: 本轮冷冻 {len(frozen)} 个会话")
+        return len(frozen)
+
+    def candidates_stmt(self, now: datetime):
+        """
+        待冷冻的会话：已归档的，或者 idle_days 天没有更新的 (最久没动的优先)
+        参数:
+            now  数据库的当前时间 (db_now)，update_time 是数据库写的，截止时间也要按它的时钟算
+        """
+        cond = Chat.is_archived == 1
+        if self.idleDays > 0:
+            cond = or_(cond, Chat.update_time < now - timedelta(days=self.idleDays))
+        return select(Chat.chat_id, Chat.creator_id, Chat.version)\
+            .where(and_(Chat.is_cold == 0, Chat.is_deleted == 0, Chat.messages_num > 0, cond))\
+            .order_by(Chat.update_time)\
+            .limit(self.batchSize)
+
+    def _sweep(self) -> List[Tuple[int, int]]:
+        frozen = []
+        with self.sessionFactory() as db:
+            rows = db.execute(self.candidates_stmt(db_now(db))).all()
+            db.rollback()
+            for row in rows:
+                if self._stop is not None and self._stop.is_set():
+                    break
+                try:
+                    # 每个会话一个短事务；期间被修改过 (版本号变了) 就留到下一轮
+                    if freeze_chat(db, row.chat_id, row.version):
+                        frozen.append((row.chat_id, row.creator_id))
+                    else:
+                        self.skipped += 1
+                except Exception as e:
+                    logger.warning(f"冷冻会话 {row.chat_id} 失败: {e}")
+        return frozen
+
+
+archive_sweeper = ArchiveSweeper(
+    idleDays=ConfigTool.getInt("archive", "idle_days", 30),
+    intervalSeconds=ConfigTool.getInt("archive", "sweep_interval_seconds", 600),
+    batchSize=ConfigTool.getInt("archive", "sweep_batch", 200),
+    enabled=ConfigTool.getBoolean("archive", "sweep_enabled", False),
+)
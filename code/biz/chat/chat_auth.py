@@ -0,0 +1,177 @@
+"""
+Chat 模块的登录态 (Auth Layer)
+作用：它是“门卫”。登录成功后发一个签名 token，之后每个请求只认 token 里的 uid，
+不再相信前端传来的 user_id / creator_id。
+
+- token 格式: base64url("uid.过期时间.jti") + "." + base64url(HMAC-SHA256 签名)
+  校验只需要一次 HMAC，不查库、不跑 bcrypt
+- 用户信息放在 LRU+TTL 缓存里，命中时整个鉴权不访问数据库；
+  User 行被修改 (禁用、改资料、登录) 时自动清掉本进程的缓存，其他 worker 最多延迟 user_cache_ttl
+- 注销时把 jti 写入 revoked_token 表，所有 worker、重启之后都认；
+  每个 token 是否已吊销的结论也缓存在进程内，其他 worker 最多延迟 revoke_cache_ttl 发现
+
+配置 ([auth] 段):
+    token_secret      签名密钥，所有 worker 必须一致；为空时开发模式每次启动随机生成 (重启后旧 token 失效)，
+                      生产模式 (--prod) 拒绝启动
+    token_ttl         token 有效期，秒 (默认 7 天)
+    user_cache_size   用户缓存条数 (默认 10000)
+    user_cache_ttl    用户缓存秒数 (默认 300)
+    revoke_cache_ttl  token 吊销状态的缓存秒数 (默认 60)
+"""
+import base64
+import hashlib
+import hmac
+import secrets
+import time
+from typing import Optional, Tuple
+
+from fastapi import Depends, Header, HTTPException
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import biz.chat.chat_crud_async as chat_crud
+from biz.chat.db_models import User
+from biz.chat.chat_schemas import UserDisplay
+from tool.CacheTool import TTLCache
+from tool.ConfigTool import ConfigTool
+from tool.db_session import get_async_db, logger
+
+_secret = ConfigTool.get("auth", "token_secret", "") or ""
+if not _secret:
+    _secret = secrets.token_hex(32)
+    logger.warning("未配置 [auth] token_secret，使用随机密钥 (重启后 token 失效，仅用于开发)")
+TOKEN_SECRET = _secret.encode("utf-8")
+TOKEN_TTL = ConfigTool.getInt("auth", "token_ttl", 7 * 24 * 3600)
+
+# uid -> UserDisplay
+user_cache = TTLCache(
+    maxSize=ConfigTool.getInt("auth", "user_cache_size", 10000),
+    ttl=ConfigTool.getInt("auth", "user_cache_ttl", 300)
+)
+# jti -> 是否已吊销 (本进程注销的立即生效，其他进程注销的最多延迟 ttl 秒)
+token_cache = TTLCache(
+    maxSize=ConfigTool.getInt("auth", "user_cache_size", 10000),
+    ttl=ConfigTool.getInt("auth", "revoke_cache_ttl", 60)
+)
+# chat_id -> creator_id (会话归属不会变，缓存时间可以长一些)
+chat_owner_cache = TTLCache(maxSize=100000, ttl=3600)
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+def _sign(payload: str) -> str:
+    return _b64encode(hmac.new(TOKEN_SECRET, payload.encode("ascii"), hashlib.sha256).digest())
+
+
+# ==========================================
+# Area 1: token 签发 / 校验 / 吊销
+# ==========================================
+def issue_token(uid: int) -> Tuple[str, int]:
+    """签发 token，返回 (token, 过期时间戳)"""
+    expires_at = int(time.time()) + TOKEN_TTL
+    jti = secrets.token_urlsafe(12)
+    payload = _b64encode(f"{uid}.{expires_at}.{jti}".encode("ascii"))
+    # 新签发的 token 肯定没有被吊销，本进程后续请求不用再查库
+    token_cache.set(jti, False)
+    return f"{payload}.{_sign(payload)}", expires_at
+
+def parse_token(token: str) -> Optional[Tuple[int, int, str]]:
+    """
+    校验签名和有效期
+    返回: (uid, 过期时间戳, jti)，无效时返回 None
+    """
+    try:
+        payload, sig = token.split(".", 1)
+        if not hmac.compare_digest(sig, _sign(payload)):
+            return None
+        uid, expires_at, jti = _b64decode(payload).decode("ascii").split(".", 2)
+        uid, expires_at = int(uid), int(expires_at)
+    except Exception:
+        return None
+    if expires_at < time.time():
+        return None
+    return uid, expires_at, jti
+
+async def is_revoked(db: AsyncSession, jti: str) -> bool:
+    """token 是否已注销；缓存命中时不访问数据库"""
+    revoked = token_cache.get(jti)
+    if revoked is None:
+        revoked = await chat_crud.is_token_revoked(db, jti)
+        token_cache.set(jti, revoked)
+    return revoked
+
+async def revoke_token(db: AsyncSession, token: str) -> bool:
+    """吊销 token (注销)，成功返回 True"""
+    parsed = parse_token(token)
+    if not parsed or await is_revoked(db, parsed[2]):
+        return False
+    uid, expires_at, jti = parsed
+    await chat_crud.revoke_token(db, jti, uid, expires_at, int(time.time()))
+    token_cache.set(jti, True)
+    return True
+
+def invalidate_user(uid: int) -> None:
+    """用户资料或状态变化后调用，下次请求重新从数据库加载"""
+    user_cache.pop(uid)
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _on_user_changed(mapper, connection, target) -> None:
+    # 任何地方通过 ORM 修改 / 删除用户 (禁用、改资料、登录) 都会清掉缓存，同步和异步 Session 都生效
+    invalidate_user(target.uid)
+
+
+# ==========================================
+# Area 2: FastAPI 依赖
+# ==========================================
+def _bearer(authorization: Optional[str]) -> str:
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="未登录", headers={"WWW-Authenticate": "Bearer"})
+    return authorization[7:].strip()
+
+async def get_current_user(
+    authorization: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db)
+) -> UserDisplay:
+    """
+    解析 Authorization: Bearer <token>，返回当前用户
+    快速路径：签名校验 + 缓存命中，不访问数据库
+    """
+    parsed = parse_token(_bearer(authorization))
+    if not parsed or await is_revoked(db, parsed[2]):
+        raise HTTPException(status_code=401, detail="登录已失效，请重新登录", headers={"WWW-Authenticate": "Bearer"})
+    uid = parsed[0]
+
+    user = user_cache.get(uid)
+    if user is None:
+        db_user = await chat_crud.get_user_by_id(db, uid)
+        if not db_user:
+            raise HTTPException(status_code=401, detail="用户不存在")
+        user = UserDisplay.model_validate(db_user)
+        user_cache.set(uid, user)
+
+    if user.status == 1:
+        raise HTTPException(status_code=403, detail="账号已被禁用")
+    return user
+
+async def get_current_token(authorization: Optional[str] = Header(None)) -> str:
+    """取出当前请求的 token (注销时使用)"""
+    return _bearer(authorization)
+
+async def require_chat_owner(db: AsyncSession, chat_id: int, user: UserDisplay) -> None:
+    """
+    校验会话属于当前用户，不存在返回 404，不属于返回 403
+    会话归属缓存在进程内，命中时不访问数据库
+    """
+    owner = chat_owner_cache.get(chat_id)
+    if owner is None:
+        owner = await chat_crud.get_chat_owner(db, chat_id)
+        if owner is None:
+            raise HTTPException(status_code=404, detail="Chat not found")
+        chat_owner_cache.set(chat_id, owner)
+    if owner != user.uid:
+        raise HTTPException(status_code=403, detail="无权访问该会话")
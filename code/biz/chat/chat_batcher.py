@@ -0,0 +1,240 @@
+"""
+消息追加的合并提交 (Write-behind Batcher)
+作用：Agent 运行时短时间内会有大量消息写入 (可能分散在多个会话)，
+逐条 commit 每条都要一次 fsync。这里把几毫秒内到达的追加攒成一批，在一个事务里提交。
+
+- 调用方 await submit() 拿到自己那条消息的结果 (msg_id / 最新计数)，或者对应的异常
+- 同一会话内的消息保持提交顺序
+- 整批提交失败时退回逐条提交，一条坏数据不会连累同批的其他消息
+- 应用关闭时 close() 会把队列里剩下的消息写完
+
+配置 ([chat] 段):
+    batch_enabled    是否启用 (默认 false，关闭时接口仍然逐条提交)
+    batch_window_ms  攒批的时间窗口，毫秒 (默认 5)
+    batch_max        单批最多多少条，攒够立即提交 (默认 200)
+"""
+import asyncio
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import and_, select, update, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from biz.chat.db_models import Chat, ChatMessage
+from biz.chat.chat_schemas import ChatMessageCreate
+from biz.chat.chat_crud import make_preview, build_message_row, CHAT_PURGING
+from biz.chat.chat_cache import invalidate_chat
+from biz.chat.chat_archive import thaw_rows
+from tool.ConfigTool import ConfigTool
+from tool.db_session import AsyncSessionLocal, logger
+
+
+class AppendResult(NamedTuple):
+    """单条消息的写入结果"""
+    chat_id: int
+    message: ChatMessage
+    messages_num: int        # 写入这条之后会话的消息数
+    update_time: datetime
+
+
+_Pending = Tuple[ChatMessageCreate, asyncio.Future]
+
+
+class MessageBatcher:
+    def __init__(self, windowMs: int = 5, maxBatch: int = 200, enabled: bool = False, sessionFactory=None):
+        """
+        参数:
+            sessionFactory  AsyncSession 工厂，默认 AsyncSessionLocal (基准测试里换成临时库)
+        """
+        self.enabled = enabled
+        self.sessionFactory = sessionFactory or AsyncSessionLocal
+        self.window = windowMs / 1000
+        self.maxBatch = maxBatch
+        self._pending: List[_Pending] = []
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        # 运行指标
+        self.batches = 0
+        self.messages = 0
+        self.fallbacks = 0
+
+    # ---------- 生命周期 ----------
+    def start(self) -> None:
+        """启动后台提交任务 (应用启动时调用；不调用也会在第一次 submit 时自动启动)"""
+        if self.enabled and self._task is None:
+            self._closing = False
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"消息合并提交已启动: window={self.window * 1000:.0f}ms, max={self.maxBatch}")
+
+    async def close(self) -> None:
+        """不再接收新消息，写完队列里剩下的再退出 (应用关闭时调用)"""
+        if self._task is None:
+            return
+        self._closing = True
+        self._wake.set()
+        await self._task
+        self._task = None
+        logger.info(f"消息合并提交已关闭: 共 {self.batches} 批 / {self.messages} 条")
+
+    def getStats(self) -> Dict[str, int]:
+        return {
+            "pending": len(self._pending),
+            "batches": self.batches,
+            "messages": self.messages,
+            "fallbacks": self.fallbacks,
+        }
+
+    # ---------- 对外接口 ----------
+    async def submit(self, msg_in: ChatMessageCreate) -> AppendResult:
+        """
+        追加一条消息，等它所在的批次提交后返回
+        会话不存在或正在被清理抛 ValueError (和逐条追加一致)，其他数据库错误原样抛出
+        """
+        if self._closing:
+            raise RuntimeError("消息合并提交正在关闭")
+        if self._task is None:
+            self.start()
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((msg_in, future))
+        if len(self._pending) == 1 or len(self._pending) >= self.maxBatch:
+            self._wake.set()
+        return await future
+
+    # ---------- 后台提交 ----------
+    async def _run(self) -> None:
+        while True:
+            if not self._pending:
+                if self._closing:
+                    return
+                await self._wake.wait()
+                self._wake.clear()
+                continue
+            # 第一条到达后再等一个窗口，让同一时刻的其他追加搭车
+            if not self._closing and len(self._pending) < self.maxBatch:
+                try:
+                    await asyncio.wait_for(self._waitFull(), timeout=self.window)
+                except asyncio.TimeoutError:
+                    pass
+            batch, self._pending = self._pending[:self.maxBatch], self._pending[self.maxBatch:]
+            await self._flush(batch)
+
+    async def _waitFull(self) -> None:
+        while len(self._pending) < self.maxBatch and not self._closing:
+            self._wake.clear()
+            await self._wake.wait()
+
+    async def _flush(self, batch: List[_Pending]) -> None:
+        self.batches += 1
+        self.messages += len(batch)
+        try:
+            async with self.sessionFactory() as db:
+                results = await self._commit(db, batch)
+        except Exception as e:
+            # 整批失败 (事务已回滚)：逐条重试，只让真正有问题的那条失败
+            # _commit 提交成功后不会再抛异常，已经提交的批次不会走到这里被重复写入
+            logger.warning(f"消息批量提交失败 ({len(batch)} 条)，改为逐条提交: {e}")
+            self.fallbacks += 1
+            results = []
+            for item in batch:
+                try:
+                    async with self.sessionFactory() as db:
+                        results.append((await self._commit(db, [item]))[0])
+                except Exception as single:
+                    results.append(single)
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def _commit(self, db: AsyncSession, batch: List[_Pending]) -> List[object]:
+        """
+        一个事务写入整批消息
+        返回和 batch 一一对应的 AppendResult 或异常 (会话不存在或正在被清理)
+        出错时回滚并抛出；提交之后不会再抛异常
+        """
+        # 按会话分组 (保持提交顺序)，会话统计下面按会话一次性更新
+        perChat: Dict[int, List[ChatMessage]] = {}
+        for msg_in, _ in batch:
+            perChat.setdefault(msg_in.chat_id, []).append(build_message_row(msg_in))
+
+        try:
+            # 先更新会话 (拿到行锁)，只有确实更新到一行的会话才写入消息：
+            # 会话不存在、已被清理任务认领，或者查询之后被删掉了，它的消息都不会插入
+            alive = set()
+            for chat_id, msgs in perChat.items():
+                result = await db.execute(
+                    update(Chat)
+                    .where(and_(Chat.chat_id == chat_id, Chat.is_deleted != CHAT_PURGING))
+                    .values(
+                        messages_num=Chat.messages_num + len(msgs),
+                        tokens_num=Chat.tokens_num + sum(m.token_count for m in msgs),
+                        last_message=make_preview(msgs[-1].content),
+                        update_time=func.now(),
+                        version=Chat.version + 1,
+                    )
+                )
+                if result.rowcount:
+                    alive.add(chat_id)
+
+            # 再在同一事务里查出最新的计数和 token 总数，倒推每条消息写入后的计数和 token 前缀和
+            stats = {}
+            if alive:
+                rows = (await db.execute(
+                    select(Chat.chat_id, Chat.messages_num, Chat.update_time, Chat.creator_id,
+                           Chat.tokens_num, Chat.is_cold)
+                    .where(Chat.chat_id.in_(alive))
+                )).all()
+                # 冷会话先把历史搬回 chat_message (行锁已经拿到，不会和冷冻任务交错)
+                cold = [row.chat_id for row in rows if row.is_cold]
+                for chat_id in cold:
+                    await db.run_sync(lambda s, c=chat_id: thaw_rows(s.connection(), c))
+                if cold:
+                    await db.execute(update(Chat).where(Chat.chat_id.in_(cold)).values(is_cold=0))
+                for row in rows:
+                    stats[row.chat_id] = row
+                    offset = row.tokens_num
+                    for msg in reversed(perChat[row.chat_id]):
+                        offset -= msg.token_count
+                        msg.token_offset = offset
+
+            # 提交之前就把结果算好，提交之后只剩清缓存
+            results: List[object] = []
+            taken: Dict[int, int] = {}
+            for msg_in, _ in batch:
+                row = stats.get(msg_in.chat_id)
+                if row is None:
+                    results.append(ValueError(f"Chat {msg_in.chat_id} not found"))
+                    continue
+                msgs = perChat[msg_in.chat_id]
+                idx = taken.get(msg_in.chat_id, 0)
+                taken[msg_in.chat_id] = idx + 1
+                results.append(AppendResult(
+                    chat_id=msg_in.chat_id,
+                    message=msgs[idx],
+                    messages_num=row.messages_num - (len(msgs) - 1 - idx),
+                    update_time=row.update_time,
+                ))
+            db.add_all([msg for chat_id in stats for msg in perChat[chat_id]])
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+
+        for row in stats.values():
+            try:
+                invalidate_chat(row.chat_id, row.creator_id)
+            except Exception as e:
+                logger.error(f"清理会话缓存失败 chat_id={row.chat_id}: {e}", exc_info=True)
+        return results
+
+
+message_batcher = MessageBatcher(
+    windowMs=ConfigTool.getInt("chat", "batch_window_ms", 5),
+    maxBatch=ConfigTool.getInt("chat", "batch_max", 200),
+    enabled=ConfigTool.getBoolean("chat", "batch_enabled", False),
+)
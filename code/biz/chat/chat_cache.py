@@ -0,0 +1,109 @@
+"""
+Chat 模块的响应缓存 (Hot-chat Cache)
+作用：轮询的前端会反复拉取同一个活跃会话的历史，每次都查库、再把整段历史过一遍 Pydantic。
+这里把序列化好的 JSON 字节按 (key, 版本) 缓存起来，并生成 ETag：
+
+- 本进程里的写操作 (追加消息 / 修改会话) 直接让缓存失效
+- 多 worker 部署时，其他进程的写入靠版本号发现：缓存条目在 trust_seconds 内直接信任，
+  过期后只查一次很轻的版本号 (Chat.version，单行主键查询)，版本没变就继续用，不重新加载和序列化
+- 前端带 If-None-Match 且 ETag 没变时，接口直接返回 304，没有响应体
+
+配置 ([chat] 段):
+    history_cache_size           缓存的会话历史条数 (默认 256)
+    history_cache_trust_seconds  不查版本号直接信任缓存的秒数 (默认 2，单 worker 部署可以调大)
+"""
+import hashlib
+import time
+from typing import Any, Awaitable, Callable, Dict, NamedTuple, Optional
+
+from tool.CacheTool import TTLCache
+from tool.ConfigTool import ConfigTool
+
+TRUST_SECONDS = float(ConfigTool.get("chat", "history_cache_trust_seconds", "2"))
+
+
+class CachedBody(NamedTuple):
+    version: Any
+    etag: str
+    body: bytes
+    checkedAt: float
+
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """解析 If-None-Match (可能是多个、可能带 W/ 前缀)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+class ResponseCache:
+    def __init__(self, maxSize: int, trustSeconds: float):
+        # 条目自己记录校验时间，这里不用 TTL 淘汰
+        self._cache = TTLCache(maxSize=maxSize, ttl=0)
+        self.trustSeconds = trustSeconds
+        # 每个 key 的失效次数：加载期间被失效过的结果不写回缓存，避免把旧数据当成新的
+        self._generation: Dict[Any, int] = {}
+        self._epoch = 0
+
+    async def get(
+        self,
+        key: Any,
+        version: Callable[[], Awaitable[Any]],
+        load: Callable[[], Awaitable[bytes]],
+    ) -> CachedBody:
+        """
+        取缓存的响应体
+        参数:
+            version  查询当前版本号 (要足够轻)，返回 None 表示数据不存在
+            load     重新加载并序列化，返回 JSON 字节
+        """
+        now = time.monotonic()
+        entry: Optional[CachedBody] = self._cache.get(key)
+        if entry is not None and now - entry.checkedAt < self.trustSeconds:
+            return entry
+
+        generation = (self._epoch, self._generation.get(key, 0))
+        current = await version()
+        if entry is not None and current == entry.version:
+            entry = entry._replace(checkedAt=now)
+        else:
+            body = await load()
+            entry = CachedBody(current, make_etag(body), body, now)
+        if (self._epoch, self._generation.get(key, 0)) == generation:
+            self._cache.set(key, entry)
+        return entry
+
+    def invalidate(self, key: Any) -> None:
+        self._cache.pop(key)
+        self._generation[key] = self._generation.get(key, 0) + 1
+        if len(self._generation) > self._cache.maxSize * 4:
+            # 计数表太大时清空并整体换代，正在加载的结果都不会写回
+            self._generation.clear()
+            self._epoch += 1
+
+    def getStats(self):
+        return self._cache.getStats()
+
+
+# chat_id -> 历史消息 JSON
+history_cache = ResponseCache(
+    maxSize=ConfigTool.getInt("chat", "history_cache_size", 256),
+    trustSeconds=TRUST_SECONDS,
+)
+# user_id -> 会话列表 JSON (GET /chats)
+session_cache = ResponseCache(
+    maxSize=ConfigTool.getInt("chat", "history_cache_size", 256),
+    trustSeconds=TRUST_SECONDS,
+)
+
+
+def invalidate_chat(chat_id: int, creator_id: Optional[int] = None) -> None:
+    """会话或其消息变化后调用；知道创建者时顺带让他的会话列表失效"""
+    history_cache.invalidate(chat_id)
+    if creator_id is not None:
+        session_cache.invalidate(creator_id)
@@ -8,37 +8,66 @@ Chat 模块的数据库操作 (DB Layer) - V2.0
 
 它只负责：接收纯净的数据 -> 转换成数据库对象 -> 执行 SQL (INSERT/SELECT) -> 写入数据库。
 
-为什么独立：这是业务逻辑的核心。如果别的模块（比如定时任务）想发消息，它不需要走 HTTP 接口，直接调用这里的函数就行。
+为什么独立：这是业务逻辑的核心。如果别的模块（比如定时任务）想发消息，它不需要走 HTTP 接口，直接调用 chat_crud_async 里的函数就行。
+
+读写数据库的函数只有一份 (chat_crud_async)。这里只放共用的部分：常量、行构造 (build_*)、
+查询语句 (*_stmt) 和在调用方连接上执行的 Core 批量语句 (insert_chats / update_chats)。
 """
-from sqlalchemy.orm import Session
-from sqlalchemy import desc, and_, func
-from typing import Dict, List, Optional
+from sqlalchemy.orm import load_only
+from sqlalchemy import desc, and_, func, tuple_, literal, select, update, Select, Table, Column
+from typing import Dict, List, Optional, Tuple, TypeVar
 import time
-from passlib.context import CryptContext
+import json
+import base64
+import random
+from datetime import datetime
 
-from biz.chat.db_models import User, Chat
+from biz.chat.db_models import User, Chat, ChatMessage
+from biz.chat import chat_search  # noqa: F401  注册全文索引的增量更新 (ORM 事件)
+from biz.chat import chat_archive
 from biz.chat.chat_schemas import (
-    UserCreate, UserLogin, 
+    UserCreate,
     ChatCreate, ChatUpdate, 
+    ChatBulkUpdate,
     ChatMessageCreate
 )
-from tool.db_session import logger
+from tool.ConfigTool import ConfigTool
+from tool.TokenTool import TokenTool
+
+# 会话列表里最后一条消息预览的长度
+PREVIEW_LEN = 100
+
+# 乐观锁：版本冲突时最多尝试几次，以及首次重试前的等待 (毫秒，之后指数退避并加随机抖动)
+CAS_ATTEMPTS = ConfigTool.getInt("chat", "cas_attempts", 10)
+CAS_BACKOFF_MS = ConfigTool.getInt("chat", "cas_backoff_ms", 5)
+
+T = TypeVar("T")
+
+# 乐观锁运行指标 (/metrics)：版本冲突次数、重试用尽的次数
+CAS_STATS = {"conflicts": 0, "failures": 0}
+
+# is_deleted = 2：已删除的会话被后台清理 (chat_purge) 认领，正在分批物理删除，不能再恢复或追加消息
+CHAT_PURGING = 2
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+class ChatConflictError(Exception):
+    """会话被并发修改，重试 CAS_ATTEMPTS 次后版本号仍然对不上"""
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+def make_preview(content: str) -> str:
+    """截取消息预览 (去掉换行，便于侧边栏单行展示)"""
+    return " ".join(content.split())[:PREVIEW_LEN]
+
+def cas_backoff(attempt: int) -> float:
+    """第 attempt 次冲突后的等待秒数：指数退避 + 随机抖动，避免冲突的几方又同时重试"""
+    return random.uniform(0, CAS_BACKOFF_MS * (2 ** attempt)) / 1000
 
 
 # ==========================================
 # Area 1: 用户管理
 # ==========================================
-def create_user(db: Session, user_in: UserCreate) -> User:
-    hashed_pwd = get_password_hash(user_in.password)
-    db_user = User(
+def build_user(user_in: UserCreate, hashed_pwd: str) -> User:
+    """根据注册信息构造 User 对象 (密码由调用方先在进程池里哈希好)"""
+    return User(
         user_name=user_in.user_name,
         password=hashed_pwd,
         nick_name=user_in.nick_name,
@@ -52,81 +81,62 @@ def create_user(db: Session, user_in: UserCreate) -> User:
         sex=user_in.sex if user_in.sex is not None else 0,
         avatar=""
     )
-    try:
-        db.add(db_user)
-        db.commit()
-        db.refresh(db_user)
-        return db_user
-    except Exception as e:
-        db.rollback()
-        logger.error(f"创建用户失败: {e}")
-        raise e
-
-def get_user_by_name(db: Session, username: str) -> Optional[User]:
-    return db.query(User).filter(User.user_name == username).first()
-
-def verify_login(db: Session, login_data: UserLogin) -> Optional[User]:
-    user = get_user_by_name(db, login_data.user_name)
-    if not user:
-        return None
-    if verify_password(login_data.password, user.password):
-        user.last_login_time = func.now()
-        db.commit()
-        return user
-    return None
 
 
 # ==========================================
 # Area 2: 会话管理
 # ==========================================
-def create_chat(db: Session, chat_in: ChatCreate) -> Chat:
-    db_chat = Chat(
-        title=chat_in.title or "新会话",
-        creator_id=chat_in.creator_id,
-        # [保持复数] messages
-        messages=[],  
-        messages_num=0,
-        is_pinned=0,
-        is_deleted=0,
-        is_archived=0
-    )
-    
-    if chat_in.initial_message:
-        current_time = str(int(time.time()))
-        first_msg = {
-            "role": "user",
-            "content": chat_in.initial_message,
-            "create_time": current_time
-            # [移除] model_name
-        }
-        db_chat.messages = [first_msg]
-        db_chat.messages_num = 1
+def encode_chat_cursor(chat: Chat) -> str:
+    """会话列表游标: 最后一条的 (is_pinned, update_time, chat_id)，base64 后对前端不透明"""
+    raw = json.dumps([chat.is_pinned, chat.update_time.isoformat(), chat.chat_id])
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
 
+def decode_chat_cursor(cursor: str) -> Tuple[int, datetime, int]:
+    """解析会话列表游标，格式不对时抛 ValueError"""
     try:
-        db.add(db_chat)
-        db.commit()
-        db.refresh(db_chat)
-        return db_chat
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii"))
+        is_pinned, update_time, chat_id = json.loads(raw)
+        return int(is_pinned), datetime.fromisoformat(update_time), int(chat_id)
     except Exception as e:
-        db.rollback()
-        logger.error(f"创建会话失败: {e}")
-        raise e
-
-def get_user_chats(db: Session, user_id: int, limit: int = 100) -> List[Chat]:
-    return db.query(Chat)\
-        .filter(and_(Chat.creator_id == user_id, Chat.is_deleted == 0))\
-        .order_by(
-            desc(Chat.is_pinned),  # 【关键】先按置顶降序 (1 在 0 前面)
-            desc(Chat.update_time) # 再按更新时间降序
+        raise ValueError(f"无效的游标: {cursor}") from e
+
+def user_chat_summaries_stmt(user_id: int, cursor: Optional[str], limit: int) -> Select:
+    """
+    会话列表 (轻量版) 的查询语句：只读取列表需要的列，多取一条用来判断是否有下一页
+    按 (is_pinned, update_time, chat_id) 倒序做 keyset 分页，走 ix_chat_creator_list 索引
+    """
+    stmt = select(Chat)\
+        .options(load_only(
+            Chat.chat_id, Chat.title, Chat.creator_id,
+            Chat.is_pinned, Chat.is_archived, Chat.messages_num,
+            Chat.last_message, Chat.create_time, Chat.update_time
+        ))\
+        .where(and_(Chat.creator_id == user_id, Chat.is_deleted == 0))
+
+    if cursor:
+        is_pinned, update_time, chat_id = decode_chat_cursor(cursor)
+        # 排在游标之后: (is_pinned, update_time, chat_id) 行值比较，索引可以直接定位起点
+        stmt = stmt.where(
+            tuple_(Chat.is_pinned, Chat.update_time, Chat.chat_id) <
+            tuple_(is_pinned, literal(update_time, Chat.update_time.type), chat_id)
+        )
+
+    return stmt.order_by(
+            desc(Chat.is_pinned),   # 先按置顶降序
+            desc(Chat.update_time), # 再按更新时间降序
+            desc(Chat.chat_id)      # 时间相同时用 chat_id 保证顺序稳定
         )\
-        .limit(limit)\
-        .all()
-
-def update_chat_status(db: Session, chat_id: int, update_in: ChatUpdate) -> Optional[Chat]:
-    chat = db.query(Chat).filter(Chat.chat_id == chat_id).first()
-    if not chat:
-        return None
-    
+        .limit(limit + 1)
+
+def split_chat_page(rows: List[Chat], limit: int) -> Tuple[List[Chat], Optional[str]]:
+    """多取的一条存在即有下一页，返回 (本页会话, 下一页游标)"""
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_chat_cursor(rows[-1])
+    return rows, None
+
+def apply_chat_update(chat: Chat, update_in: ChatUpdate) -> None:
+    """把 ChatUpdate 里非空的字段写到 chat 上"""
     # 【修改】逐个判断并更新
     # 只要字段不是 None，就更新它
     if update_in.title is not None:
@@ -144,64 +154,150 @@ def update_chat_status(db: Session, chat_id: int, update_in: ChatUpdate) -> Opti
         
     # 每次更新状态，都刷新一下 update_time (可选，看产品逻辑)
     chat.update_time = func.now() 
-        
-    try:
-        db.commit()
-        db.refresh(chat)
-        return chat
-    except Exception as e:
-        db.rollback()
-        logger.error(f"更新会话失败: {e}")
-        raise e
+
+def insert_returning(conn, table: Table, rows: List[Dict], pk: Column) -> List[int]:
+    """
+    批量 INSERT，按 rows 的顺序返回自增主键
+    支持 RETURNING 的数据库 (SQLite 3.35+ / MariaDB) 合成一条多行 INSERT ... RETURNING；
+    MySQL 没有 RETURNING，逐行 INSERT 取 lastrowid (仍在同一个事务里，只提交一次)
+    """
+    if conn.dialect.insert_executemany_returning_sort_by_parameter_order:
+        return list(conn.execute(table.insert().returning(pk, sort_by_parameter_order=True), rows).scalars())
+    return [conn.execute(table.insert(), row).inserted_primary_key[0] for row in rows]
+
+def insert_chats(conn, user_id: int, chats_in: List[ChatCreate]) -> List[int]:
+    """
+    一条 INSERT 创建多个会话 (带初始消息的再一条 INSERT 写消息)，返回按顺序的 chat_id
+    Core 语句不触发 ORM 事件：会话统计直接算好写进去，全文索引由这里自己更新
+    """
+    now = str(int(time.time()))
+    rows = []
+    for chat_in in chats_in:
+        first = chat_in.initial_message
+        rows.append({
+            "title": chat_in.title or "新会话",
+            "creator_id": user_id,
+            "messages_num": 1 if first else 0,
+            "is_pinned": 0,
+            "is_deleted": 0,
+            "is_archived": 0,
+            "last_message": make_preview(first) if first else "",
+            "tokens_num": TokenTool.countMessage(first) if first else 0,
+        })
+    chat_ids = insert_returning(conn, Chat.__table__, rows, Chat.__table__.c.chat_id)
+    chat_search.index_titles(conn, [(chat_id, row["title"]) for chat_id, row in zip(chat_ids, rows)])
+
+    messages = [
+        {"chat_id": chat_id, "role": "user", "content": chat_in.initial_message,
+         "token_count": row["tokens_num"], "token_offset": 0, "create_time": now}
+        for chat_id, row, chat_in in zip(chat_ids, rows, chats_in) if chat_in.initial_message
+    ]
+    if messages:
+        msg_ids = insert_returning(conn, ChatMessage.__table__, messages, ChatMessage.__table__.c.msg_id)
+        chat_search.index_messages(conn, [dict(m, msg_id=msg_id) for m, msg_id in zip(messages, msg_ids)])
+    return chat_ids
+
+def update_chats(conn, user_id: int, update_in: ChatBulkUpdate) -> List[int]:
+    """
+    一条 UPDATE 修改多个会话 (只改属于 user_id 的)，返回实际修改的 chat_id
+    Core 语句不走 ORM 的乐观锁和事件：版本号在 SQL 里加一 (同时在改的 ORM 写入会冲突重试)，改标题时自己更新全文索引
+    归档 / 取消归档和单个修改一样，在同一个事务里把消息冷冻进 / 搬出冷存储 (chat_archive)；
+    删除只改标记，消息由后台任务清理 (chat_purge)
+    """
+    values = update_in.model_dump(include={"title", "is_pinned", "is_deleted", "is_archived"}, exclude_none=True)
+    owned = and_(Chat.chat_id.in_(update_in.chat_ids), Chat.creator_id == user_id, Chat.is_deleted != CHAT_PURGING)
+    # 先 UPDATE 拿到写锁，再在同一个事务里查出改到的会话 (归属不会变，两次条件一致)
+    conn.execute(update(Chat).where(owned).values(**values, update_time=func.now(), version=Chat.version + 1))
+    chat_ids = list(conn.execute(select(Chat.chat_id).where(owned).order_by(Chat.chat_id)).scalars())
+    if update_in.is_archived is not None:
+        cold = bool(update_in.is_archived)
+        todo = list(conn.execute(select(Chat.chat_id).where(and_(owned, Chat.is_cold == (0 if cold else 1)))).scalars())
+        for chat_id in todo:
+            if cold:
+                chat_archive.freeze_rows(conn, chat_id)
+            else:
+                chat_archive.thaw_rows(conn, chat_id)
+        if todo:
+            conn.execute(update(Chat).where(Chat.chat_id.in_(todo)).values(is_cold=1 if cold else 0))
+    if update_in.title is not None:
+        chat_search.index_titles(conn, [(chat_id, update_in.title) for chat_id in chat_ids])
+    return chat_ids
 
 
 # ==========================================
 # Area 3: 消息管理
 # ==========================================
-def add_message(db: Session, msg_in: ChatMessageCreate) -> Chat:
-    """
-    核心逻辑：往 Chat 表的 messages (JSON字段) 追加一条新记录
-    """
-    # 1. 先查出是哪个会话
-    chat = db.query(Chat).filter(Chat.chat_id == msg_in.chat_id).first()
-    if not chat:
-        raise ValueError(f"Chat {msg_in.chat_id} not found")
-
-    # 2. 构造新消息的字典结构
-    current_time = str(int(time.time()))
-    new_msg_dict = {
-        "role": msg_in.role,       # 'user' 或 'assistant'
-        "content": msg_in.content, # 具体内容
-        "create_time": current_time
-    }
-
-    # 3. 取出旧消息列表
-    # 注意：SQLAlchemy 中修改 JSON 字段，最好先取出来转成 list，修改后再赋回去
-    current_msgs = list(chat.messages) if chat.messages else []
-    # 4. 追加新消息
-    current_msgs.append(new_msg_dict)
-    
-    # 5. 重新赋值给数据库对象 (触发更新)
-    chat.messages = current_msgs
-    
-    # 6. 更新统计信息
-    chat.messages_num = len(current_msgs)
+def build_message(chat: Chat, msg_in: ChatMessageCreate) -> ChatMessage:
+    """
+    构造新消息行，并在 chat 上记下统计更新
+    计数用 SQL 端自增，避免读改写
+    """
+    msg = build_message_row(msg_in)
+    # chat 是带版本号读出来的 (乐观锁)，提交成功时这里的 tokens_num 就是写入前的总数
+    msg.token_offset = chat.tokens_num or 0
+    chat.messages_num = Chat.messages_num + 1
+    chat.tokens_num = Chat.tokens_num + msg.token_count
+    chat.last_message = make_preview(msg_in.content)
     chat.update_time = func.now() # 更新会话的最后修改时间
+    return msg
 
-    # 7. 提交保存
-    try:
-        db.commit()
-        db.refresh(chat) # 刷新数据
-        return chat
-    except Exception as e:
-        db.rollback()
-        logger.error(f"消息追加失败: {e}")
-        raise e
-
-def get_chat_history(db: Session, chat_id: int) -> List[Dict]:
-    """获取历史消息"""
-    chat = db.query(Chat).filter(Chat.chat_id == chat_id).first()
-    # [保持复数] 使用 messages
-    if not chat or not chat.messages:
-        return []
-    return chat.messages
\ No newline at end of file
+def build_message_row(msg_in: ChatMessageCreate) -> ChatMessage:
+    """
+    只构造消息行，不碰会话统计 (批量写入时由调用方按会话统一更新)
+    token 数在这里算一次，之后不再重新分词；token_offset 由调用方填
+    """
+    return ChatMessage(
+        chat_id=msg_in.chat_id,
+        role=msg_in.role,       # 'user' 或 'assistant'
+        content=msg_in.content, # 具体内容
+        token_count=TokenTool.countMessage(msg_in.content),
+        data=msg_in.data,
+        create_time=str(int(time.time()))
+    )
+
+def context_messages_stmt(chat_id: int, budget: int) -> Select:
+    """
+    上下文窗口：最新的、token 总数不超过 budget 的若干条消息 (按 msg_id 升序)
+    用前缀和一次范围查询：token_offset >= 会话总数 - budget (走 ix_chat_message_chat_tokens)
+    总数用子查询在同一条语句里读，不会和并发追加错开
+    """
+    total = select(Chat.tokens_num).where(Chat.chat_id == chat_id).scalar_subquery()
+    return select(ChatMessage)\
+        .where(ChatMessage.chat_id == chat_id)\
+        .where(ChatMessage.token_offset >= total - budget)\
+        .order_by(ChatMessage.msg_id)
+
+def chat_history_page_stmt(
+    chat_id: int,
+    before: Optional[int],
+    after: Optional[int],
+    limit: int
+) -> Select:
+    """
+    历史消息分页的查询语句 (keyset 分页，走 (chat_id, msg_id) 索引)，多取一条用来判断是否还有更多
+    - 都不传：最新的 limit 条 (倒序)
+    - before：msg_id < before 的最新 limit 条 (倒序，向上翻更早的消息)
+    - after ：msg_id > after 的最早 limit 条 (升序，追加更新的消息)
+    """
+    stmt = select(ChatMessage).where(ChatMessage.chat_id == chat_id)
+    if after is not None:
+        return stmt.where(ChatMessage.msg_id > after)\
+            .order_by(ChatMessage.msg_id)\
+            .limit(limit + 1)
+    if before is not None:
+        stmt = stmt.where(ChatMessage.msg_id < before)
+    return stmt.order_by(desc(ChatMessage.msg_id))\
+        .limit(limit + 1)
+
+def split_history_page(
+    rows: List[ChatMessage],
+    after: Optional[int],
+    limit: int
+) -> Tuple[List[ChatMessage], bool]:
+    """截掉多取的一条，统一成按 msg_id 升序，返回 (消息列表, 是否还有更多)"""
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if after is None:
+        # 倒序取出，翻转回升序方便前端直接渲染
+        rows = rows[::-1]
+    return rows, has_more
@@ -0,0 +1,342 @@
+"""
+Chat 模块的数据库操作 - 异步版本 (Async DB Layer)
+读写数据库的函数只有这一份 (API 和批量提交都用它)，行构造和 SQL 语句在 chat_crud.py 里共用。
+
+为什么是异步：API 层的接口都是 async def，直接在事件循环上等待数据库，
+不再占用 Starlette 的线程池。迁移和后台任务用同步连接直接执行 chat_crud 里的语句。
+
+注意：异步环境里不能隐式加载 (lazy load)，需要返回给 ChatDisplay 的 Chat
+都要用 selectinload 预先加载 messages。
+"""
+import asyncio
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from sqlalchemy import delete, desc, and_, func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.exc import StaleDataError
+
+from biz.chat.db_models import User, RevokedToken, Chat, ChatMessage
+from biz.chat.chat_schemas import (
+    UserCreate, UserLogin,
+    ChatCreate, ChatUpdate,
+    ChatBulkUpdate, ChatBulkCreate,
+    ChatMessageCreate
+)
+from biz.chat.chat_crud import (
+    build_user, build_message, apply_chat_update, insert_chats, update_chats,
+    user_chat_summaries_stmt, split_chat_page,
+    chat_history_page_stmt, split_history_page, context_messages_stmt,
+    CAS_ATTEMPTS, CAS_STATS, CHAT_PURGING, ChatConflictError, cas_backoff, T,
+)
+from biz.chat.chat_cache import invalidate_chat
+from biz.chat import chat_archive
+from tool.db_session import logger
+from tool.PasswordTool import PasswordTool
+
+
+async def commit_with_retry(db: AsyncSession, apply: Callable[[], Awaitable[Optional[T]]], action: str) -> Optional[T]:
+    """
+    乐观锁 (Compare-and-Swap) 提交
+    apply() 负责读出会话并修改，这里负责提交：UPDATE 带 WHERE version = 读到的版本，
+    被别人抢先改过 (StaleDataError) 就回滚、退避 (asyncio.sleep，不阻塞事件循环)，然后重新 apply，最多 CAS_ATTEMPTS 次
+    apply 返回 None 表示会话不存在，直接返回 None
+    """
+    for attempt in range(CAS_ATTEMPTS):
+        result = await apply()
+        if result is None:
+            return None
+        try:
+            await db.commit()
+            return result
+        except StaleDataError:
+            await db.rollback()
+            CAS_STATS["conflicts"] += 1
+            await asyncio.sleep(cas_backoff(attempt))
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"{action}失败: {e}")
+            raise e
+    CAS_STATS["failures"] += 1
+    logger.warning(f"{action}失败: 会话版本冲突，重试 {CAS_ATTEMPTS} 次仍未成功")
+    raise ChatConflictError(f"{action}失败: 会话正在被并发修改，请稍后重试")
+
+async def _load_chat(db: AsyncSession, chat_id: int) -> Optional[Chat]:
+    """重新查询会话并带上全部消息 (供 ChatDisplay 使用)"""
+    result = await db.execute(
+        select(Chat)
+        .options(selectinload(Chat.messages))
+        .where(Chat.chat_id == chat_id)
+        .execution_options(populate_existing=True)
+    )
+    chat = result.scalars().first()
+    await _attach_cold(db, [chat])
+    return chat
+
+async def _attach_cold(db: AsyncSession, chats: List[Chat]) -> None:
+    """冷会话的消息从冷存储解压 (见 chat_archive.attach_cold_messages)"""
+    if any(c is not None and c.is_cold for c in chats):
+        await db.run_sync(chat_archive.attach_cold_messages, chats)
+
+async def _cold_messages(db: AsyncSession, chat_id: int) -> Optional[List[ChatMessage]]:
+    """冷会话的全部消息，不在冷存储里返回 None"""
+    loaded = await db.run_sync(lambda s: chat_archive.load_cold_messages(s.connection(), [chat_id]))
+    return loaded.get(chat_id)
+
+
+# ==========================================
+# Area 1: 用户管理
+# ==========================================
+async def create_user(db: AsyncSession, user_in: UserCreate) -> User:
+    # bcrypt 是 CPU 密集操作，放到进程池里执行，避免卡住事件循环
+    hashed_pwd = await PasswordTool.hashPassword(user_in.password)
+    db_user = build_user(user_in, hashed_pwd)
+    try:
+        db.add(db_user)
+        await db.commit()
+        await db.refresh(db_user)
+        return db_user
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"创建用户失败: {e}")
+        raise e
+
+async def get_user_by_name(db: AsyncSession, username: str) -> Optional[User]:
+    result = await db.execute(select(User).where(User.user_name == username))
+    return result.scalars().first()
+
+async def get_user_by_id(db: AsyncSession, uid: int) -> Optional[User]:
+    return await db.get(User, uid)
+
+async def verify_login(db: AsyncSession, login_data: UserLogin) -> Optional[User]:
+    user = await get_user_by_name(db, login_data.user_name)
+    if not user:
+        return None
+    ok, new_hash = await PasswordTool.verifyPassword(login_data.password, user.password)
+    if ok:
+        # 代价因子调整过，顺便把密码重新哈希
+        if new_hash:
+            user.password = new_hash
+        user.last_login_time = func.now()
+        await db.commit()
+        await db.refresh(user)
+        return user
+    return None
+
+async def is_token_revoked(db: AsyncSession, jti: str) -> bool:
+    return await db.get(RevokedToken, jti) is not None
+
+async def revoke_token(db: AsyncSession, jti: str, uid: int, expires_at: int, now: int) -> None:
+    """记录注销的 token，并清理已经过期的记录"""
+    try:
+        if await db.get(RevokedToken, jti) is None:
+            db.add(RevokedToken(jti=jti, uid=uid, expires_at=expires_at))
+        await db.execute(delete(RevokedToken).where(RevokedToken.expires_at < now))
+        await db.commit()
+    except IntegrityError:
+        # 同一个 token 并发注销，另一个请求已经写进去了
+        await db.rollback()
+
+
+# ==========================================
+# Area 2: 会话管理
+# ==========================================
+async def create_chat(db: AsyncSession, chat_in: ChatCreate) -> Chat:
+    db_chat = Chat(
+        title=chat_in.title or "新会话",
+        creator_id=chat_in.creator_id,
+        messages_num=0,
+        is_pinned=0,
+        is_deleted=0,
+        is_archived=0
+    )
+
+    try:
+        db.add(db_chat)
+        if chat_in.initial_message:
+            # 先 flush 拿到自增的 chat_id，再写第一条消息
+            await db.flush()
+            db.add(build_message(db_chat, ChatMessageCreate(
+                chat_id=db_chat.chat_id,
+                role="user",
+                content=chat_in.initial_message
+            )))
+        await db.commit()
+        invalidate_chat(db_chat.chat_id, db_chat.creator_id)
+        return await _load_chat(db, db_chat.chat_id)
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"创建会话失败: {e}")
+        raise e
+
+async def get_chat(db: AsyncSession, chat_id: int) -> Optional[Chat]:
+    """按 ID 获取会话 (带全部消息)"""
+    return await _load_chat(db, chat_id)
+
+async def get_user_chats(db: AsyncSession, user_id: int, limit: int = 100) -> List[Chat]:
+    result = await db.execute(
+        select(Chat)
+        .options(selectinload(Chat.messages))
+        .where(and_(Chat.creator_id == user_id, Chat.is_deleted == 0))
+        .order_by(
+            desc(Chat.is_pinned),
+            desc(Chat.update_time)
+        )
+        .limit(limit)
+    )
+    chats = list(result.scalars().all())
+    await _attach_cold(db, chats)
+    return chats
+
+async def get_user_chat_summaries(
+    db: AsyncSession,
+    user_id: int,
+    cursor: Optional[str] = None,
+    limit: int = 50
+) -> Tuple[List[Chat], Optional[str]]:
+    """会话列表的轻量版本 (游标分页)，返回 (本页会话, 下一页游标)"""
+    result = await db.execute(user_chat_summaries_stmt(user_id, cursor, limit))
+    return split_chat_page(list(result.scalars().all()), limit)
+
+async def get_user_chats_version(db: AsyncSession, user_id: int) -> Tuple:
+    """
+    会话列表的版本号 (缓存校验用)，走 ix_chat_creator_list
+    会话数 + 版本号之和 + 最大 chat_id：任何一个会话被修改、新建或删除，至少有一项会变
+    """
+    result = await db.execute(
+        select(func.count(), func.sum(Chat.version), func.max(Chat.chat_id))
+        .where(and_(Chat.creator_id == user_id, Chat.is_deleted == 0))
+    )
+    return tuple(result.one())
+
+async def get_chat_owner(db: AsyncSession, chat_id: int) -> Optional[int]:
+    """只查会话的创建者 (鉴权用)，会话不存在返回 None"""
+    result = await db.execute(select(Chat.creator_id).where(Chat.chat_id == chat_id))
+    return result.scalar_one_or_none()
+
+async def update_chat_status(db: AsyncSession, chat_id: int, update_in: ChatUpdate) -> Optional[Chat]:
+    async def apply() -> Optional[Chat]:
+        result = await db.execute(select(Chat).where(Chat.chat_id == chat_id))
+        chat = result.scalars().first()
+        if chat and chat.is_deleted == CHAT_PURGING:
+            # 正在清理的会话当作不存在
+            return None
+        if chat:
+            apply_chat_update(chat, update_in)
+            if update_in.is_archived is not None:
+                # 归档时消息压缩进冷存储，取消归档时搬回 (同一个事务)
+                await db.run_sync(chat_archive.set_cold, chat, bool(update_in.is_archived))
+        return chat
+
+    chat = await commit_with_retry(db, apply, "更新会话")
+    if not chat:
+        return None
+    invalidate_chat(chat_id, chat.creator_id)
+    return await _load_chat(db, chat_id)
+
+async def bulk_create_chats(db: AsyncSession, user_id: int, bulk_in: ChatBulkCreate) -> List[Chat]:
+    """批量创建会话 (一个事务，见 chat_crud.insert_chats)，返回按顺序的新会话 (带消息)"""
+    try:
+        chat_ids = await db.run_sync(lambda s: insert_chats(s.connection(), user_id, bulk_in.chats))
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"批量创建会话失败: {e}")
+        raise e
+    for chat_id in chat_ids:
+        invalidate_chat(chat_id, user_id)
+    result = await db.execute(
+        select(Chat)
+        .options(selectinload(Chat.messages))
+        .where(Chat.chat_id.in_(chat_ids))
+    )
+    chats = {c.chat_id: c for c in result.scalars()}
+    return [chats[chat_id] for chat_id in chat_ids]
+
+async def bulk_update_chats(db: AsyncSession, user_id: int, bulk_in: ChatBulkUpdate) -> List[int]:
+    """批量更新会话 (一条 UPDATE，见 chat_crud.update_chats)，返回实际修改的 chat_id"""
+    try:
+        chat_ids = await db.run_sync(lambda s: update_chats(s.connection(), user_id, bulk_in))
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"批量更新会话失败: {e}")
+        raise e
+    for chat_id in chat_ids:
+        invalidate_chat(chat_id, user_id)
+    return chat_ids
+
+
+# ==========================================
+# Area 3: 消息管理
+# ==========================================
+async def append_message(db: AsyncSession, msg_in: ChatMessageCreate) -> Tuple[Chat, ChatMessage]:
+    """
+    追加一条消息 (单行 INSERT + 计数自增)
+    返回: (会话, 新消息)，不会加载会话的历史消息
+    """
+    async def apply() -> Tuple[Chat, ChatMessage]:
+        result = await db.execute(select(Chat).where(Chat.chat_id == msg_in.chat_id))
+        chat = result.scalars().first()
+        if not chat or chat.is_deleted == CHAT_PURGING:
+            raise ValueError(f"Chat {msg_in.chat_id} not found")
+        if chat.is_cold:
+            # 冷会话先把历史搬回 chat_message
+            await db.run_sync(chat_archive.set_cold, chat, False)
+        new_msg = build_message(chat, msg_in)
+        db.add(new_msg)
+        return chat, new_msg
+
+    chat, new_msg = await commit_with_retry(db, apply, "消息追加")
+    invalidate_chat(chat.chat_id, chat.creator_id)
+    await db.refresh(chat) # 刷新计数和时间
+    return chat, new_msg
+
+async def add_message(db: AsyncSession, msg_in: ChatMessageCreate) -> Chat:
+    """追加消息，返回更新后的整个 Chat (包含全部历史)"""
+    chat, _ = await append_message(db, msg_in)
+    return await _load_chat(db, chat.chat_id)
+
+async def get_chat_version(db: AsyncSession, chat_id: int) -> Optional[int]:
+    """会话的版本号 (缓存校验用)，单行主键查询，会话不存在返回 None"""
+    result = await db.execute(select(Chat.version).where(Chat.chat_id == chat_id))
+    return result.scalar_one_or_none()
+
+async def get_chat_history(db: AsyncSession, chat_id: int) -> List[ChatMessage]:
+    """获取历史消息 (按 msg_id 升序)，冷会话从冷存储解压"""
+    result = await db.execute(
+        select(ChatMessage)
+        .where(ChatMessage.chat_id == chat_id)
+        .order_by(ChatMessage.msg_id)
+    )
+    rows = list(result.scalars().all())
+    if not rows:
+        return await _cold_messages(db, chat_id) or []
+    return rows
+
+async def get_context_messages(db: AsyncSession, chat_id: int, budget: int) -> List[ChatMessage]:
+    """最新的、放得进 budget 个 token 的历史消息 (见 chat_crud.context_messages_stmt)"""
+    result = await db.execute(context_messages_stmt(chat_id, budget))
+    rows = list(result.scalars().all())
+    if not rows:
+        cold = await _cold_messages(db, chat_id)
+        if cold:
+            return chat_archive.context_messages(cold, budget)
+    return rows
+
+async def get_chat_history_page(
+    db: AsyncSession,
+    chat_id: int,
+    before: Optional[int] = None,
+    after: Optional[int] = None,
+    limit: int = 50
+) -> Tuple[List[ChatMessage], bool]:
+    """按游标分页获取历史消息，返回 (按 msg_id 升序的消息列表, 是否还有更多)"""
+    result = await db.execute(chat_history_page_stmt(chat_id, before, after, limit))
+    rows = list(result.scalars().all())
+    if not rows:
+        cold = await _cold_messages(db, chat_id)
+        if cold:
+            rows = chat_archive.page_messages(cold, before, after, limit)
+    return split_history_page(rows, after, limit)
@@ -0,0 +1,253 @@
+"""
+Chat 模块的数据迁移 (Migration)
+作用：把旧版 Chat.messages (JSON 字段) 里的历史消息搬到 chat_message 表。
+
+- 按 chat_id 分批处理，每批一个事务，避免长事务锁表
+- 幂等：已经有 chat_message 记录的会话直接跳过，只清空旧 JSON
+- 应用启动时 (MainServer.lifespan) 自动执行，也可以单独运行：
+    python -m biz.chat.chat_migrate
+
+另外负责给已存在的表补齐新增的列/索引 (create_all 只会建新表)，SQLite 上把会话 / 消息表重建成 AUTOINCREMENT，
+以及全文搜索索引。
+"""
+from sqlalchemy import inspect, func, text, update, bindparam
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateColumn
+
+from biz.chat.db_models import Chat, ChatMessage
+from biz.chat.chat_crud import make_preview
+from biz.chat.chat_search import ensure_search_index
+from tool.db_session import Base, SessionLocal, engine, logger
+from tool.TokenTool import TokenTool
+
+
+def upgrade_schema(bind=None) -> None:
+    """
+    对比模型和数据库，给已存在的表补上缺少的列和索引
+    (只增不删，不修改已有列)
+    """
+    bind = bind if bind is not None else engine
+    inspector = inspect(bind)
+    existing_tables = set(inspector.get_table_names())
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            columns = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in columns:
+                    continue
+                ddl = CreateColumn(column).compile(dialect=bind.dialect)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+                logger.info(f"表 {table.name} 新增列: {column.name}")
+
+            indexes = {i["name"] for i in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    index.create(conn)
+                    logger.info(f"表 {table.name} 新增索引: {index.name}")
+
+            if bind.dialect.name == "sqlite" and table.dialect_options["sqlite"]["autoincrement"]:
+                rebuild_sqlite_autoincrement(conn, table)
+
+
+def rebuild_sqlite_autoincrement(conn, table) -> None:
+    """
+    SQLite 不能给已有的表加 AUTOINCREMENT，只能重建：改名 -> 按模型建新表 (连同索引) -> 复制数据 -> 删旧表
+    已经是 AUTOINCREMENT 的表直接跳过；复制时保留原有 ID，sqlite_sequence 从现有最大 ID 继续
+    """
+    sql = conn.exec_driver_sql(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table.name,)
+    ).scalar()
+    if not sql or "AUTOINCREMENT" in sql.upper():
+        return
+    old = f"_{table.name}_old"
+    old_indexes = [i["name"] for i in inspect(conn).get_indexes(table.name)]
+    old_columns = {c["name"] for c in inspect(conn).get_columns(table.name)}
+    # 索引名跟着旧表走，先删掉，新表才能用同样的名字建索引
+    for name in old_indexes:
+        conn.exec_driver_sql(f'DROP INDEX IF EXISTS "{name}"')
+    conn.exec_driver_sql(f'ALTER TABLE "{table.name}" RENAME TO "{old}"')
+    table.create(conn)
+    columns = ", ".join(f'"{c.name}"' for c in table.columns if c.name in old_columns)
+    conn.exec_driver_sql(f'INSERT INTO "{table.name}" ({columns}) SELECT {columns} FROM "{old}"')
+    conn.exec_driver_sql(f'DROP TABLE "{old}"')
+    logger.info(f"表 {table.name} 重建为 AUTOINCREMENT (ID 不再复用)")
+
+
+def migrate_json_messages(db: Session, batch_size: int = 100) -> int:
+    """
+    迁移所有会话的 JSON 历史消息
+    返回: 本次迁移的消息条数
+    """
+    migrated = 0
+    last_id = 0
+    while True:
+        rows = db.query(Chat.chat_id, Chat.messages_json)\
+            .filter(Chat.chat_id > last_id)\
+            .order_by(Chat.chat_id)\
+            .limit(batch_size)\
+            .all()
+        if not rows:
+            break
+        last_id = rows[-1].chat_id
+
+        todo = [r for r in rows if r.messages_json]
+        if not todo:
+            continue
+
+        # 已经迁移过的会话 (chat_message 里已有记录)，只清空旧 JSON
+        done_ids = {
+            cid for (cid,) in db.query(ChatMessage.chat_id)
+            .filter(ChatMessage.chat_id.in_([r.chat_id for r in todo]))
+            .distinct()
+        }
+
+        try:
+            for row in todo:
+                # update_time 保持原值 (否则 onupdate 会改成迁移时间，打乱会话列表的顺序)
+                values = {Chat.messages_json: [], Chat.update_time: Chat.update_time}
+                if row.chat_id not in done_ids:
+                    db.add_all([
+                        ChatMessage(
+                            chat_id=row.chat_id,
+                            role=m.get("role", "user"),
+                            content=m.get("content", ""),
+                            token_count=m.get("token_count", 0),
+                            data=m.get("data"),
+                            create_time=str(m.get("create_time", "0"))
+                        )
+                        for m in row.messages_json
+                    ])
+                    migrated += len(row.messages_json)
+                    values[Chat.messages_num] = len(row.messages_json)
+                    values[Chat.last_message] = make_preview(
+                        row.messages_json[-1].get("content", "")
+                    )
+                db.query(Chat).filter(Chat.chat_id == row.chat_id).update(
+                    values, synchronize_session=False
+                )
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"迁移历史消息失败 (chat_id <= {last_id}): {e}")
+            raise e
+
+    if migrated:
+        logger.info(f"历史消息迁移完成，共 {migrated} 条")
+    return migrated
+
+
+def backfill_last_message(db: Session, batch_size: int = 100) -> int:
+    """
+    给新增的 last_message 列补上预览 (只处理为 NULL 的旧会话)
+    返回: 本次处理的会话数
+    """
+    filled = 0
+    while True:
+        chat_ids = [
+            cid for (cid,) in db.query(Chat.chat_id)
+            .filter(Chat.last_message.is_(None))
+            .order_by(Chat.chat_id)
+            .limit(batch_size)
+        ]
+        if not chat_ids:
+            break
+
+        # 每个会话最后一条消息
+        last_ids = db.query(func.max(ChatMessage.msg_id))\
+            .filter(ChatMessage.chat_id.in_(chat_ids))\
+            .group_by(ChatMessage.chat_id)
+        previews = {
+            row.chat_id: make_preview(row.content)
+            for row in db.query(ChatMessage.chat_id, ChatMessage.content)
+            .filter(ChatMessage.msg_id.in_(last_ids))
+        }
+
+        try:
+            for cid in chat_ids:
+                # update_time 保持原值 (同 migrate_json_messages)
+                db.query(Chat).filter(Chat.chat_id == cid).update(
+                    {Chat.last_message: previews.get(cid, ""), Chat.update_time: Chat.update_time},
+                    synchronize_session=False
+                )
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"补齐消息预览失败: {e}")
+            raise e
+        filled += len(chat_ids)
+
+    if filled:
+        logger.info(f"消息预览补齐完成，共 {filled} 个会话")
+    return filled
+
+
+def backfill_token_counts(db: Session, batch_size: int = 100) -> int:
+    """
+    给新增 token 统计之前写入的消息补上 token_count / token_offset，以及会话的 tokens_num
+    (只处理有消息但 tokens_num 为 0 的会话，每条消息至少有格式开销，所以不会重复处理)
+    返回: 本次处理的会话数
+    """
+    filled = 0
+    last_id = 0
+    update_msg = update(ChatMessage)\
+        .where(ChatMessage.msg_id == bindparam("b_msg_id"))\
+        .values(token_count=bindparam("b_count"), token_offset=bindparam("b_offset"))
+    while True:
+        chat_ids = [
+            cid for (cid,) in db.query(Chat.chat_id)
+            .filter(Chat.chat_id > last_id, Chat.messages_num > 0, Chat.tokens_num == 0, Chat.is_cold == 0)
+            .order_by(Chat.chat_id)
+            .limit(batch_size)
+        ]
+        if not chat_ids:
+            break
+        last_id = chat_ids[-1]
+
+        try:
+            for cid in chat_ids:
+                params = []
+                total = 0
+                for msg_id, content in db.query(ChatMessage.msg_id, ChatMessage.content)\
+                        .filter(ChatMessage.chat_id == cid)\
+                        .order_by(ChatMessage.msg_id):
+                    count = TokenTool.countMessage(content)
+                    params.append({"b_msg_id": msg_id, "b_count": count, "b_offset": total})
+                    total += count
+                if params:
+                    db.connection().execute(update_msg, params)
+                # update_time 保持原值 (同 migrate_json_messages)
+                db.query(Chat).filter(Chat.chat_id == cid).update(
+                    {Chat.tokens_num: total, Chat.version: Chat.version + 1, Chat.update_time: Chat.update_time},
+                    synchronize_session=False
+                )
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"补齐 token 统计失败 (chat_id <= {last_id}): {e}")
+            raise e
+        filled += len(chat_ids)
+
+    if filled:
+        logger.info(f"token 统计补齐完成，共 {filled} 个会话")
+    return filled
+
+
+def run_migrations() -> None:
+    """使用独立会话执行全部迁移 (供启动流程调用)"""
+    upgrade_schema()
+    db = SessionLocal()
+    try:
+        migrate_json_messages(db)
+        backfill_last_message(db)
+        backfill_token_counts(db)
+    finally:
+        db.close()
+    ensure_search_index(engine)
+
+
+if __name__ == "__main__":
+    from tool.db_session import init_db
+    init_db()
+    run_migrations()
@@ -0,0 +1,291 @@
+"""
+已删除会话的后台清理 (Purge)
+作用：删除会话只是把 is_deleted 置 1，会话行、消息、冷存储的压缩块和全文索引一直留在库里，
+会话列表的查询每次都要把它们过滤掉。这里在宽限期 (grace_days) 过后把它们物理删除。
+
+- 删除时间按 update_time 算 (删除操作会刷新 update_time)，宽限期内恢复的会话不受影响
+- 小批量 + 限速：每个事务最多删 message_batch 条消息，事务之间停 pause_ms，
+  不会长时间持有锁，也不会一下子产生大量 binlog 让从库延迟
+- 截止时间用数据库时钟算 (update_time 是数据库写入的)，不受应用服务器时区影响
+- 开始删一批会话前先认领：一条 UPDATE 把其中仍然 "已删除且过了宽限期" 的改成 is_deleted = 2，
+  认领之后不能再恢复、也不能再追加消息，不会出现删了一半消息又被恢复的会话；认领前被恢复的不受影响
+- 每个事务开始时重新确认会话仍在清理中 (MySQL 上加行锁)
+- 先分批删消息 (连同 FTS5 索引)，最后一个事务删会话行、冷存储和标题索引；中途停止下一轮接着删 (认领过的优先)
+- 会搬动数据，默认关闭；多 worker 部署时只在 0 号 worker 里运行
+- 进度写日志，累计数量在 /metrics (chat_purge_*)
+
+配置 ([purge] 段):
+    enabled           是否启动后台清理 (默认 false)
+    grace_days        删除后保留多少天 (默认 30)
+    interval_seconds  两轮之间的间隔 (默认 3600)
+    chat_batch        每批清理多少个会话 (默认 100)
+    message_batch     每个事务最多删多少条消息 (默认 1000)
+    pause_ms          两个事务之间的停顿，毫秒 (默认 100)
+"""
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select, delete, update, and_, or_, func
+from sqlalchemy.orm import Session
+
+from biz.chat.db_models import Chat, ChatMessage, ChatArchive
+from biz.chat import chat_search
+from biz.chat.chat_archive import load_cold_messages
+from biz.chat.chat_auth import chat_owner_cache
+from biz.chat.chat_cache import invalidate_chat
+from biz.chat.chat_crud import CHAT_PURGING
+from tool.ConfigTool import ConfigTool
+from tool.db_session import SessionLocal, logger, db_now
+
+
+def expired(cutoff: datetime):
+    """已删除，并且删除 (最后一次修改) 早于 cutoff 的会话"""
+    return and_(Chat.is_deleted == 1, Chat.update_time < cutoff)
+
+
+def purgeable(cutoff: datetime):
+    """可以物理删除的会话：已经认领 (上一轮没删完的)，或者已删除并过了宽限期"""
+    return or_(Chat.is_deleted == CHAT_PURGING, expired(cutoff))
+
+
+class ChatPurger:
+    def __init__(
+        self,
+        graceDays: int = 30,
+        intervalSeconds: int = 3600,
+        chatBatch: int = 100,
+        messageBatch: int = 1000,
+        pauseMs: int = 100,
+        enabled: bool = False,
+        sessionFactory=None,
+    ):
+        """
+        参数:
+            sessionFactory  同步 Session 工厂，默认 SessionLocal (每个事务在线程里执行，不占事件循环)
+        """
+        self.graceDays = graceDays
+        self.interval = intervalSeconds
+        self.chatBatch = chatBatch
+        self.messageBatch = messageBatch
+        self.pause = pauseMs / 1000
+        self.enabled = enabled
+        self.sessionFactory = sessionFactory or SessionLocal
+        self._task: Optional[asyncio.Task] = None
+        self._stop: Optional[asyncio.Event] = None
+        # 运行指标 (累计)
+        self.rounds = 0
+        self.pending = 0          # 最近一轮开始时待清理的会话数
+        self.chats = 0
+        self.messages = 0
+        self.archives = 0
+        self.transactions = 0
+        self.maxTxnMs = 0.0       # 最长的单个事务耗时 (持锁时间的上限)
+
+    # ---------- 生命周期 ----------
+    def start(self) -> None:
+        """启动后台任务 (应用启动时调用)"""
+        if self.enabled and self._task is None:
+            self._stop = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"已删除会话清理已启动: grace_days={self.graceDays}, interval={self.interval}s")
+
+    async def close(self) -> None:
+        """停止后台任务；正在执行的事务做完再退出，剩下的下次启动后接着删"""
+        if self._task is None:
+            return
+        self._stop.set()
+        await self._task
+        self._task = None
+        logger.info(f"已删除会话清理已关闭: 共清理 {self.chats} 个会话 / {self.messages} 条消息")
+
+    def getStats(self) -> Dict[str, float]:
+        return {
+            "rounds": self.rounds,
+            "pending": self.pending,
+            "chats": self.chats,
+            "messages": self.messages,
+            "archives": self.archives,
+            "transactions": self.transactions,
+            "max_txn_ms": round(self.maxTxnMs, 3),
+        }
+
+    def _stopping(self) -> bool:
+        return self._stop is not None and self._stop.is_set()
+
+    async def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                await self.purgeOnce()
+            except Exception as e:
+                logger.error(f"已删除会话清理出错: {e}", exc_info=True)
+            try:
+                await asyncio.wait_for(self._stop.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _sleep(self) -> None:
+        """事务之间的停顿 (关闭时立即返回)"""
+        if self._stop is None:
+            await asyncio.sleep(self.pause)
+            return
+        try:
+            await asyncio.wait_for(self._stop.wait(), timeout=self.pause)
+        except asyncio.TimeoutError:
+            pass
+
+    # ---------- 清理 ----------
+    async def purgeOnce(self) -> int:
+        """执行一轮：分批清理全部过了宽限期的已删除会话，返回清理的会话数"""
+        cutoff = await asyncio.to_thread(self._cutoff)
+        self.rounds += 1
+        self.pending = await asyncio.to_thread(self._count, cutoff)
+        if not self.pending:
+            return 0
+        logger.info(f"已删除会话清理: 待清理 {self.pending} 个会话")
+
+        start = time.perf_counter()
+        chats = messages = 0
+        while not self._stopping():
+            chat_ids = await asyncio.to_thread(self._candidates, cutoff)
+            if not chat_ids:
+                break
+            # 0. 认领：之后这些会话不能再恢复或追加消息
+            chat_ids = await asyncio.to_thread(self._claim, chat_ids, cutoff)
+            if not chat_ids:
+                continue
+            # 1. 分批删消息，每批一个短事务
+            while not self._stopping():
+                deleted = await asyncio.to_thread(self._deleteMessages, chat_ids)
+                if not deleted:
+                    break
+                messages += deleted
+                await self._sleep()
+            if self._stopping():
+                break
+            # 2. 消息删完，再删会话行
+            purged = await asyncio.to_thread(self._deleteChats, chat_ids)
+            for chat_id, creator_id in purged:
+                invalidate_chat(chat_id, creator_id)
+                chat_owner_cache.pop(chat_id)
+            chats += len(purged)
+            logger.info(f"已删除会话清理: {chats}/{self.pending} 个会话，{messages} 条消息")
+            await self._sleep()
+
+        logger.info(
+            f"已删除会话清理{'中断' if self._stopping() else '完成'}: "
+            f"{chats} 个会话，{messages} 条消息，耗时 {time.perf_counter() - start:.1f}s"
+        )
+        return chats
+
+    def _cutoff(self) -> datetime:
+        """宽限期的截止时间 (数据库时钟)"""
+        with self.sessionFactory() as db:
+            return db_now(db) - timedelta(days=self.graceDays)
+
+    def _count(self, cutoff: datetime) -> int:
+        with self.sessionFactory() as db:
+            return db.execute(select(func.count()).select_from(Chat).where(purgeable(cutoff))).scalar()
+
+    def _candidates(self, cutoff: datetime) -> List[int]:
+        with self.sessionFactory() as db:
+            return list(db.execute(
+                select(Chat.chat_id).where(purgeable(cutoff)).order_by(Chat.chat_id).limit(self.chatBatch)
+            ).scalars())
+
+    def _claim(self, chat_ids: List[int], cutoff: datetime) -> List[int]:
+        """
+        认领这批会话 (一个事务)：仍然已删除并过了宽限期的改成 is_deleted = 2，返回认领到的 chat_id
+        版本号加一，同时在恢复这个会话的 ORM 写入会版本冲突，重试时看到的已经是清理中
+        """
+        start = time.perf_counter()
+        with self.sessionFactory() as db:
+            try:
+                db.execute(
+                    update(Chat)
+                    .where(and_(Chat.chat_id.in_(chat_ids), expired(cutoff)))
+                    .values(is_deleted=CHAT_PURGING, version=Chat.version + 1)
+                )
+                claimed = list(db.execute(
+                    select(Chat.chat_id)
+                    .where(and_(Chat.chat_id.in_(chat_ids), Chat.is_deleted == CHAT_PURGING))
+                    .order_by(Chat.chat_id)
+                ).scalars())
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+        self._timed(start)
+        return claimed
+
+    def _lock(self, db: Session, chat_ids: List[int]) -> List[Tuple[int, int]]:
+        """在当前事务里重新确认这些会话仍在清理中 (MySQL 上加行锁)"""
+        return [tuple(r) for r in db.execute(
+            select(Chat.chat_id, Chat.creator_id)
+            .where(and_(Chat.chat_id.in_(chat_ids), Chat.is_deleted == CHAT_PURGING))
+            .with_for_update()
+        )]
+
+    def _timed(self, start: float) -> None:
+        self.transactions += 1
+        self.maxTxnMs = max(self.maxTxnMs, (time.perf_counter() - start) * 1000)
+
+    def _deleteMessages(self, chat_ids: List[int]) -> int:
+        """删除这批会话的最多 message_batch 条消息 (一个事务)，返回删除的条数"""
+        start = time.perf_counter()
+        with self.sessionFactory() as db:
+            try:
+                alive = [chat_id for chat_id, _ in self._lock(db, chat_ids)]
+                msg_ids = list(db.execute(
+                    select(ChatMessage.msg_id).where(ChatMessage.chat_id.in_(alive)).limit(self.messageBatch)
+                ).scalars()) if alive else []
+                if msg_ids:
+                    conn = db.connection()
+                    chat_search.remove_messages(conn, msg_ids)
+                    conn.execute(delete(ChatMessage).where(ChatMessage.msg_id.in_(msg_ids)))
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+        self._timed(start)
+        self.messages += len(msg_ids)
+        return len(msg_ids)
+
+    def _deleteChats(self, chat_ids: List[int]) -> List[Tuple[int, int]]:
+        """
+        删除会话行、冷存储和标题索引 (一个事务)，返回 [(chat_id, creator_id)]
+        认领之后不会再有新消息，保险起见剩下的消息也在这里一起删掉
+        """
+        start = time.perf_counter()
+        with self.sessionFactory() as db:
+            try:
+                rows = self._lock(db, chat_ids)
+                ids = [chat_id for chat_id, _ in rows]
+                if ids:
+                    conn = db.connection()
+                    chat_search.remove_chats(conn, ids)
+                    # 冷会话的消息不在 chat_message 里，FTS5 索引还留着，按冷存储里的 msg_id 删掉
+                    chat_search.remove_messages(conn, [
+                        m.msg_id for messages in load_cold_messages(conn, ids).values() for m in messages
+                    ])
+                    self.messages += conn.execute(delete(ChatMessage).where(ChatMessage.chat_id.in_(ids))).rowcount
+                    self.archives += conn.execute(delete(ChatArchive).where(ChatArchive.chat_id.in_(ids))).rowcount
+                    conn.execute(delete(Chat).where(Chat.chat_id.in_(ids)))
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+        self._timed(start)
+        self.chats += len(rows)
+        return rows
+
+
+chat_purger = ChatPurger(
+    graceDays=ConfigTool.getInt("purge", "grace_days", 30),
+    intervalSeconds=ConfigTool.getInt("purge", "interval_seconds", 3600),
+    chatBatch=ConfigTool.getInt("purge", "chat_batch", 100),
+    messageBatch=ConfigTool.getInt("purge", "message_batch", 1000),
+    pauseMs=ConfigTool.getInt("purge", "pause_ms", 100),
+    enabled=ConfigTool.getBoolean("purge", "enabled", False),
+)
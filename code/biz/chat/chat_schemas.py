@@ -16,6 +16,8 @@ from datetime import datetime
 # 0. 基础组件 (Message Item)
 # ==========================================
 class MessageItem(BaseModel):
+    # [新增] 消息 ID (chat_message.msg_id)，分页游标使用
+    msg_id: Optional[int] = None
     role: str = Field(..., description="user 或 assistant")
     content: str
     # [移除] model_name
@@ -26,6 +28,15 @@ class MessageItem(BaseModel):
     class Config:
         from_attributes = True
 
+class MessagePage(BaseModel):
+    """历史消息分页 (按 msg_id 升序)"""
+    messages: List[MessageItem] = []
+    # 是否还有更多 (before 方向为更早的消息，after 方向为更新的消息)
+    has_more: bool = False
+    # 游标：加载更早消息用 before_cursor，加载更新消息用 after_cursor
+    before_cursor: Optional[int] = None
+    after_cursor: Optional[int] = None
+
 # ==========================================
 # 1. 用户模块 (User)
 # ==========================================
@@ -62,18 +73,26 @@ class UserDisplay(BaseModel):
     class Config:
         from_attributes = True
 
+class LoginDisplay(UserDisplay):
+    """登录返回：用户信息 + 访问 token (之后的请求放在 Authorization: Bearer 头里)"""
+    access_token: str
+    token_type: str = "bearer"
+    expires_at: int
+
 # ==========================================
 # 2. 会话模块 (Chat)
 # ==========================================
 class ChatCreate(BaseModel):
     title: Optional[str] = None 
-    creator_id: int 
+    # 以登录用户为准，传了也会被覆盖
+    creator_id: Optional[int] = None 
     initial_message: Optional[str] = None 
 
 class ChatUpdate(BaseModel):
     title: Optional[str] = None
     is_pinned: Optional[int] = None   
-    is_deleted: Optional[int] = None  
+    # 只能改成 0 / 1 (2 是后台清理中的内部状态)
+    is_deleted: Optional[int] = Field(None, ge=0, le=1)
     is_archived: Optional[int] = None 
 
 class ChatDisplay(BaseModel):
@@ -84,6 +103,10 @@ class ChatDisplay(BaseModel):
     is_deleted: int
     is_archived: int
     messages_num: int
+    # 乐观锁版本号，会话每修改一次加一
+    version: int = 0
+    # 全部消息的 token 数之和
+    tokens_num: int = 0
     
     # [保持复数] messages
     messages: List[MessageItem] = [] 
@@ -94,6 +117,41 @@ class ChatDisplay(BaseModel):
     class Config:
         from_attributes = True
 
+class ChatSummary(BaseModel):
+    """会话列表项 (侧边栏)：不含消息，只带最后一条消息的预览"""
+    chat_id: int
+    title: str
+    creator_id: int
+    is_pinned: int
+    is_archived: int
+    messages_num: int
+    last_message: Optional[str] = ""
+    create_time: datetime
+    update_time: datetime
+
+    class Config:
+        from_attributes = True
+
+class ChatSummaryPage(BaseModel):
+    """会话列表分页"""
+    items: List[ChatSummary] = []
+    # 下一页游标，为空表示已经到底
+    next_cursor: Optional[str] = None
+
+class ChatBulkUpdate(ChatUpdate):
+    """批量更新：chat_ids 里的会话都改成同样的字段 (字段含义同 ChatUpdate)"""
+    chat_ids: List[int] = Field(..., min_length=1, max_length=1000)
+
+class ChatBulkCreate(BaseModel):
+    """批量创建会话"""
+    chats: List[ChatCreate] = Field(..., min_length=1, max_length=200)
+
+class ChatBulkResult(BaseModel):
+    """批量更新的结果"""
+    updated: List[int] = []
+    # 不存在或不属于当前用户的会话，没有修改
+    skipped: List[int] = []
+
 # ==========================================
 # 3. 发送消息 (输入)
 # ==========================================
@@ -102,4 +160,52 @@ class ChatMessageCreate(BaseModel):
     role: str
     content: str
     # [移除] model_name
-    data: Optional[Dict[str, Any]] = None
\ No newline at end of file
+    data: Optional[Dict[str, Any]] = None
+
+class MessageAppended(BaseModel):
+    """发送消息的增量返回：只包含新消息和会话的最新统计"""
+    chat_id: int
+    msg_id: int
+    message: MessageItem
+    messages_num: int
+    update_time: datetime
+
+# ==========================================
+# 3.1 全文搜索 (输出)
+# ==========================================
+class SearchHit(BaseModel):
+    """一条搜索结果：命中消息时带 msg_id，命中会话标题时 msg_id 为空"""
+    chat_id: int
+    chat_title: str
+    msg_id: Optional[int] = None
+    role: Optional[str] = None
+    # 命中位置附近的一段内容
+    snippet: str = ""
+    # 相关度，越大越相关 (不同后端的数值不可比较)
+    score: float
+    create_time: Optional[str] = None
+
+class SearchPage(BaseModel):
+    """搜索结果分页 (按相关度降序)"""
+    items: List[SearchHit] = []
+    # 下一页的 offset，为空表示已经到底
+    next_offset: Optional[int] = None
+
+# ==========================================
+# 4. AI 服务商 / 模型配置
+# ==========================================
+class AiProviderCreate(BaseModel):
+    provider_name: str
+    base_url: str = Field(..., description="OpenAI 兼容接口地址，例如 https://api.openai.com/v1")
+    api_key: str = ""
+    verified_status: Optional[int] = 0
+
+class AiModelCreate(BaseModel):
+    provider_id: int
+    model_name: str
+    model_id: str
+    max_tokens: int = 4096
+    has_vision: bool = False
+    source: int = 0
+    is_enabled: bool = True
+    temperature: float = 0.7
@@ -0,0 +1,528 @@
+"""
+Chat 模块的全文搜索 (Full-text Search)
+作用：按关键词找历史会话，不用再翻 GET /chats 列表，也不用对消息表做 LIKE 全表扫描。
+搜索范围是当前用户未删除的会话：消息内容 + 会话标题，按相关度排序，offset 分页。
+
+后端 (按数据库自动选择，[search] backend 可以强制使用 memory):
+    mysql   chat_message.content / chat.title 上的 FULLTEXT 索引 (WITH PARSER ngram)，InnoDB 自己维护
+    fts     SQLite FTS5 虚表 chat_message_fts / chat_title_fts，
+            写入消息、新建会话、改标题时 (ORM 事件) 在同一个事务里增量更新
+    memory  进程内倒排索引：每次搜索前按 msg_id 水位把新消息补进来，
+            没有 FULLTEXT / FTS5 时的兜底，只适合开发环境和小数据量
+            (不记录位置，多字词按 "二元组都出现" 匹配，比短语匹配宽松一些)
+
+中文：按二元组 (bigram) 切分，和 MySQL ngram_token_size=2 的行为一致，
+例如 "机器学习" 索引为 "机器 器学 学习 习"，搜索 "器学" / "学习" 都能命中；英文和数字按单词 (不区分大小写)。
+已有数据库在启动迁移时 (ensure_search_index) 建索引并补齐存量数据。
+冷存储里的会话 (见 chat_archive) 照样能搜到：FTS5 冷冻时保留索引，摘要从冷存储解压；
+mysql / memory 的索引只覆盖 chat_message，搜索时另外扫描当前用户的冷会话合并进结果 (排在热数据的最高分之后)。
+
+配置 ([search] 段):
+    backend      auto / memory (默认 auto)
+    snippet_len  结果里摘要的长度 (默认 80)
+"""
+import asyncio
+import math
+import re
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import event, inspect, select, text, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from biz.chat.db_models import Chat, ChatMessage
+from biz.chat.chat_schemas import SearchHit, SearchPage
+from tool.ConfigTool import ConfigTool
+from tool.db_session import logger
+
+BACKEND = ConfigTool.get("search", "backend", "auto")
+SNIPPET_LEN = ConfigTool.getInt("search", "snippet_len", 80)
+
+# 标题命中的权重 (相对于消息命中)
+TITLE_BOOST = 2.0
+# 补齐存量数据时每批的条数
+BACKFILL_BATCH = 1000
+
+
+# ==========================================
+# Area 1: 分词 (n-gram)
+# ==========================================
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff"
+# 一段连续的中日韩文字，或者一个单词 (其它 \w 字符)
+_RUN_RE = re.compile(f"[{_CJK}]+|(?:(?![{_CJK}])\\w)+")
+_CJK_RE = re.compile(f"[{_CJK}]")
+
+
+def _is_cjk(run: str) -> bool:
+    return bool(_CJK_RE.match(run))
+
+def _runs(content: str) -> List[str]:
+    return _RUN_RE.findall(content.lower())
+
+def index_tokens(content: str) -> List[str]:
+    """
+    写入索引的 token 序列
+    中文每段切成二元组，末尾再补一个单字 (让单字的前缀查询也能命中段尾)；单词原样
+    """
+    tokens: List[str] = []
+    for run in _runs(content):
+        if _is_cjk(run):
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+            tokens.append(run[-1])
+        else:
+            tokens.append(run)
+    return tokens
+
+def index_text(content: str) -> str:
+    """FTS5 里存的文本：空格分隔的 token，交给 unicode61 分词器按空格切开"""
+    return " ".join(index_tokens(content))
+
+def parse_query(q: str) -> List[str]:
+    """
+    把搜索词拆成若干段 (段与段之间是 AND)，每段是一段中文或一个单词
+    标点和特殊符号都会被丢掉，所以不用担心注入 MATCH 语法
+    """
+    return _runs(q)
+
+def _phrase_tokens(run: str) -> List[str]:
+    if _is_cjk(run) and len(run) > 1:
+        return [run[i:i + 2] for i in range(len(run) - 1)]
+    return [run]
+
+def fts_query(runs: List[str]) -> str:
+    """FTS5 的 MATCH 表达式：每段一个短语，单个汉字用前缀查询"""
+    parts = []
+    for run in runs:
+        if _is_cjk(run) and len(run) == 1:
+            parts.append(f'"{run}"*')
+        else:
+            parts.append('"' + " ".join(_phrase_tokens(run)) + '"')
+    return " ".join(parts)
+
+def mysql_query(runs: List[str]) -> str:
+    """MySQL BOOLEAN MODE 表达式：每段都必须出现 (短语由 ngram parser 自己切分)"""
+    parts = []
+    for run in runs:
+        if _is_cjk(run) and len(run) == 1:
+            parts.append(f"+{run}*")
+        else:
+            parts.append(f'+"{run}"')
+    return " ".join(parts)
+
+def make_snippet(content: str, runs: List[str], length: int = SNIPPET_LEN) -> str:
+    """截取第一个命中位置附近的一段作为摘要 (去掉换行)"""
+    flat = " ".join(content.split())
+    lowered = flat.lower()
+    positions = [p for p in (lowered.find(run) for run in runs) if p >= 0]
+    if not positions or len(flat) <= length:
+        return flat[:length]
+    start = max(0, min(positions) - length // 4)
+    end = min(len(flat), start + length)
+    start = max(0, end - length)
+    return ("…" if start > 0 else "") + flat[start:end] + ("…" if end < len(flat) else "")
+
+
+# ==========================================
+# Area 2: 建索引 / 增量更新
+# ==========================================
+_FTS_TABLES = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS chat_message_fts "
+    "USING fts5(body, chat_id UNINDEXED, tokenize='unicode61')",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS chat_title_fts "
+    "USING fts5(body, tokenize='unicode61')",
+)
+_MYSQL_INDEXES = (
+    ("chat_message", "content", "ft_chat_message_content"),
+    ("chat", "title", "ft_chat_title"),
+)
+_INSERT_MESSAGE = text("INSERT OR REPLACE INTO chat_message_fts (rowid, body, chat_id) VALUES (:id, :body, :chat_id)")
+_INSERT_TITLE = text("INSERT OR REPLACE INTO chat_title_fts (rowid, body) VALUES (:id, :body)")
+_DELETE_MESSAGE = text("DELETE FROM chat_message_fts WHERE rowid = :id")
+_DELETE_TITLE = text("DELETE FROM chat_title_fts WHERE rowid = :id")
+
+# 数据库 URL -> FTS5 虚表是否存在 (ORM 事件里每次写入都要判断，只查一次)
+_ftsReady: Dict[str, bool] = {}
+
+
+def _fts5_available(conn) -> bool:
+    try:
+        conn.exec_driver_sql("CREATE VIRTUAL TABLE IF NOT EXISTS temp._fts5_probe USING fts5(x)")
+        conn.exec_driver_sql("DROP TABLE temp._fts5_probe")
+        return True
+    except Exception:
+        return False
+
+def _fts_ready(conn) -> bool:
+    if conn.dialect.name != "sqlite":
+        return False
+    key = str(conn.engine.url)
+    ready = _ftsReady.get(key)
+    if ready is None:
+        ready = conn.exec_driver_sql(
+            "SELECT count(*) FROM sqlite_master WHERE name IN ('chat_message_fts', 'chat_title_fts')"
+        ).scalar() == 2
+        _ftsReady[key] = ready
+    return ready
+
+def _backfill_fts(conn) -> int:
+    """把还没进索引的消息和会话补进 FTS5 (按主键水位，可以重复执行)"""
+    filled = 0
+    while True:
+        mark = conn.exec_driver_sql("SELECT coalesce(max(rowid), 0) FROM chat_message_fts").scalar()
+        rows = conn.execute(
+            select(ChatMessage.msg_id, ChatMessage.chat_id, ChatMessage.content)
+            .where(ChatMessage.msg_id > mark)
+            .order_by(ChatMessage.msg_id)
+            .limit(BACKFILL_BATCH)
+        ).all()
+        if not rows:
+            break
+        conn.execute(_INSERT_MESSAGE, [
+            {"id": r.msg_id, "body": index_text(r.content), "chat_id": r.chat_id} for r in rows
+        ])
+        filled += len(rows)
+    while True:
+        mark = conn.exec_driver_sql("SELECT coalesce(max(rowid), 0) FROM chat_title_fts").scalar()
+        rows = conn.execute(
+            select(Chat.chat_id, Chat.title)
+            .where(Chat.chat_id > mark)
+            .order_by(Chat.chat_id)
+            .limit(BACKFILL_BATCH)
+        ).all()
+        if not rows:
+            break
+        conn.execute(_INSERT_TITLE, [{"id": r.chat_id, "body": index_text(r.title or "")} for r in rows])
+        filled += len(rows)
+    return filled
+
+def ensure_search_index(bind) -> None:
+    """
+    建全文索引并补齐存量数据 (启动迁移时调用，幂等)
+    MySQL 上给大表加 FULLTEXT 索引会比较久，只在第一次执行
+    """
+    if BACKEND == "memory":
+        return
+    with bind.begin() as conn:
+        if conn.dialect.name == "sqlite":
+            if not _fts5_available(conn):
+                logger.warning("SQLite 不支持 FTS5，全文搜索使用进程内索引")
+                return
+            for ddl in _FTS_TABLES:
+                conn.exec_driver_sql(ddl)
+            # 同一个文件可能还有别的 engine (异步驱动) 已经缓存了 "不存在"，全部重新判断
+            _ftsReady.clear()
+            _ftsReady[str(conn.engine.url)] = True
+            filled = _backfill_fts(conn)
+            if filled:
+                logger.info(f"全文索引补齐完成，共 {filled} 条")
+        elif conn.dialect.name == "mysql":
+            inspector = inspect(conn)
+            for table, column, name in _MYSQL_INDEXES:
+                if name not in {i["name"] for i in inspector.get_indexes(table)}:
+                    logger.info(f"正在创建全文索引 {name} (表 {table}，数据量大时需要一段时间)...")
+                    conn.exec_driver_sql(f"ALTER TABLE {table} ADD FULLTEXT INDEX {name} ({column}) WITH PARSER ngram")
+    _backends.clear()
+
+
+@event.listens_for(ChatMessage.__table__, "after_create")
+def _create_fts(target, conn, **kw):
+    """新库 create_all 时顺带建 FTS5 虚表 (只对 SQLite)"""
+    if BACKEND != "memory" and conn.dialect.name == "sqlite" and _fts5_available(conn):
+        for ddl in _FTS_TABLES:
+            conn.exec_driver_sql(ddl)
+        _ftsReady[str(conn.engine.url)] = True
+
+@event.listens_for(ChatMessage, "after_insert")
+def _index_message(mapper, conn, target):
+    if _fts_ready(conn):
+        conn.execute(_INSERT_MESSAGE, {"id": target.msg_id, "body": index_text(target.content), "chat_id": target.chat_id})
+
+@event.listens_for(Chat, "after_insert")
+def _index_new_chat(mapper, conn, target):
+    if _fts_ready(conn):
+        conn.execute(_INSERT_TITLE, {"id": target.chat_id, "body": index_text(target.title or "")})
+
+@event.listens_for(Chat, "after_update")
+def _index_chat_title(mapper, conn, target):
+    if _fts_ready(conn) and inspect(target).attrs.title.history.has_changes():
+        conn.execute(_INSERT_TITLE, {"id": target.chat_id, "body": index_text(target.title or "")})
+
+def remove_chats(conn, chat_ids: List[int]) -> None:
+    """
+    物理删除会话时调用 (同一个连接 / 事务里)，把它们从 FTS5 索引里删掉
+    (只处理 chat_message 里的消息，冷会话的由调用方按冷存储里的 msg_id 删除)
+    MySQL 的 FULLTEXT 随行删除；进程内索引整个丢弃，下次搜索时重建
+    """
+    if chat_ids:
+        _memoryIndexes.clear()
+    if not chat_ids or not _fts_ready(conn):
+        return
+    msg_ids = [m for (m,) in conn.execute(select(ChatMessage.msg_id).where(ChatMessage.chat_id.in_(chat_ids)))]
+    remove_messages(conn, msg_ids)
+    conn.execute(_DELETE_TITLE, [{"id": c} for c in chat_ids])
+
+def index_titles(conn, rows: List[Tuple[int, str]]) -> None:
+    """Core 语句新建 / 改名的会话不会触发 ORM 事件，由调用方在同一个事务里更新标题索引"""
+    if not rows or not _fts_ready(conn):
+        return
+    conn.execute(_INSERT_TITLE, [{"id": chat_id, "body": index_text(title or "")} for chat_id, title in rows])
+
+def index_messages(conn, rows: List[Dict]) -> None:
+    """
+    Core 批量插入的消息不会触发 ORM 事件，由调用方在同一个事务里补进 FTS5
+    rows: [{"msg_id", "chat_id", "content"}, ...]
+    """
+    if not rows or not _fts_ready(conn):
+        return
+    for i in range(0, len(rows), BACKFILL_BATCH):
+        conn.execute(_INSERT_MESSAGE, [
+            {"id": r["msg_id"], "body": index_text(r["content"]), "chat_id": r["chat_id"]}
+            for r in rows[i:i + BACKFILL_BATCH]
+        ])
+
+def remove_messages(conn, msg_ids: List[int]) -> None:
+    """把消息从 FTS5 索引里删掉 (消息行被删除或搬走时，同一个事务里调用)"""
+    if not msg_ids or not _fts_ready(conn):
+        return
+    for i in range(0, len(msg_ids), BACKFILL_BATCH):
+        conn.execute(_DELETE_MESSAGE, [{"id": m} for m in msg_ids[i:i + BACKFILL_BATCH]])
+
+
+# ==========================================
+# Area 3: 进程内索引 (兜底)
+# ==========================================
+class MemoryIndex:
+    """
+    倒排索引：token -> {msg_id: 词频}，按 BM25 打分
+    只增不删：被删除的消息在取详情时过滤掉
+    """
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.docs: Dict[int, Tuple[int, int]] = {}    # msg_id -> (chat_id, token 数)
+        self.totalLen = 0
+        self.watermark = 0                             # 已索引的最大 msg_id
+        self._lock: Optional[asyncio.Lock] = None
+
+    def add(self, msg_id: int, chat_id: int, content: str) -> None:
+        tokens = index_tokens(content)
+        # 每个汉字单独也进索引，单字查询不用扫描整个词表
+        tokens += [t[0] for t in tokens if len(t) == 2 and _is_cjk(t)]
+        counts: Dict[str, int] = {}
+        for t in tokens:
+            counts[t] = counts.get(t, 0) + 1
+        for t, n in counts.items():
+            self.postings.setdefault(t, {})[msg_id] = n
+        self.docs[msg_id] = (chat_id, len(tokens))
+        self.totalLen += len(tokens)
+        self.watermark = max(self.watermark, msg_id)
+
+    async def catch_up(self, db: AsyncSession) -> None:
+        """把水位之后的新消息 (包括别的 worker 写入的) 补进来"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                rows = (await db.execute(
+                    select(ChatMessage.msg_id, ChatMessage.chat_id, ChatMessage.content)
+                    .where(ChatMessage.msg_id > self.watermark)
+                    .order_by(ChatMessage.msg_id)
+                    .limit(BACKFILL_BATCH)
+                )).all()
+                if not rows:
+                    return
+                for r in rows:
+                    self.add(r.msg_id, r.chat_id, r.content)
+
+    def search(self, runs: List[str], chat_ids: Set[int]) -> List[Tuple[int, int, float]]:
+        """返回 [(msg_id, chat_id, score)]，只保留 chat_ids 里的会话，按分数降序"""
+        tokens = [t for run in runs for t in _phrase_tokens(run)]
+        lists = [self.postings.get(t, {}) for t in tokens]
+        if not lists or not all(lists):
+            return []
+        # 所有 token 都出现的消息 (从最短的倒排表开始求交集)
+        candidates = set(min(lists, key=len))
+        for plist in lists:
+            candidates &= plist.keys()
+        n = len(self.docs)
+        avgLen = self.totalLen / n if n else 1
+        hits = []
+        for msg_id in candidates:
+            chat_id, length = self.docs[msg_id]
+            if chat_id not in chat_ids:
+                continue
+            score = 0.0
+            for plist in lists:
+                tf = plist[msg_id]
+                idf = math.log(1 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+                score += idf * tf * (self.K1 + 1) / (tf + self.K1 * (1 - self.B + self.B * length / avgLen))
+            hits.append((msg_id, chat_id, score))
+        hits.sort(key=lambda h: (-h[2], -h[0]))
+        return hits
+
+
+# 数据库 URL -> 进程内索引
+_memoryIndexes: Dict[str, MemoryIndex] = {}
+# 数据库 URL -> 使用的后端
+_backends: Dict[str, str] = {}
+
+
+# ==========================================
+# Area 4: 搜索
+# ==========================================
+_FTS_SEARCH = text("""
+    SELECT f.rowid AS msg_id, c.chat_id AS chat_id, -bm25(chat_message_fts) AS score
+    FROM chat_message_fts f JOIN chat c ON c.chat_id = f.chat_id
+    WHERE chat_message_fts MATCH :q AND c.creator_id = :uid AND c.is_deleted = 0
+    UNION ALL
+    SELECT NULL, c.chat_id, -bm25(chat_title_fts) * :boost
+    FROM chat_title_fts t JOIN chat c ON c.chat_id = t.rowid
+    WHERE chat_title_fts MATCH :q AND c.creator_id = :uid AND c.is_deleted = 0
+    ORDER BY score DESC, msg_id DESC
+    LIMIT :limit OFFSET :offset
+""")
+
+_MYSQL_SEARCH = text("""
+    SELECT m.msg_id AS msg_id, m.chat_id AS chat_id,
+           MATCH(m.content) AGAINST(:q IN BOOLEAN MODE) AS score
+    FROM chat_message m JOIN chat c ON c.chat_id = m.chat_id
+    WHERE MATCH(m.content) AGAINST(:q IN BOOLEAN MODE) AND c.creator_id = :uid AND c.is_deleted = 0
+    UNION ALL
+    SELECT NULL, c.chat_id, MATCH(c.title) AGAINST(:q IN BOOLEAN MODE) * :boost
+    FROM chat c
+    WHERE MATCH(c.title) AGAINST(:q IN BOOLEAN MODE) AND c.creator_id = :uid AND c.is_deleted = 0
+    ORDER BY score DESC, msg_id DESC
+    LIMIT :limit OFFSET :offset
+""")
+
+
+def _detect_backend(conn) -> str:
+    if BACKEND == "memory":
+        return "memory"
+    if conn.dialect.name == "sqlite":
+        return "fts" if _fts_ready(conn) else "memory"
+    if conn.dialect.name == "mysql":
+        names = {i["name"] for i in inspect(conn).get_indexes("chat_message")}
+        names |= {i["name"] for i in inspect(conn).get_indexes("chat")}
+        if all(name in names for _, _, name in _MYSQL_INDEXES):
+            return "mysql"
+    return "memory"
+
+async def _backend(db: AsyncSession) -> str:
+    key = str(db.bind.url)
+    backend = _backends.get(key)
+    if backend is None:
+        conn = await db.connection()
+        backend = _backends[key] = await conn.run_sync(_detect_backend)
+        logger.info(f"全文搜索使用 {backend} 后端")
+    return backend
+
+async def _memory_search(db: AsyncSession, runs: List[str], user_id: int) -> List[Tuple[Optional[int], int, float]]:
+    """进程内索引：消息命中 + 标题命中 (标题直接在用户自己的会话里匹配)"""
+    index = _memoryIndexes.setdefault(str(db.bind.url), MemoryIndex())
+    await index.catch_up(db)
+    chats = (await db.execute(
+        select(Chat.chat_id, Chat.title).where(and_(Chat.creator_id == user_id, Chat.is_deleted == 0))
+    )).all()
+    hits: List[Tuple[Optional[int], int, float]] = list(index.search(runs, {c.chat_id for c in chats}))
+    top = hits[0][2] if hits else 1.0
+    for c in chats:
+        title = (c.title or "").lower()
+        if all(run in title for run in runs):
+            hits.append((None, c.chat_id, top * TITLE_BOOST))
+    hits.sort(key=lambda h: (-h[2], -(h[0] or 0)))
+    return hits
+
+def _scan_cold(conn, runs: List[str], user_id: int) -> List[Tuple[int, int, int]]:
+    """在 user_id 未删除的冷会话里逐条匹配 (所有段都出现)，返回 [(msg_id, chat_id, 出现次数)]"""
+    from biz.chat.chat_archive import load_cold_messages  # chat_archive 引用了本模块，用到时再导入
+    chat_ids = [c for (c,) in conn.execute(
+        select(Chat.chat_id).where(and_(Chat.creator_id == user_id, Chat.is_deleted == 0, Chat.is_cold == 1))
+    )]
+    hits = []
+    for chat_id, messages in load_cold_messages(conn, chat_ids).items():
+        for m in messages:
+            content = m.content.lower()
+            if all(run in content for run in runs):
+                hits.append((m.msg_id, chat_id, sum(content.count(run) for run in runs)))
+    return hits
+
+async def _with_cold_hits(db: AsyncSession, hits: List[Tuple[Optional[int], int, float]], runs: List[str], user_id: int):
+    """
+    mysql / memory 后端：把冷会话里的命中合并进 hits (已在 hits 里的 msg_id 不重复)
+    分数不可比，冷会话的命中按出现次数排在热数据的最高分之后
+    """
+    cold = await db.run_sync(lambda s: _scan_cold(s.connection(), runs, user_id))
+    if not cold:
+        return hits
+    seen = {h[0] for h in hits if h[0] is not None}
+    top = max((h[2] for h in hits), default=1.0)
+    hits = hits + [(msg_id, chat_id, top * n / (n + 1)) for msg_id, chat_id, n in cold if msg_id not in seen]
+    hits.sort(key=lambda h: (-h[2], -(h[0] or 0)))
+    return hits
+
+async def search(db: AsyncSession, user_id: int, q: str, offset: int = 0, limit: int = 20) -> SearchPage:
+    """
+    在 user_id 自己未删除的会话里搜索 q
+    返回一页按相关度降序的结果；还有下一页时 next_offset 不为空
+    """
+    runs = parse_query(q)
+    if not runs:
+        return SearchPage(items=[])
+
+    backend = await _backend(db)
+    params = {"uid": user_id, "boost": TITLE_BOOST, "limit": limit + 1, "offset": offset}
+    if backend == "fts":
+        rows = [tuple(r) for r in await db.execute(_FTS_SEARCH, {**params, "q": fts_query(runs)})]
+    else:
+        if backend == "mysql":
+            # 要和冷会话的命中一起排序，先取到这一页为止的全部结果
+            params.update(limit=offset + limit + 1, offset=0)
+            hits = [tuple(r) for r in await db.execute(_MYSQL_SEARCH, {**params, "q": mysql_query(runs)})]
+        else:
+            hits = await _memory_search(db, runs, user_id)
+        rows = (await _with_cold_hits(db, hits, runs, user_id))[offset:offset + limit + 1]
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    # 取命中消息的内容 (做摘要) 和会话标题
+    msg_ids = [r[0] for r in rows if r[0] is not None]
+    messages = {}
+    if msg_ids:
+        result = await db.execute(
+            select(ChatMessage.msg_id, ChatMessage.role, ChatMessage.content, ChatMessage.create_time)
+            .where(ChatMessage.msg_id.in_(msg_ids))
+        )
+        messages = {m.msg_id: m for m in result}
+    # chat_message 里没有的：冷会话的消息，从冷存储里取
+    cold_chats = {r[1] for r in rows if r[0] is not None and r[0] not in messages}
+    if cold_chats:
+        from biz.chat.chat_archive import load_cold_messages
+        cold = await db.run_sync(lambda s: load_cold_messages(s.connection(), list(cold_chats)))
+        wanted = set(msg_ids)
+        messages.update({m.msg_id: m for chat in cold.values() for m in chat if m.msg_id in wanted})
+    chat_ids = {r[1] for r in rows}
+    titles = {}
+    if chat_ids:
+        result = await db.execute(select(Chat.chat_id, Chat.title).where(Chat.chat_id.in_(chat_ids)))
+        titles = {c.chat_id: c.title or "" for c in result}
+
+    items = []
+    for msg_id, chat_id, score in rows:
+        title = titles.get(chat_id)
+        if title is None:
+            continue
+        if msg_id is None:
+            items.append(SearchHit(chat_id=chat_id, chat_title=title, snippet=make_snippet(title, runs), score=score))
+            continue
+        m = messages.get(msg_id)
+        if m is None:
+            # 索引里还有，但消息已经被删除 (进程内索引)
+            continue
+        items.append(SearchHit(
+            chat_id=chat_id, chat_title=title, msg_id=msg_id, role=m.role,
+            snippet=make_snippet(m.content, runs), score=score, create_time=m.create_time,
+        ))
+    return SearchPage(items=items, next_offset=offset + limit if has_more else None)
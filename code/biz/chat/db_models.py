@@ -1,15 +1,31 @@
 # 专门管'表结构'。定义 ChatMessage 表长什么样。
 
 """
-数据库表模型 包含 User, ChatSession, ChatMessage 三张表及其关联
+数据库表模型 包含 User, RevokedToken, Chat, ChatMessage 以及 AI 服务商 / 模型配置表
 数据层 (Data Structure)
 作用：它是数据库的“蓝图”。
 为什么独立：它只关心数据库结构。如果以后要换数据库或改表结构，只改这一个文件。
 """
-from sqlalchemy import Column, Integer, String, SmallInteger, DateTime, BigInteger, JSON
+from sqlalchemy import Column, Integer, String, SmallInteger, DateTime, BigInteger, JSON, Text, Index, Boolean, Float, LargeBinary
+from sqlalchemy.dialects.mysql import LONGBLOB
+from sqlalchemy.dialects.sqlite import DATETIME as SQLITE_DATETIME
+from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from tool.db_session import Base
 
+# 自增主键类型: MySQL 用 bigint，SQLite 只有 INTEGER PRIMARY KEY 才会自增
+BigIntId = BigInteger().with_variant(Integer, "sqlite")
+
+# 会话时间类型: SQLite 按 CURRENT_TIMESTAMP 的格式存取 (不带微秒)，
+# 保证 func.now() 写入的值和游标参数可以按字符串正确比较
+ChatTime = DateTime(timezone=True).with_variant(
+    SQLITE_DATETIME(storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d"),
+    "sqlite"
+)
+
+# 压缩后的消息块: MySQL 的 BLOB 只有 64KB，长会话要用 LONGBLOB
+ArchiveBlob = LargeBinary().with_variant(LONGBLOB(), "mysql")
+
 # ==========================================
 # 1. 用户表 (User) - V3新版
 # ==========================================
@@ -17,7 +33,7 @@ class User(Base):
     __tablename__ = "user"
 
     # 主键 uid: bigint(20)
-    uid = Column(BigInteger, primary_key=True, index=True, autoincrement=True)
+    uid = Column(BigIntId, primary_key=True, index=True, autoincrement=True)
     
     # 核心身份
     user_name = Column(String(255), unique=True, index=True, nullable=False)
@@ -52,6 +68,20 @@ class User(Base):
     last_login_time = Column(DateTime(timezone=True))
 
 
+# ==========================================
+# 1.1 已吊销的 token (RevokedToken) - 注销记录
+# ==========================================
+class RevokedToken(Base):
+    __tablename__ = "revoked_token"
+
+    # token 里的随机 ID (见 chat_auth.issue_token)
+    jti = Column(String(32), primary_key=True)
+    uid = Column(BigInteger, nullable=False)
+
+    # token 本身的过期时间戳，过期后这一行就没用了，注销时顺手清理
+    expires_at = Column(BigInteger, nullable=False, index=True)
+
+
 # ==========================================
 # 2. 聊天表 (Chat) - V3新版 (JSON存储)
 # ==========================================
@@ -59,24 +89,162 @@ class Chat(Base):
     __tablename__ = "chat"
 
     # chat_id: bigint(20)
-    chat_id = Column(BigInteger, primary_key=True, index=True, autoincrement=True)
+    chat_id = Column(BigIntId, primary_key=True, index=True, autoincrement=True)
     
     # 基础信息
     title = Column(String(255), default="新会话")
     creator_id = Column(BigInteger, index=True, nullable=False) # 关联 User.uid
     
-    # 核心数据: messages (JSON 类型)
+    # [旧] messages (JSON 类型)，仅用于迁移历史数据
     # 存储: [{role, content, create_time...}, ...]
-    messages = Column(JSON, default=list) 
+    # 迁移到 chat_message 表后清空，不再写入
+    messages_json = Column("messages", JSON, default=list)
+
+    # 核心数据: messages (来自 chat_message 表，按 msg_id 升序)
+    # ChatDisplay 依然通过 chat.messages 读取，接口形状不变
+    messages = relationship(
+        "ChatMessage",
+        order_by="ChatMessage.msg_id",
+        primaryjoin="Chat.chat_id == foreign(ChatMessage.chat_id)",
+        viewonly=True,
+    )
     
     # 状态标记 (严格使用 Integer/SmallInteger)
     is_pinned = Column(SmallInteger, default=0)   # 1-置顶, 0-正常
     is_deleted = Column(SmallInteger, default=0)  # 1-已删除, 0-正常
     is_archived = Column(SmallInteger, default=0) # 1-归档
+    # 1-消息已经压缩搬到 chat_archive (冷存储)，chat_message 里没有这个会话的行
+    # 读取时透明解压，追加消息或取消归档时搬回 (见 chat_archive)
+    is_cold = Column(SmallInteger, nullable=False, default=0, server_default="0")
     
     # 统计
     messages_num = Column(Integer, default=0)
+    # 最后一条消息的预览 (写入时截断保存，会话列表不用再读消息表)
+    last_message = Column(String(255), default="")
+    # 全部消息的 token 数之和 (即下一条消息的 token_offset)
+    tokens_num = Column(BigInteger, nullable=False, default=0, server_default="0")
+
+    # 乐观锁版本号：每次修改会话行加一
+    # ORM 更新会自动带上 WHERE version = 旧值，被别人抢先改过时抛 StaleDataError (见 chat_crud_async 的重试)
+    # 用 Core update() 直接改会话的地方要自己写 version = Chat.version + 1
+    version = Column(Integer, nullable=False, default=0, server_default="0")
+
+    # 时间
+    create_time = Column(ChatTime, server_default=func.now())
+    update_time = Column(ChatTime, server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        # 会话列表: WHERE creator_id = ? AND is_deleted = 0
+        #           ORDER BY is_pinned DESC, update_time DESC, chat_id DESC
+        # 覆盖过滤和排序，分页时不需要再额外排序
+        Index("ix_chat_creator_list", "creator_id", "is_deleted", "is_pinned", "update_time", "chat_id"),
+        # SQLite 默认会把删掉的最大 ID 再分配出去：清理 (chat_purge) 物理删除会话后，
+        # 其他 worker 里缓存的归属 (chat_owner_cache) 会落到别人的新会话上。AUTOINCREMENT 保证 ID 不复用
+        {"sqlite_autoincrement": True},
+    )
+    __mapper_args__ = {"version_id_col": version}
+
+
+# ==========================================
+# 3. 消息表 (ChatMessage) - 追加写入
+# ==========================================
+class ChatMessage(Base):
+    __tablename__ = "chat_message"
+
+    # msg_id: bigint(20)，自增即消息顺序
+    msg_id = Column(BigIntId, primary_key=True, autoincrement=True)
+
+    # 所属会话 (关联 Chat.chat_id)
+    chat_id = Column(BigInteger, nullable=False)
+
+    # 消息内容
+    role = Column(String(32), nullable=False)  # 'user' 或 'assistant'
+    content = Column(Text, nullable=False)
+    # 写入时计算一次 (TokenTool.countMessage，包含格式开销)
+    token_count = Column(Integer, default=0)
+    # 前缀和：本会话里这条消息之前所有消息的 token 数之和
+    # 构造上下文时 "最新的若干条放得进 N 个 token" 就是 token_offset >= 总数 - N，不用重新分词
+    token_offset = Column(BigInteger, nullable=False, default=0, server_default="0")
+    data = Column(JSON, nullable=True)
+
+    # 时间 (秒级时间戳字符串，与 MessageItem.create_time 保持一致)
+    create_time = Column(String(20), nullable=False)
+
+    __table_args__ = (
+        # 按会话顺序读取: WHERE chat_id = ? ORDER BY msg_id
+        Index("ix_chat_message_chat_msg", "chat_id", "msg_id"),
+        # 按 token 预算截取上下文: WHERE chat_id = ? AND token_offset >= ?
+        Index("ix_chat_message_chat_tokens", "chat_id", "token_offset"),
+        # msg_id 不复用 (同 Chat)：分页游标、进程内搜索索引的水位线、冷存储搬回的消息都依赖它
+        {"sqlite_autoincrement": True},
+    )
+
+
+# ==========================================
+# 3.1 冷存储表 (ChatArchive) - 归档会话的消息
+# ==========================================
+class ChatArchive(Base):
+    __tablename__ = "chat_archive"
+
+    # 一个会话一行 (关联 Chat.chat_id)
+    chat_id = Column(BigInteger, primary_key=True, autoincrement=False)
+
+    # 会话全部消息 (按 msg_id 升序) 序列化成 JSON 数组后压缩
+    # 每条保留 msg_id / token_offset 等全部字段，搬回 chat_message 时原样恢复
+    codec = Column(String(16), nullable=False)        # zstd / zlib，解压时按这一列选择
+    blob = Column(ArchiveBlob, nullable=False)
+    raw_size = Column(BigInteger, nullable=False)     # 压缩前的字节数
+    messages_num = Column(Integer, nullable=False)
+
+    create_time = Column(DateTime(timezone=True), server_default=func.now())
+
+
+# ==========================================
+# 4. AI 服务商表 (AiProviderConfig)
+# ==========================================
+class AiProviderConfig(Base):
+    __tablename__ = "ai_provider_config"
+
+    id = Column(BigIntId, primary_key=True, autoincrement=True)
+
+    # 归属: 0 表示系统级 (所有人可见)，否则为 User.uid
+    user_id = Column(BigInteger, default=0, index=True)
+
+    # OpenAI 兼容接口
+    provider_name = Column(String(128), nullable=False)
+    base_url = Column(String(512), nullable=False)       # 例如 https://api.openai.com/v1
+    api_key_encrypted = Column(String(512), default="")  # 目前直接存明文 (见 ai_crud)
+
+    # 状态
+    is_enabled = Column(Boolean, default=True)
+    verified_status = Column(SmallInteger, default=0)    # 0 未验证, 1 可用, 2 失败
+
+    # 时间
+    create_time = Column(DateTime(timezone=True), server_default=func.now())
+    update_time = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+# ==========================================
+# 5. AI 模型表 (AiModelConfig)
+# ==========================================
+class AiModelConfig(Base):
+    __tablename__ = "ai_model_config"
+
+    id = Column(BigIntId, primary_key=True, autoincrement=True)
+
+    # 所属服务商 (关联 AiProviderConfig.id)
+    provider_id = Column(BigInteger, nullable=False, index=True)
+
+    model_name = Column(String(128), nullable=False)  # 展示名
+    model_id = Column(String(128), nullable=False)    # 调用上游时使用的模型 ID
+    max_tokens = Column(Integer, default=4096)        # 上下文窗口
+    has_vision = Column(Boolean, default=False)
+    temperature = Column(Float, default=0.7)
+
+    # 状态
+    source = Column(SmallInteger, default=0)          # 0 手动添加, 1 自动同步
+    is_enabled = Column(Boolean, default=True)
 
     # 时间
     create_time = Column(DateTime(timezone=True), server_default=func.now())
-    update_time = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
\ No newline at end of file
+    update_time = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
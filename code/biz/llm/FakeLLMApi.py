@@ -1,6 +1,7 @@
-from fastapi import Request
+from fastapi import HTTPException, Request
 from fastapi.responses import StreamingResponse
-from tool.LLMTool import LLMTool
+from tool.LLMTool import LLMTool, StreamEncoder
+from tool.ConfigTool import ConfigTool
 
 from fastapi import APIRouter
 
@@ -27,16 +28,53 @@ text_poem = """
 chart_start{"shape":"bar","data":{"label":["Mon","Tue","Wed","Thu","Fri","Sat","Sun"],"value":[120,200,150,80,70,110,130]}}chart_end
 """.strip()
 
-async def fakeLLMGen(text=text_poem):
-    # 逐字符流式返回
-    async for chunk in LLMTool.putChar(text):
+# 合并策略默认值 ([llm] 段)，0 表示关闭 (逐字符一帧)
+COALESCE_MS = ConfigTool.getInt("llm", "coalesce_ms", 0)
+COALESCE_CHARS = ConfigTool.getInt("llm", "coalesce_chars", 0)
+
+async def fakeLLMGen(text=text_poem, flushMs=0, maxChars=0):
+    # 每个流只创建一次编码器，固定部分预先渲染好
+    encoder = StreamEncoder()
+    if flushMs > 0 or maxChars > 0:
+        # 按时间窗口 / 字符数合并后返回
+        gen = LLMTool.putCoalesced(text, flushMs=flushMs, maxChars=maxChars, encoder=encoder)
+    else:
+        # 逐字符流式返回
+        gen = LLMTool.putChar(text, encoder=encoder)
+    async for chunk in gen:
         yield chunk
-    async for chunk in LLMTool.putEnd():
+    async for chunk in LLMTool.putEnd(encoder=encoder):
         yield chunk
 
+async def getChunkPolicy(request: Request):
+    """
+    每个请求可以单独指定合并策略：
+    请求体 stream_options 里的 coalesce_ms / coalesce_chars，不传则使用配置默认值
+    取值不是非负整数时返回 400
+    """
+    options = {}
+    try:
+        body = await request.json()
+        if isinstance(body, dict) and isinstance(body.get("stream_options"), dict):
+            options = body["stream_options"]
+    except Exception:
+        pass
+    policy = []
+    for key, default in (("coalesce_ms", COALESCE_MS), ("coalesce_chars", COALESCE_CHARS)):
+        try:
+            value = int(options.get(key, default) or 0)
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail=f"stream_options.{key} 必须是整数")
+        if value < 0:
+            raise HTTPException(status_code=400, detail=f"stream_options.{key} 不能为负数")
+        policy.append(value)
+    flushMs, maxChars = policy
+    return flushMs, maxChars
+
 @router.post("/v1/chat/completions")
 async def fakeLLMStream(request: Request):
-    return StreamingResponse(fakeLLMGen(), media_type="text/plain")
+    flushMs, maxChars = await getChunkPolicy(request)
+    return StreamingResponse(fakeLLMGen(flushMs=flushMs, maxChars=maxChars), media_type="text/plain")
 
 
 @router.get('/v1/models')
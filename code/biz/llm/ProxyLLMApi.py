@@ -0,0 +1,163 @@
+"""
+OpenAI 兼容的补全代理
+根据请求里的 model 在注册表 (ai_registry) 里找到配置的服务商，
+用共享的 HttpTool 连接池把请求转发过去，并把上游的响应 (包括 SSE 流) 透传回来 (上游压缩过的响应先解压)。
+
+本地调试时可以把服务商的 base_url 配成 http://127.0.0.1:5800/fakeLLM/v1，用假模型当上游。
+
+扩展字段 chat_id：请求体里带上 chat_id 时，由服务端从该会话的历史里拼上下文，
+取最新的、放得进模型上下文窗口 (AiModelConfig.max_tokens) 的若干条消息，
+预算 = max_tokens - 回复预留 (请求里的 max_tokens，或 [llm_proxy] context_reserve_tokens) - 请求里自带的消息。
+请求里的 system 消息放在最前，其他消息 (比如还没保存的本轮提问) 接在历史后面。
+"""
+import json
+from typing import Dict, List, Tuple
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+import httpx
+
+from biz.chat import ai_registry
+from biz.chat import chat_crud_async as chat_crud
+from biz.chat.chat_auth import get_current_user, require_chat_owner
+from biz.chat.chat_schemas import UserDisplay
+from tool.ConfigTool import ConfigTool
+from tool.db_session import get_async_db
+from tool.HttpTool import HttpTool
+from tool.LogTool import LogTool
+from tool.TokenTool import TokenTool
+
+log = LogTool.getLog(__name__)
+
+router = APIRouter(prefix="/llm", tags=["LLM Proxy"])
+
+# 透传给客户端的上游响应头
+PASS_HEADERS = ("content-type", "x-request-id", "openai-processing-ms")
+
+# 请求里没有 max_tokens 时，给回复预留的 token 数
+CONTEXT_RESERVE = ConfigTool.getInt("llm_proxy", "context_reserve_tokens", 1024)
+
+
+def _countMessage(message: Dict) -> int:
+    content = message.get("content")
+    if not isinstance(content, str):
+        # 多模态消息 (content 是列表) 按 JSON 文本粗略估算
+        content = json.dumps(content, ensure_ascii=False) if content else ""
+    return TokenTool.countMessage(content)
+
+
+async def buildContext(db: AsyncSession, chat_id: int, body: Dict, contextWindow: int) -> Tuple[List[Dict], int]:
+    """
+    用会话历史拼出发给上游的 messages
+    历史消息的 token 数写入时已经算好，这里只对请求里自带的消息计数
+    返回: (messages, 预计的 token 总数)
+    """
+    extra = [m for m in body.get("messages") or [] if isinstance(m, dict)]
+    system = [m for m in extra if m.get("role") == "system"]
+    turn = [m for m in extra if m.get("role") != "system"]
+    used = sum(_countMessage(m) for m in extra)
+    reserve = body.get("max_tokens") or CONTEXT_RESERVE
+    budget = max(0, contextWindow - reserve - used)
+
+    history = await chat_crud.get_context_messages(db, chat_id, budget)
+    messages = system + [{"role": m.role, "content": m.content} for m in history] + turn
+    return messages, used + sum(m.token_count for m in history)
+
+
+@router.post("/v1/chat/completions")
+async def proxyCompletions(
+    request: Request,
+    current_user: UserDisplay = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    try:
+        body = await request.json()
+    except Exception:
+        raise HTTPException(status_code=400, detail="请求体必须是 JSON")
+    if not isinstance(body, dict) or not body.get("model"):
+        raise HTTPException(status_code=400, detail="缺少 model")
+    maxTokens = body.get("max_tokens")
+    if maxTokens is not None and (isinstance(maxTokens, bool) or not isinstance(maxTokens, int) or maxTokens <= 0):
+        raise HTTPException(status_code=400, detail="max_tokens 必须是正整数")
+
+    resolved = await ai_registry.resolve_model(db, body["model"], current_user.uid)
+    if not resolved:
+        raise HTTPException(status_code=404, detail=f"模型不存在或未启用: {body['model']}")
+    model, provider = resolved
+
+    contextHeaders = {}
+    chat_id = body.pop("chat_id", None)
+    if chat_id is not None:
+        try:
+            chat_id = int(chat_id)
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="chat_id 必须是整数")
+        await require_chat_owner(db, chat_id, current_user)
+        body["messages"], tokens = await buildContext(db, chat_id, body, model.max_tokens)
+        contextHeaders = {"X-Context-Messages": str(len(body["messages"])), "X-Context-Tokens": str(tokens)}
+
+    # 数据库只在转发前用到：流式输出可能持续几分钟，先把连接还给连接池
+    await db.close()
+
+    client = await HttpTool.getClient(provider.base_url.rstrip("/"))
+    headers = {"Content-Type": "application/json"}
+    if provider.api_key:
+        headers["Authorization"] = f"Bearer {provider.api_key}"
+    upstreamReq = client.build_request(
+        "POST", "/chat/completions",
+        content=json.dumps(dict(body, model=model.model_id), ensure_ascii=False).encode("utf-8"),
+        headers=headers,
+    )
+
+    try:
+        upstream = await client.send(upstreamReq, stream=True)
+    except httpx.TimeoutException as e:
+        log.warning(f"上游超时 {provider.provider_name}: {e}")
+        raise HTTPException(status_code=504, detail="上游服务超时")
+    except httpx.HTTPError as e:
+        log.warning(f"上游请求失败 {provider.provider_name}: {e}")
+        raise HTTPException(status_code=502, detail="上游服务不可用")
+
+    passHeaders = {k: v for k, v in upstream.headers.items() if k.lower() in PASS_HEADERS}
+    passHeaders.update(contextHeaders)
+
+    if upstream.status_code >= 400:
+        # 错误响应一般很小，直接读完返回
+        content = await upstream.aread()
+        await upstream.aclose()
+        return Response(content=content, status_code=upstream.status_code, headers=passHeaders)
+
+    async def relay():
+        # 透传上游内容：上游按 Accept-Encoding 压缩过的在这里解压 (content-encoding 头不透传)
+        # 客户端断开时 finally 关闭上游响应，连接回到连接池
+        try:
+            async for chunk in upstream.aiter_bytes():
+                yield chunk
+        except httpx.HTTPError as e:
+            log.warning(f"上游流中断 {provider.provider_name}: {e}")
+        finally:
+            await upstream.aclose()
+
+    return StreamingResponse(relay(), status_code=upstream.status_code, headers=passHeaders)
+
+
+@router.get("/v1/models")
+async def proxyListModels(
+    current_user: UserDisplay = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """当前用户可用的模型列表 (OpenAI /v1/models 格式)"""
+    rows = await ai_registry.list_models(db, current_user.uid)
+    return {
+        "object": "list",
+        "data": [
+            {
+                "id": model.model_id,
+                "object": "model",
+                "created": int(model.create_time.timestamp()) if model.create_time else 0,
+                "owned_by": provider.provider_name,
+            }
+            for model, provider in rows
+        ],
+    }
@@ -1,17 +1,21 @@
+import time
+START_TIME = time.perf_counter()  # 计算启动耗时用，放在所有导入之前
+
+import argparse
 from tool.ConfigTool import ConfigTool
 from tool.LogTool import LogTool
-from tool.TimeTool import TimeTool
-import uvicorn
+from tool.ServerTool import ServerTool
 
 log = LogTool.getLog(__name__)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="My Tiny AI Agent")
+    parser.add_argument("--prod", action="store_true", help="生产模式：预加载应用 + 多 worker，不自动重载")
+    args = parser.parse_args()
+
     log.info("My Tiny AI Agent Start!!!")
     ConfigTool.printAll()
-    TimeTool.exec()
-    uvicorn.run(
-        "biz.MainServer:app",
-        host=ConfigTool.get("server", "host", "0.0.0.0"),
-        port=ConfigTool.getInt("server", "port", 5800),
-        reload=True,
-    )
\ No newline at end of file
+    if args.prod:
+        ServerTool.runProd(START_TIME)
+    else:
+        ServerTool.runDev()
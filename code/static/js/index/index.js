@@ -100,6 +100,21 @@ window.chatBoxInstance = new ChatBox({
 // ================= 3. 全局状态与视图逻辑 =================
 let currentUser = null;
 
+// 带登录 token 的 fetch：除注册/登录外的接口都要带 Authorization 头
+// token 失效 (401) 时清掉登录态并弹出登录框
+async function apiFetch(url, options = {}) {
+    const headers = Object.assign({}, options.headers || {});
+    if (currentUser && currentUser.access_token) {
+        headers['Authorization'] = `Bearer ${currentUser.access_token}`;
+    }
+    const res = await fetch(url, Object.assign({}, options, { headers }));
+    if (res.status === 401) {
+        currentUser = null;
+        showLogin();
+    }
+    return res;
+}
+
 // --- 视图切换函数 (iframe vs 聊天框) ---
 function switchView(viewName) {
     const iframe = document.getElementById('newChatFrame');
@@ -256,7 +271,7 @@ if (newChatBtn) {
 
 async function updateSessionStatus(chatId, data) {
     try {
-        const res = await fetch(`/api/v1/chat/chats/${chatId}`, {
+        const res = await apiFetch(`/api/v1/chat/chats/${chatId}`, {
             method: 'PUT',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify(data)
@@ -340,8 +355,7 @@ async function loadSessionList() {
     if (!currentUser) return;
 
     try {
-        const res = await fetch(`/api/v1/chat/chats?user_id=${currentUser.uid}`);
-        const sessions = await res.json();
+        const page = await fetchSessionPage(null);
 
         const listDiv = document.querySelector('.logList');
         listDiv.innerHTML = '';
@@ -362,7 +376,7 @@ async function loadSessionList() {
         window._globalMenuClickListener = () => { closeMenuAndUnlockScroll(); };
         document.addEventListener('click', window._globalMenuClickListener);
 
-        sessions.forEach(sess => {
+        const appendSessions = (sessions) => sessions.forEach(sess => {
             const item = document.createElement('div');
             item.className = 'item';
             if (window.client && window.client.currentSessionId === sess.chat_id) {
@@ -455,12 +469,68 @@ async function loadSessionList() {
             listDiv.appendChild(item);
         });
 
+        appendSessions(page.items);
+
+        // 滚动到底部时按游标加载下一页
+        let nextCursor = page.next_cursor;
+        let loadingMore = false;
+        listDiv.onscroll = async () => {
+            if (!nextCursor || loadingMore) return;
+            if (listDiv.scrollTop + listDiv.clientHeight < listDiv.scrollHeight - 50) return;
+            loadingMore = true;
+            try {
+                const more = await fetchSessionPage(nextCursor);
+                nextCursor = more.next_cursor;
+                appendSessions(more.items);
+            } catch (e) {
+                console.error("加载更多会话失败", e);
+            } finally {
+                loadingMore = false;
+            }
+        };
+
     } catch (e) {
         console.error("加载列表失败", e);
     }
 }
 
-// 加载聊天历史
+async function fetchSessionPage(cursor) {
+    let url = `/api/v1/chat/chats/summary?limit=50`;
+    if (cursor) url += `&cursor=${encodeURIComponent(cursor)}`;
+    const res = await apiFetch(url);
+    if (!res.ok) throw new Error(`HTTP ${res.status}`);
+    return await res.json();
+}
+
+// 加载聊天历史 (游标分页：先加载最新一页，向上滚动时再加载更早的消息)
+const HISTORY_PAGE_SIZE = 50;
+let historyCursor = null;     // 更早消息的游标 (before)
+let historyHasMore = false;
+let historyLoading = false;
+
+async function fetchHistoryPage(sessionId, before) {
+    let url = `/api/v1/chat/history/${sessionId}/page?limit=${HISTORY_PAGE_SIZE}`;
+    if (before) url += `&before=${before}`;
+    const res = await apiFetch(url);
+    if (!res.ok) throw new Error(`HTTP ${res.status}`);
+    return await res.json();
+}
+
+function renderHistory(messages) {
+    const fragment = document.createDocumentFragment();
+    if (window.chatBoxInstance) {
+        messages.forEach(msg => {
+            fragment.appendChild(window.chatBoxInstance.renderMessage(msg.role, msg.content));
+        });
+    }
+    if (typeof hljs !== 'undefined') {
+        fragment.querySelectorAll('pre code').forEach((block) => {
+            hljs.highlightElement(block);
+        });
+    }
+    return fragment;
+}
+
 async function loadChatHistory(sessionId) {
     console.log("正在加载会话ID:", sessionId);
     switchView('chat'); // 必须显示聊天界面
@@ -474,10 +544,8 @@ async function loadChatHistory(sessionId) {
             window.client.currentSessionId = sessionId;
         }
 
-        const res = await fetch(`/api/v1/chat/history/${sessionId}`);
-        if (!res.ok) throw new Error(`HTTP ${res.status}`);
-
-        const history = await res.json();
+        const page = await fetchHistoryPage(sessionId, null);
+        const history = page.messages;
         chatContainer.innerHTML = '';
 
         if (!Array.isArray(history)) {
@@ -485,6 +553,9 @@ async function loadChatHistory(sessionId) {
             return;
         }
 
+        historyCursor = page.before_cursor;
+        historyHasMore = page.has_more;
+
         if (window.client) {
             window.client.history = history.map(msg => ({
                 role: msg.role,
@@ -492,20 +563,11 @@ async function loadChatHistory(sessionId) {
             }));
         }
 
-        if (window.chatBoxInstance) {
-            history.forEach(msg => {
-                const section = window.chatBoxInstance.renderMessage(msg.role, msg.content);
-                chatContainer.appendChild(section);
-            });
-        }
-
-        if (typeof hljs !== 'undefined') {
-            chatContainer.querySelectorAll('pre code').forEach((block) => {
-                hljs.highlightElement(block);
-            });
-        }
-
+        chatContainer.appendChild(renderHistory(history));
         chatContainer.scrollTop = chatContainer.scrollHeight;
+        chatContainer.onscroll = () => {
+            if (chatContainer.scrollTop < 50) loadOlderHistory(sessionId);
+        };
         console.log(`✅ 成功加载 ${history.length} 条历史记录`);
 
     } catch (e) {
@@ -514,6 +576,35 @@ async function loadChatHistory(sessionId) {
     }
 }
 
+// 向上滚动到顶部时加载更早的一页，保持当前可视位置不跳动
+async function loadOlderHistory(sessionId) {
+    if (!historyHasMore || historyLoading) return;
+    if (!window.client || window.client.currentSessionId !== sessionId) return;
+
+    historyLoading = true;
+    const chatContainer = document.getElementById('chat');
+    try {
+        const page = await fetchHistoryPage(sessionId, historyCursor);
+        if (window.client.currentSessionId !== sessionId) return;
+
+        historyCursor = page.before_cursor;
+        historyHasMore = page.has_more;
+
+        window.client.history = page.messages.map(msg => ({
+            role: msg.role,
+            content: msg.content
+        })).concat(window.client.history);
+
+        const oldHeight = chatContainer.scrollHeight;
+        chatContainer.insertBefore(renderHistory(page.messages), chatContainer.firstChild);
+        chatContainer.scrollTop += chatContainer.scrollHeight - oldHeight;
+    } catch (e) {
+        console.error("加载更早的历史失败", e);
+    } finally {
+        historyLoading = false;
+    }
+}
+
 // ================= 6. 消息监听与持久化 =================
 
 // 监听 chat-add (用户发言)
@@ -537,12 +628,11 @@ bus.on('chat-add', async (event) => {
         }
 
         try {
-            const res = await fetch('/api/v1/chat/chats', {
+            const res = await apiFetch('/api/v1/chat/chats', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify({
                     title: content.substring(0, 20) || "新会话",
-                    creator_id: currentUser.uid,
                     initial_message: content
                 })
             });
@@ -585,7 +675,8 @@ async function saveMessageToBackend(sessionId, role, content) {
     if (!content || !content.trim()) return;
     console.log(`💾 正在保存 ${role} 消息...`);
     try {
-        const res = await fetch('/api/v1/chat/messages', {
+        // 只需要确认保存成功，用增量接口避免回传整段历史
+        const res = await apiFetch('/api/v1/chat/messages/delta', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({
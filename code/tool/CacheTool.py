@@ -0,0 +1,64 @@
+"""
+进程内缓存工具：带容量上限 (LRU 淘汰) 和过期时间 (TTL) 的字典。
+
+只在单个进程内有效，多 worker 部署时各自一份，
+所以 TTL 要设置成可以接受的“最长不一致时间”。
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+class TTLCache:
+    def __init__(self, maxSize: int = 1024, ttl: float = 300.0):
+        """
+        参数:
+            maxSize 最多缓存多少条，超过后淘汰最久未使用的
+            ttl     每条缓存的存活秒数，<= 0 表示不过期
+        """
+        self.maxSize = maxSize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            value, expireAt = item
+            if expireAt and expireAt < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        expireAt = time.monotonic() + ttl if ttl > 0 else 0
+        with self._lock:
+            self._data[key] = (value, expireAt)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxSize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> Any:
+        with self._lock:
+            item = self._data.pop(key, None)
+            return item[0] if item else None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def getStats(self) -> Dict[str, int]:
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
@@ -1,4 +1,5 @@
 import os
+import re
 from pathlib import Path
 from configparser import ConfigParser
 
@@ -29,9 +30,19 @@ class ConfigTool:
     def getBoolean(cls, section: str, key: str, fallback=False):
         return cls._load().getboolean(section, key, fallback=fallback)
     
+    # 名字里带这些词的配置项打印时隐藏
+    _secretWords = ("password", "passwd", "secret", "token", "key")
+
+    @classmethod
+    def mask(cls, key: str, value: str) -> str:
+        """隐藏敏感配置：密钥类整项隐藏，连接串只隐藏其中的密码"""
+        if value and any(w in key.lower() for w in cls._secretWords):
+            return "******"
+        return re.sub(r"(://[^:/@\s]*:)[^@\s]*@", r"\1******@", value)
+
     @classmethod
     def printAll(cls):
-        # 将所有配置逐行打印到控制台 
+        # 将所有配置逐行打印到控制台 (密码、密钥等敏感信息已隐藏)
         print("================================\r\n")
         print("     load config                \r\n")
         print("================================\r\n")
@@ -39,6 +50,6 @@ class ConfigTool:
         for section_name in cfg.sections():
             print(f"[{section_name}]")
             for key, value in cfg.items(section_name):
-                print(f"{key} = {value}")
+                print(f"{key} = {cls.mask(key, value)}")
             print()  # 空行分隔 section
         print("================================\r\n")
\ No newline at end of file
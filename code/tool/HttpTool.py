@@ -0,0 +1,93 @@
+"""
+上游 HTTP 客户端池：每个服务商 (base_url) 一个长期存活的 httpx.AsyncClient。
+
+- keep-alive 连接复用，不再每次补全都重新建连 (TCP + TLS 握手)
+- 安装了 h2 时自动启用 HTTP/2 (单连接多路复用)
+- 连接池上限和各项超时从配置读取
+
+配置 ([llm_proxy] 段):
+    max_connections     每个服务商的最大连接数 (默认 100)
+    max_keepalive       保持空闲的最大连接数 (默认 20)
+    keepalive_expiry    空闲连接保留秒数 (默认 30)
+    connect_timeout     建连超时 (默认 5)
+    read_timeout        两次读之间的最长等待，流式输出要足够长 (默认 300)
+    write_timeout       写超时 (默认 30)
+    pool_timeout        等待空闲连接的超时 (默认 5)
+    http2               是否尝试 HTTP/2 (默认 true，需要安装 h2)
+"""
+import asyncio
+from typing import Dict, Optional
+
+import httpx
+
+from tool.ConfigTool import ConfigTool
+from tool.LogTool import LogTool
+
+log = LogTool.getLog(__name__)
+
+try:
+    import h2  # noqa: F401  (httpx 的 HTTP/2 支持依赖它)
+    _hasH2 = True
+except ImportError:
+    _hasH2 = False
+
+
+class HttpTool:
+    _clients: Dict[str, httpx.AsyncClient] = {}
+    _lock: Optional[asyncio.Lock] = None
+    # 测试 / 基准时可以替换成 httpx.ASGITransport，直接调用进程内的应用
+    _transport: Optional[httpx.AsyncBaseTransport] = None
+
+    @classmethod
+    def _limits(cls) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=ConfigTool.getInt("llm_proxy", "max_connections", 100),
+            max_keepalive_connections=ConfigTool.getInt("llm_proxy", "max_keepalive", 20),
+            keepalive_expiry=float(ConfigTool.get("llm_proxy", "keepalive_expiry", "30")),
+        )
+
+    @classmethod
+    def _timeout(cls) -> httpx.Timeout:
+        return httpx.Timeout(
+            connect=float(ConfigTool.get("llm_proxy", "connect_timeout", "5")),
+            read=float(ConfigTool.get("llm_proxy", "read_timeout", "300")),
+            write=float(ConfigTool.get("llm_proxy", "write_timeout", "30")),
+            pool=float(ConfigTool.get("llm_proxy", "pool_timeout", "5")),
+        )
+
+    @classmethod
+    def useTransport(cls, transport: Optional[httpx.AsyncBaseTransport]) -> None:
+        """替换底层传输 (仅测试 / 基准使用)，已创建的客户端不受影响"""
+        cls._transport = transport
+
+    @classmethod
+    async def getClient(cls, baseUrl: str) -> httpx.AsyncClient:
+        """取得某个服务商的共享客户端，第一次使用时创建"""
+        client = cls._clients.get(baseUrl)
+        if client is not None:
+            return client
+        if cls._lock is None:
+            cls._lock = asyncio.Lock()
+        async with cls._lock:
+            client = cls._clients.get(baseUrl)
+            if client is None:
+                http2 = _hasH2 and ConfigTool.getBoolean("llm_proxy", "http2", True)
+                client = httpx.AsyncClient(
+                    base_url=baseUrl,
+                    limits=cls._limits(),
+                    timeout=cls._timeout(),
+                    http2=http2,
+                    transport=cls._transport,
+                )
+                cls._clients[baseUrl] = client
+                log.info(f"创建上游连接池: {baseUrl} (http2={http2})")
+        return client
+
+    @classmethod
+    async def closeAll(cls) -> None:
+        """关闭所有客户端 (应用关闭时调用)"""
+        clients, cls._clients = cls._clients, {}
+        for client in clients.values():
+            await client.aclose()
+        if clients:
+            log.info(f"上游连接池已关闭: {len(clients)} 个")
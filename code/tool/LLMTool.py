@@ -1,6 +1,47 @@
 import time
 import json
 import asyncio
+
+try:
+    # orjson 可选：装了就用它转义字符串，更快，并且直接输出 bytes
+    import orjson
+
+    def _dumpsStr(text: str) -> bytes:
+        return orjson.dumps(text)
+except ImportError:
+    orjson = None
+
+    def _dumpsStr(text: str) -> bytes:
+        return json.dumps(text, ensure_ascii=False).encode("utf-8")
+
+
+class StreamEncoder:
+    """
+    流式 chunk 编码器，每个流创建一次。
+    同一个流里只有 content 和 finish_reason 会变化，所以把固定的前缀 / 后缀
+    预先渲染成 bytes，每个增量只需要转义 content 再拼接，直接输出 SSE 帧 (bytes)。
+    """
+    def __init__(self, id="fake-id", model="fake-model", created=None):
+        head = json.dumps({
+            "id": id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()) if created is None else created,
+            "model": model,
+        }, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        # {"id":...,"model":"..."  +  ,"choices":[{"index":0,"delta":{"content":
+        self._prefix = b"data: " + head[:-1] + b',"choices":[{"index":0,"delta":{"content":'
+        self._suffix = b'},"finish_reason":null}]}\n\n'
+
+    def encode(self, text: str) -> bytes:
+        """编码一个内容增量，返回完整的 SSE 帧"""
+        return self._prefix + _dumpsStr(text) + self._suffix
+
+    def end(self, stop="stop") -> bytes:
+        """结束帧 (带 finish_reason) + [DONE]"""
+        return (self._prefix + b'""},"finish_reason":' + _dumpsStr(stop) + b"}]}\n\n"
+                + b"data: [DONE]\n\n")
+
+
 class LLMTool:
     @staticmethod  # 调用静态方法，不需要创建类的实例
     def getChunk(text, id="fake-id",model="fake-model", stop=None):
@@ -14,26 +55,100 @@ class LLMTool:
         return json.dumps(chunk)
 
     @staticmethod
-    async def putChar( text, id="fake-id",  model="fake-model",  sleepTime = 0.01):
+    async def putChar( text, id="fake-id",  model="fake-model",  sleepTime = 0.01, encoder=None):
+        encoder = encoder or StreamEncoder(id, model)
         for ch in text:
-            chunk = LLMTool.getChunk(ch,id, model)
-            yield f"data: {chunk}\n\n"
+            yield encoder.encode(ch)
             if sleepTime > 0:
                 await asyncio.sleep(sleepTime)
 
     @staticmethod
-    async def putLine(text, id="fake-id",  model="fake-model",  sleepTime = 0.01):
+    async def genChar(text, sleepTime = 0.01):
+        # 逐字符产出原始文本 (模拟模型逐 token 生成)，不做任何封装
+        for ch in text:
+            yield ch
+            if sleepTime > 0:
+                await asyncio.sleep(sleepTime)
+
+    @staticmethod
+    async def coalesce(source, flushMs = 20, maxChars = 0):
+        """
+        合并流式增量：把 source 产出的小片段攒起来再发，减少 SSE 帧数
+            flushMs   时间窗口，缓冲里第一段到达后最多等这么久就发出 (0 表示不按时间)
+            maxChars  缓冲达到这么多字符就触发发送 (0 表示不按大小)
+        两者都为 0 时每个片段单独发出，与逐字符输出相同
+        """
+        if flushMs <= 0 and maxChars <= 0:
+            async for piece in source:
+                yield piece
+            return
+
+        # 后台 pump 任务只负责把片段追加进缓冲，定时器 / 字符数阈值触发 wake，
+        # 这里被唤醒后一次性发出整个缓冲。每个片段只有一次 append，没有额外的 Task
+        loop = asyncio.get_running_loop()
+        window = flushMs / 1000
+        buf = []
+        state = {"size": 0, "done": False, "timer": None, "wake": loop.create_future()}
+
+        def fire():
+            if not state["wake"].done():
+                state["wake"].set_result(None)
+
+        async def pump():
+            try:
+                async for piece in source:
+                    if not buf and window > 0:
+                        state["timer"] = loop.call_later(window, fire)
+                    buf.append(piece)
+                    state["size"] += len(piece)
+                    if maxChars > 0 and state["size"] >= maxChars:
+                        fire()
+            finally:
+                state["done"] = True
+                fire()
+
+        pumpTask = asyncio.ensure_future(pump())
+        try:
+            while True:
+                await state["wake"]
+                state["wake"] = loop.create_future()
+                if state["timer"] is not None:
+                    state["timer"].cancel()
+                    state["timer"] = None
+                if buf:
+                    out = "".join(buf)
+                    buf.clear()
+                    state["size"] = 0
+                    yield out
+                if state["done"] and not buf:
+                    break
+            # source 出错时把异常抛给调用方
+            if pumpTask.done() and not pumpTask.cancelled() and pumpTask.exception():
+                raise pumpTask.exception()
+        finally:
+            if state["timer"] is not None:
+                state["timer"].cancel()
+            pumpTask.cancel()
+
+    @staticmethod
+    async def putCoalesced(text, id="fake-id", model="fake-model", sleepTime = 0.01, flushMs = 20, maxChars = 0, encoder=None):
+        # 逐字符生成，但按时间窗口 / 字符数合并成较大的帧输出
+        encoder = encoder or StreamEncoder(id, model)
+        async for piece in LLMTool.coalesce(LLMTool.genChar(text, sleepTime), flushMs, maxChars):
+            yield encoder.encode(piece)
+
+    @staticmethod
+    async def putLine(text, id="fake-id",  model="fake-model",  sleepTime = 0.01, encoder=None):
+        encoder = encoder or StreamEncoder(id, model)
         for line in text.splitlines(keepends=True):   # keepends=True 保留原始换行
-            chunk = LLMTool.getChunk(line,id,model)
-            yield f"data: {chunk}\n\n"
+            yield encoder.encode(line)
             if sleepTime > 0:
                 await asyncio.sleep(sleepTime)
             
     @staticmethod
-    async def putEnd(id="fake-id",  model="fake-model"):
-        end_chunk = LLMTool.getChunk("",id,model, "stop")
-        yield f"data: {end_chunk}\n\n"
-        yield "data: [DONE]\n\n"
+    async def putEnd(id="fake-id",  model="fake-model", encoder=None):
+        encoder = encoder or StreamEncoder(id, model)
+        yield encoder.end("stop")
 
     @staticmethod
     def getModeListJson():
@@ -1,13 +1,41 @@
 """
 日志库，提供 getLog(name) 函数获取日志器。
 内部所有配置均通过 tool.ConfigTool 读取。
+
+队列模式 (log.queue = true)：
+    业务线程 / 事件循环里只把日志记录放进一个有界队列，
+    格式化后的写控制台、写文件、文件轮转都在后台 QueueListener 线程里完成，
+    磁盘卡顿不会拖慢聊天接口和 SSE 流。
+    队列满时按 log.queue_policy 处理：drop 直接丢弃并计数，block 最多等待 log.queue_block_ms 毫秒。
 """
+import atexit
 import logging
 import logging.config
+import logging.handlers
 import os
-from typing import Dict, Any
+import queue
+from typing import Dict, Any, List, Optional
 from tool.ConfigTool import ConfigTool
 
+
+class _BoundedQueueHandler(logging.handlers.QueueHandler):
+    """队列满时按策略丢弃或限时阻塞，并统计丢弃条数"""
+
+    def __init__(self, q: queue.Queue, block: bool, blockTimeout: float):
+        super().__init__(q)
+        self.block = block
+        self.blockTimeout = blockTimeout
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            if self.block:
+                self.queue.put(record, timeout=self.blockTimeout)
+            else:
+                self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
 class LogTool:
     # ---------- 内部工具 ----------
     @classmethod
@@ -31,7 +59,6 @@ class LogTool:
             "[%(asctime)s] [%(levelname)s] [%(name)s:%(lineno)d] %(message)s"
         )
         logPath = ConfigTool.get("log","path", "").strip()
-        print(logPath)
         handlers: Dict[str, Any] = {}
         # 控制台处理器
         handlers["console"] = {
@@ -76,6 +103,57 @@ class LogTool:
         })
         return config
 
+    # ---------- 队列模式 ----------
+    _queueHandler: Optional[_BoundedQueueHandler] = None
+    _listener: Optional[logging.handlers.QueueListener] = None
+    _targets: List[logging.Handler] = []
+
+    @classmethod
+    def _startListener(cls) -> None:
+        """新建队列和后台线程 (fork 出的子进程里也要重新调用一次，线程不会被继承)"""
+        q = queue.Queue(maxsize=ConfigTool.getInt("log", "queue_size", 10000))
+        cls._queueHandler.queue = q
+        cls._listener = logging.handlers.QueueListener(q, *cls._targets, respect_handler_level=True)
+        cls._listener.start()
+
+    @classmethod
+    def _setupQueue(cls) -> None:
+        """把 root 上的处理器挪到后台线程，root 只保留一个入队的处理器"""
+        root = logging.getLogger()
+        cls._targets = list(root.handlers)
+        for handler in cls._targets:
+            root.removeHandler(handler)
+
+        policy = ConfigTool.get("log", "queue_policy", "drop").strip().lower()
+        cls._queueHandler = _BoundedQueueHandler(
+            queue.Queue(),
+            block=(policy == "block"),
+            blockTimeout=ConfigTool.getInt("log", "queue_block_ms", 100) / 1000
+        )
+        root.addHandler(cls._queueHandler)
+        cls._startListener()
+
+        atexit.register(cls.shutdown)
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=cls._startListener)
+
+    @classmethod
+    def shutdown(cls) -> None:
+        """处理完队列里剩余的日志并停止后台线程"""
+        if cls._listener is not None:
+            cls._listener.stop()
+            cls._listener = None
+            for handler in cls._targets:
+                handler.flush()
+
+    @classmethod
+    def getStats(cls) -> Dict[str, int]:
+        """队列模式的运行指标：当前排队条数、容量、累计丢弃条数"""
+        if cls._queueHandler is None:
+            return {"queued": 0, "capacity": 0, "dropped": 0}
+        q = cls._queueHandler.queue
+        return {"queued": q.qsize(), "capacity": q.maxsize, "dropped": cls._queueHandler.dropped}
+
     # ---------- 全局只初始化一次 ----------
     _setupDone: bool = False
 
@@ -85,6 +163,8 @@ class LogTool:
         if cls._setupDone:
             return
         logging.config.dictConfig(cls._buildConfig())
+        if ConfigTool.getBoolean("log", "queue", False):
+            cls._setupQueue()
         cls._setupDone = True
 
     # ---------- 对外接口 ----------
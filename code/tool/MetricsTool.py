@@ -0,0 +1,229 @@
+"""
+请求指标工具：进程内的计数器 / 直方图，按 Prometheus 文本格式输出。
+
+- 直方图的桶是固定的，记录一次只是一次二分查找加几次整数自增，没有额外依赖
+- 每个请求的数据库耗时放在 contextvar 里，由 SQLAlchemy 的游标事件累加
+- 多 worker 部署时每个进程各有一份，Prometheus 按实例分别抓取
+
+用法:
+    MetricsTool.instrumentEngine(engine)          # 统计该 engine 上的 SQL 耗时
+    app.add_middleware(MetricsMiddleware)        # 记录请求指标
+    MetricsTool.addCollector(fn)                 # 抓取时额外输出的指标 (返回 [(名称, 值, 标签)])
+    MetricsTool.render()                         # /metrics 的内容
+"""
+import bisect
+import contextvars
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# 延迟类直方图的桶 (秒)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# 响应大小直方图的桶 (字节)
+SIZE_BUCKETS = (128, 512, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+# 当前请求累计的数据库耗时 (秒)，不在请求里时为 None
+_dbTime: contextvars.ContextVar[Optional[List[float]]] = contextvars.ContextVar("metrics_db_time", default=None)
+
+
+def _formatLabels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for k, v in labels:
+        v = str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{k}="{v}"')
+    return "{" + ",".join(parts) + "}"
+
+def _formatValue(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...]):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        # labels -> [每个桶的计数 ..., 总数, 总和]
+        self._series: Dict[Labels, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, labels: Labels = ()) -> None:
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[idx] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(labels, list(series)) for labels, series in self._series.items()]
+        for labels, series in sorted(items):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_formatLabels(labels + (('le', _formatValue(float(bound))),))} {cumulative}")
+            lines.append(f"{self.name}_count{_formatLabels(labels)} {cumulative}")
+            lines.append(f"{self.name}_sum{_formatLabels(labels)} {series[-1]!r}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help: str, kind: str = "counter"):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: Labels = (), amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, labels: Labels = (), amount: float = 1) -> None:
+        self.inc(labels, -amount)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_formatLabels(labels)} {_formatValue(value)}")
+        return lines
+
+
+class MetricsTool:
+    requestSeconds = Histogram("http_request_duration_seconds", "请求耗时 (流式接口到最后一块为止)", LATENCY_BUCKETS)
+    firstChunkSeconds = Histogram("http_response_first_chunk_seconds", "流式接口的首块耗时", LATENCY_BUCKETS)
+    responseBytes = Histogram("http_response_size_bytes", "响应体大小", SIZE_BUCKETS)
+    dbSeconds = Histogram("http_request_db_seconds", "单个请求里执行 SQL 的累计耗时", LATENCY_BUCKETS)
+    requestsTotal = Counter("http_requests_total", "请求数")
+    inFlight = Counter("http_requests_in_flight", "正在处理的请求数", kind="gauge")
+
+    _collectors: List[Callable[[], Iterable[Tuple[str, float, Dict[str, str]]]]] = []
+    _instrumented: set = set()
+
+    # ---------- 数据库耗时 ----------
+    @classmethod
+    def instrumentEngine(cls, engine) -> None:
+        """
+        给同步 Engine 挂上游标事件 (异步 engine 传 async_engine.sync_engine)
+        只有在请求里执行的 SQL 才会被计入
+        """
+        from sqlalchemy import event
+
+        if id(engine) in cls._instrumented:
+            return
+        cls._instrumented.add(id(engine))
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def _before(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def _after(conn, cursor, statement, parameters, context, executemany):
+            starts = conn.info.get("metrics_query_start")
+            if not starts:
+                return
+            elapsed = time.perf_counter() - starts.pop()
+            acc = _dbTime.get()
+            if acc is not None:
+                acc[0] += elapsed
+
+    @classmethod
+    def beginRequest(cls) -> Tuple[List[float], contextvars.Token]:
+        """开始统计当前请求的数据库耗时，返回 (累加器, 用于恢复的 token)"""
+        acc = [0.0]
+        return acc, _dbTime.set(acc)
+
+    @classmethod
+    def endRequest(cls, token: contextvars.Token) -> None:
+        _dbTime.reset(token)
+
+    # ---------- 输出 ----------
+    @classmethod
+    def addCollector(cls, fn: Callable[[], Iterable[Tuple[str, float, Dict[str, str]]]]) -> None:
+        """
+        抓取时调用 fn，输出它返回的 gauge
+        fn 返回 [(指标名, 值, 标签字典), ...]
+        """
+        cls._collectors.append(fn)
+
+    @classmethod
+    def render(cls) -> str:
+        lines: List[str] = []
+        for metric in (cls.requestsTotal, cls.inFlight, cls.requestSeconds,
+                       cls.firstChunkSeconds, cls.responseBytes, cls.dbSeconds):
+            lines.extend(metric.render())
+        seen = set()
+        for fn in cls._collectors:
+            try:
+                samples = list(fn())
+            except Exception:
+                continue
+            for name, value, labels in samples:
+                if name not in seen:
+                    seen.add(name)
+                    lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name}{_formatLabels(tuple(sorted(labels.items())))} {_formatValue(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """
+    纯 ASGI 中间件 (不用 BaseHTTPMiddleware，流式响应不会被缓冲)
+    只包一层 send，记录状态码、首块时间和响应字节数
+    """
+    def __init__(self, app, skipPaths: Tuple[str, ...] = ("/metrics",)):
+        self.app = app
+        self.skipPaths = skipPaths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skipPaths:
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        state = {"status": 500, "bytes": 0, "first": None, "streaming": False}
+        acc, token = MetricsTool.beginRequest()
+        MetricsTool.inFlight.inc()
+
+        async def wrappedSend(message):
+            kind = message["type"]
+            if kind == "http.response.start":
+                state["status"] = message["status"]
+            elif kind == "http.response.body":
+                body = message.get("body", b"")
+                state["bytes"] += len(body)
+                if message.get("more_body", False) and state["first"] is None:
+                    # 还有后续数据块，说明是流式响应
+                    state["streaming"] = True
+                    state["first"] = time.perf_counter() - start
+            await send(message)
+
+        try:
+            await self.app(scope, receive, wrappedSend)
+        finally:
+            MetricsTool.endRequest(token)
+            MetricsTool.inFlight.dec()
+            labels = (("method", scope["method"]), ("route", self._routeOf(scope)))
+            MetricsTool.requestsTotal.inc(labels + (("status", str(state["status"])),))
+            MetricsTool.requestSeconds.observe(time.perf_counter() - start, labels)
+            MetricsTool.responseBytes.observe(state["bytes"], labels)
+            MetricsTool.dbSeconds.observe(acc[0], labels)
+            if state["streaming"]:
+                MetricsTool.firstChunkSeconds.observe(state["first"], labels)
+
+    @staticmethod
+    def _routeOf(scope) -> str:
+        """用路由模板当标签 (/history/{chat_id})，不用实际路径，避免标签数量无限增长"""
+        route = scope.get("route")
+        path = getattr(route, "path", None)
+        return path if path is not None else "unmatched"
@@ -0,0 +1,142 @@
+"""
+密码哈希工具：bcrypt 的计算放到独立的进程池里执行。
+
+bcrypt 每次要消耗几十到几百毫秒 CPU，并且一直持有 GIL，
+在请求线程里直接算会让同一进程里的其他请求 (包括 SSE 流) 全部卡住。
+
+配置 ([auth] 段):
+    hash_workers      进程池大小 (默认 min(4, CPU 核数))
+    hash_max_pending  排队上限，超过直接拒绝 (默认 256)
+    bcrypt_rounds     bcrypt 代价因子 (默认 12)，调整后老密码在下次登录时自动重新哈希
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, Tuple
+
+from passlib.context import CryptContext
+from tool.ConfigTool import ConfigTool
+
+# 注意：子进程以 spawn 方式启动会重新导入本模块，这里不初始化 LogTool，
+# 避免每个子进程都去挂一遍日志文件处理器
+log = logging.getLogger(__name__)
+
+
+def buildContext(rounds: int) -> CryptContext:
+    """按代价因子创建 CryptContext (代价因子不同的旧哈希会被标记为需要更新)"""
+    return CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds)
+
+
+# ---------- 子进程里执行的函数 (必须是模块级函数才能被 pickle) ----------
+_contexts: Dict[int, CryptContext] = {}
+
+def _context(rounds: int) -> CryptContext:
+    if rounds not in _contexts:
+        _contexts[rounds] = buildContext(rounds)
+    return _contexts[rounds]
+
+def _hash(password: str, rounds: int) -> str:
+    return _context(rounds).hash(password)
+
+def _verifyAndUpdate(password: str, hashed: str, rounds: int) -> Tuple[bool, Optional[str]]:
+    return _context(rounds).verify_and_update(password, hashed)
+
+
+class PasswordBusyError(Exception):
+    """排队的哈希任务超过上限"""
+
+
+class PasswordTool:
+    _pool: Optional[ProcessPoolExecutor] = None
+    _sem: Optional[asyncio.Semaphore] = None
+
+    # 运行指标
+    _pending: int = 0     # 已提交还没完成的任务 (排队 + 执行中)
+    _running: int = 0     # 正在子进程里执行的任务
+    _completed: int = 0
+    _rejected: int = 0
+
+    # ---------- 配置 ----------
+    @classmethod
+    def workers(cls) -> int:
+        return ConfigTool.getInt("auth", "hash_workers", min(4, os.cpu_count() or 1))
+
+    @classmethod
+    def maxPending(cls) -> int:
+        return ConfigTool.getInt("auth", "hash_max_pending", 256)
+
+    @classmethod
+    def rounds(cls) -> int:
+        return ConfigTool.getInt("auth", "bcrypt_rounds", 12)
+
+    # ---------- 生命周期 ----------
+    @classmethod
+    def start(cls) -> None:
+        """创建进程池 (应用启动时调用；不调用也会在第一次使用时自动创建)"""
+        if cls._pool is None:
+            workers = cls.workers()
+            cls._pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+            cls._sem = asyncio.Semaphore(workers)
+            log.info(f"密码哈希进程池已启动: workers={workers}, rounds={cls.rounds()}")
+
+    @classmethod
+    def shutdown(cls) -> None:
+        """关闭进程池 (应用关闭时调用；会等在途任务做完，异步代码里用 asyncio.to_thread 调用)"""
+        if cls._pool is not None:
+            cls._pool.shutdown(wait=True, cancel_futures=True)
+            cls._pool = None
+            cls._sem = None
+            log.info("密码哈希进程池已关闭。")
+
+    @classmethod
+    def getStats(cls) -> Dict[str, int]:
+        """队列深度等运行指标"""
+        return {
+            "workers": cls.workers(),
+            "pending": cls._pending,
+            "queued": cls._pending - cls._running,
+            "running": cls._running,
+            "completed": cls._completed,
+            "rejected": cls._rejected,
+        }
+
+    # ---------- 对外接口 ----------
+    @classmethod
+    async def _submit(cls, fn, *args):
+        if cls._pool is None:
+            cls.start()
+        if cls._pending >= cls.maxPending():
+            cls._rejected += 1
+            raise PasswordBusyError("密码校验繁忙，请稍后重试")
+
+        cls._pending += 1
+        try:
+            # 信号量限制同时在子进程里执行的任务数，其余的在这里排队
+            async with cls._sem:
+                cls._running += 1
+                try:
+                    loop = asyncio.get_running_loop()
+                    return await loop.run_in_executor(cls._pool, fn, *args)
+                finally:
+                    cls._running -= 1
+                    cls._completed += 1
+        finally:
+            cls._pending -= 1
+
+    @classmethod
+    async def hashPassword(cls, password: str) -> str:
+        """计算密码哈希"""
+        return await cls._submit(_hash, password, cls.rounds())
+
+    @classmethod
+    async def verifyPassword(cls, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        """
+        校验密码
+        返回: (是否正确, 新哈希)；代价因子变化时新哈希不为空，调用方应写回数据库
+        """
+        return await cls._submit(_verifyAndUpdate, password, hashed, cls.rounds())
@@ -0,0 +1,285 @@
+"""
+服务启动工具：开发模式 (单进程 + 自动重载) 和生产模式 (预加载 + 多 worker)。
+
+生产模式的流程 (类似 gunicorn --preload)：
+    0. 检查 [auth] token_secret 已配置 (多个 worker 要用同一个密钥校验 token)，没有就退出
+    1. 主进程导入应用、建表、跑迁移，只做一次
+    2. 主进程绑定监听端口，然后 fork 出 N 个 worker，共享同一个监听 socket
+       worker 直接继承已经导入好的模块，不用每个再导入一遍
+    3. 每个 worker 跑一个 uvicorn.Server (装了 uvloop / httptools 时自动使用)
+       worker 序号记在 app.state.worker_index，后台定时任务只在 0 号 worker 里启动
+    4. 收到 SIGTERM / SIGINT 时转发给 worker：停止接收新连接，
+       正在输出的 SSE 流最多等待 drain_timeout 秒，然后退出
+    5. worker 意外退出时自动补一个；启动后很快又退出的按指数退避延迟重启，
+       同一个 worker 连续 max_restarts 次都是这样 (比如配置错误、数据库连不上) 就停掉全部 worker，主进程退出
+
+配置 ([server] 段):
+    host / port     监听地址
+    reload          开发模式是否自动重载 (默认 true)
+    workers         生产模式 worker 数，0 表示 CPU 核数 (默认 0)
+    backlog         监听队列长度 (默认 2048)
+    drain_timeout   关闭时等待在途请求 (包括 SSE 流) 的秒数 (默认 30)
+    access_log      是否输出访问日志 (默认 false，每个请求一行日志在高并发时开销不小)
+    min_uptime      worker 运行不到这么多秒就退出算作启动失败 (默认 10)
+    max_restarts    同一个 worker 连续启动失败多少次后主进程放弃并退出 (默认 5)
+"""
+import asyncio
+import os
+import signal
+import socket
+import time
+from typing import Dict, Optional
+
+import uvicorn
+
+from tool.ConfigTool import ConfigTool
+from tool.LogTool import LogTool
+
+log = LogTool.getLog(__name__)
+
+APP_PATH = "biz.MainServer:app"
+
+
+class ServerTool:
+    # ---------- 配置 ----------
+    @classmethod
+    def host(cls) -> str:
+        return ConfigTool.get("server", "host", "0.0.0.0")
+
+    @classmethod
+    def port(cls) -> int:
+        return ConfigTool.getInt("server", "port", 5800)
+
+    @classmethod
+    def workers(cls) -> int:
+        workers = ConfigTool.getInt("server", "workers", 0)
+        return workers if workers > 0 else (os.cpu_count() or 1)
+
+    @classmethod
+    def _loopName(cls) -> str:
+        try:
+            import uvloop  # noqa: F401
+            return "uvloop"
+        except ImportError:
+            return "asyncio"
+
+    @classmethod
+    def _httpName(cls) -> str:
+        try:
+            import httptools  # noqa: F401
+            return "httptools"
+        except ImportError:
+            return "h11"
+
+    # ---------- 开发模式 ----------
+    @classmethod
+    def runDev(cls) -> None:
+        """单进程，按配置决定是否自动重载"""
+        uvicorn.run(
+            APP_PATH,
+            host=cls.host(),
+            port=cls.port(),
+            reload=ConfigTool.getBoolean("server", "reload", True),
+        )
+
+    # ---------- 生产模式 ----------
+    @classmethod
+    def runProd(cls, startTime: float) -> None:
+        """
+        预加载 + 多 worker
+        参数:
+            startTime  进程启动时的 time.perf_counter()，用来计算启动耗时
+        """
+        if not ConfigTool.get("auth", "token_secret", ""):
+            # 随机密钥每个进程 (以及每次重启) 都不一样，登录发出的 token 在其他 worker 上全部无效
+            log.error("生产模式必须配置 [auth] token_secret (所有 worker 共用的签名密钥)，拒绝启动")
+            raise SystemExit(1)
+
+        workers = cls.workers()
+        if not hasattr(os, "fork"):
+            # Windows 没有 fork，只能让 uvicorn 在每个 worker 里各自导入应用
+            log.warning("当前系统不支持 fork，退回 uvicorn 多进程模式 (不预加载，后台定时任务会在每个 worker 里各跑一份)")
+            uvicorn.run(APP_PATH, host=cls.host(), port=cls.port(), workers=workers,
+                        timeout_graceful_shutdown=ConfigTool.getInt("server", "drain_timeout", 30),
+                        access_log=ConfigTool.getBoolean("server", "access_log", False))
+            return
+
+        app = cls._preload()
+        log.info(f"应用预加载完成，耗时 {time.perf_counter() - startTime:.2f}s")
+
+        sock = cls._bind()
+        readyRead, readyWrite = os.pipe()
+        children: Dict[int, int] = {}   # pid -> worker 序号
+        startedAt: Dict[int, float] = {}  # worker 序号 -> 最近一次启动的时间
+        failures: Dict[int, int] = {}   # worker 序号 -> 连续启动失败的次数
+        minUptime = ConfigTool.getInt("server", "min_uptime", 10)
+        maxRestarts = ConfigTool.getInt("server", "max_restarts", 5)
+        stopping = False
+        exitCode = 0
+
+        def spawn(index: int, notifyFd: Optional[int] = None) -> None:
+            pid = os.fork()
+            if pid == 0:
+                if notifyFd is not None:
+                    os.close(readyRead)
+                code = 0
+                try:
+                    cls._workerMain(app, sock, notifyFd, index)
+                except BaseException as e:
+                    log.error(f"worker {index} 异常退出: {e}", exc_info=True)
+                    code = 1
+                finally:
+                    LogTool.shutdown()
+                    os._exit(code)
+            children[pid] = index
+            startedAt[index] = time.monotonic()
+
+        def onSignal(signum, frame):
+            if not stopping:
+                log.info(f"收到信号 {signal.Signals(signum).name}，通知 worker 停止接收新请求并等待在途请求完成...")
+            stopAll()
+
+        def stopAll():
+            nonlocal stopping
+            stopping = True
+            for pid in list(children):
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+
+        signal.signal(signal.SIGTERM, onSignal)
+        signal.signal(signal.SIGINT, onSignal)
+
+        log.info(f"启动 {workers} 个 worker: {cls.host()}:{cls.port()} (loop={cls._loopName()}, http={cls._httpName()})")
+        for i in range(workers):
+            spawn(i, readyWrite)
+        os.close(readyWrite)
+        cls._waitReady(readyRead, workers, startTime)
+
+        # 监督 worker：意外退出的补上，收到停止信号后等全部退出
+        while children:
+            try:
+                pid, status = os.waitpid(-1, 0)
+            except InterruptedError:
+                continue
+            except ChildProcessError:
+                break
+            index = children.pop(pid, None)
+            if index is None:
+                continue
+            if stopping:
+                continue
+            if time.monotonic() - startedAt[index] >= minUptime:
+                failures[index] = 0
+                log.warning(f"worker {index} (pid={pid}) 意外退出 (status={status})，重新启动")
+                spawn(index)
+                continue
+            # 刚启动就退出：退避后再试，一直这样就不再 fork，避免死循环地拉起子进程
+            failures[index] = failures.get(index, 0) + 1
+            if failures[index] >= maxRestarts:
+                log.error(f"worker {index} 连续 {failures[index]} 次启动后 {minUptime}s 内退出 (status={status})，停止全部 worker")
+                exitCode = 1
+                stopAll()
+                continue
+            delay = min(0.5 * 2 ** (failures[index] - 1), 30)
+            log.warning(f"worker {index} (pid={pid}) 启动后很快退出 (status={status})，{delay:.1f}s 后第 {failures[index]} 次重启")
+            cls._backoff(delay, lambda: stopping)
+            if not stopping:
+                spawn(index)
+
+        sock.close()
+        log.info("全部 worker 已退出。")
+        if exitCode:
+            raise SystemExit(exitCode)
+
+    @classmethod
+    def _backoff(cls, seconds: float, stopping) -> None:
+        """重启前等待；期间收到停止信号立即返回"""
+        deadline = time.monotonic() + seconds
+        while not stopping() and time.monotonic() < deadline:
+            time.sleep(max(0.0, min(0.1, deadline - time.monotonic())))
+
+    @classmethod
+    def _preload(cls):
+        """主进程里导入应用并完成只需要做一次的数据库准备，worker 的 lifespan 会跳过这一步"""
+        from biz.MainServer import app
+        from biz.chat.chat_migrate import run_migrations
+        from tool.db_session import init_db, engine
+
+        init_db()
+        run_migrations()
+        # fork 之前关掉连接，不能让多个进程共用同一条数据库连接
+        engine.dispose()
+        app.state.db_ready = True
+        return app
+
+    @classmethod
+    def _bind(cls) -> socket.socket:
+        host, port = cls.host(), cls.port()
+        family, _, _, _, addr = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)[0]
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(addr)
+        sock.listen(ConfigTool.getInt("server", "backlog", 2048))
+        sock.set_inheritable(True)
+        return sock
+
+    @classmethod
+    def _waitReady(cls, readyRead: int, workers: int, startTime: float) -> None:
+        """每个 worker 就绪时往管道里写一个字节，全部到齐后报告启动耗时"""
+        ready = 0
+        while ready < workers:
+            try:
+                data = os.read(readyRead, workers - ready)
+            except InterruptedError:
+                continue
+            if not data:
+                break
+            ready += len(data)
+        os.close(readyRead)
+        log.info(f"{ready}/{workers} 个 worker 就绪，从启动到可以接收请求共 {time.perf_counter() - startTime:.2f}s")
+
+    @classmethod
+    def _workerMain(cls, app, sock: socket.socket, readyWrite: Optional[int], index: int) -> None:
+        # 恢复默认信号处理，交给 uvicorn 自己接管
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+        # 连接池不能跨进程共享，丢掉从主进程继承来的 (不关闭，避免影响主进程)
+        from tool.db_session import engine, async_engine
+        engine.dispose(close=False)
+        async_engine.sync_engine.dispose(close=False)
+        # lifespan 根据它决定要不要启动后台定时任务 (每个部署只跑一份)
+        app.state.worker_index = index
+
+        config = uvicorn.Config(
+            app,
+            loop="auto",
+            http="auto",
+            lifespan="on",
+            log_config=None,
+            access_log=ConfigTool.getBoolean("server", "access_log", False),
+            timeout_graceful_shutdown=ConfigTool.getInt("server", "drain_timeout", 30),
+        )
+        server = uvicorn.Server(config)
+
+        async def serve():
+            task = asyncio.create_task(server.serve(sockets=[sock]))
+            while not server.started and not task.done():
+                await asyncio.sleep(0.01)
+            # 重新拉起的 worker 不需要报告 (readyWrite 为 None)
+            if readyWrite is not None:
+                if server.started:
+                    os.write(readyWrite, b"1")
+                os.close(readyWrite)
+            await task
+
+        loopFactory = config.get_loop_factory() or asyncio.new_event_loop
+        loop = loopFactory()
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(serve())
+        finally:
+            loop.close()
+        log.info(f"worker {index} (pid={os.getpid()}) 已退出")
@@ -0,0 +1,80 @@
+"""
+Token 计数工具：写入消息时算一次，存进 chat_message.token_count，之后构造上下文只做加减法。
+
+- 装了 tiktoken 并且能加载编码 (默认 cl100k_base) 时用 tiktoken 精确计数
+- 没装、或者离线环境下载不了编码文件时，自动退回离线估算：
+  中日韩文字每字约 1 个 token，英文单词 / 数字每 4 个字符约 1 个 token，标点符号每个 1 个 token。
+  对 cl100k 一类的 BPE 编码，误差一般在 ±20% 以内，用来裁剪上下文足够了
+- 每条消息另外加上固定的格式开销 (role、分隔符)，和 OpenAI 的聊天格式计费方式一致
+
+配置 ([tokenizer] 段):
+    mode              auto (优先 tiktoken) / estimate (只用离线估算) (默认 auto)
+    encoding          tiktoken 编码名 (默认 cl100k_base)
+    message_overhead  每条消息的格式开销 (默认 4)
+"""
+import math
+import re
+from typing import Optional
+
+from tool.ConfigTool import ConfigTool
+from tool.LogTool import LogTool
+
+log = LogTool.getLog(__name__)
+
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff"
+# 一个汉字 | 一个单词 | 一个标点 (空白不计)
+_PIECE_RE = re.compile(f"[{_CJK}]|(?:(?![{_CJK}])\\w)+|[^\\w\\s]")
+
+
+class TokenTool:
+    _encoder = None
+    _loaded = False
+
+    MESSAGE_OVERHEAD = ConfigTool.getInt("tokenizer", "message_overhead", 4)
+
+    @classmethod
+    def _getEncoder(cls):
+        """第一次调用时加载 tiktoken，失败就记一次日志，之后一直用估算"""
+        if cls._loaded:
+            return cls._encoder
+        cls._loaded = True
+        if ConfigTool.get("tokenizer", "mode", "auto") == "estimate":
+            return None
+        name = ConfigTool.get("tokenizer", "encoding", "cl100k_base")
+        try:
+            import tiktoken
+            cls._encoder = tiktoken.get_encoding(name)
+            log.info(f"Token 计数使用 tiktoken ({name})")
+        except Exception as e:
+            log.warning(f"tiktoken 不可用 ({type(e).__name__}: {e})，Token 计数使用离线估算")
+        return cls._encoder
+
+    @classmethod
+    def backend(cls) -> str:
+        return "tiktoken" if cls._getEncoder() is not None else "estimate"
+
+    @classmethod
+    def estimate(cls, text: str) -> int:
+        """离线估算 (不依赖任何编码文件)"""
+        total = 0
+        for piece in _PIECE_RE.findall(text):
+            if len(piece) == 1:
+                total += 1
+            else:
+                total += math.ceil(len(piece) / 4)
+        return total
+
+    @classmethod
+    def count(cls, text: Optional[str]) -> int:
+        """文本的 token 数"""
+        if not text:
+            return 0
+        encoder = cls._getEncoder()
+        if encoder is not None:
+            return len(encoder.encode(text, disallowed_special=()))
+        return cls.estimate(text)
+
+    @classmethod
+    def countMessage(cls, content: Optional[str]) -> int:
+        """一条聊天消息占用的 token 数 (内容 + 格式开销)"""
+        return cls.count(content) + cls.MESSAGE_OVERHEAD
@@ -8,9 +8,36 @@
 3. 定义 Base (模型基类)
 4. 提供 get_db (FastAPI 依赖注入)
 5. 提供 init_db (初始化数据库表)
+6. 提供异步版本: async_engine / AsyncSessionLocal / get_async_db
+7. 提供连接池状态: getPoolStats
+8. 提供数据库时钟: db_now
+
+内存 SQLite (配置成 sqlite:///:memory:，或者读配置失败时的兜底) 会换成临时目录里的一个文件库：
+同步和异步两个 Engine 各有一套连接池，用内存库的话它们看到的是两个互不相干的空库，
+换成同一个文件后两边的表、迁移和 FTS5 索引都是同一份。进程退出时删除。
+
+连接池配置 ([database] 段):
+    pool_size       常驻连接数 (默认 10)
+    max_overflow    高峰时额外允许的连接数 (默认 20)
+    pool_timeout    等待空闲连接的秒数 (默认 30)
+    pool_recycle    连接最长存活秒数，要小于 MySQL 的 wait_timeout (默认 3600)
+    pool_pre_ping   取连接时先 ping 一下，自动丢弃已断开的连接 (默认 true)
+
+SQLite 性能配置 (每个新连接执行一次 PRAGMA):
+    sqlite_wal           是否使用 WAL 日志 (默认 true，读写互不阻塞)
+    sqlite_synchronous   同步级别 (默认 NORMAL，WAL 下断电最多丢最后几个事务，不会损坏)
+    sqlite_mmap_size     内存映射大小，字节 (默认 256MB)
+    sqlite_cache_size    页缓存，负数表示 KB (默认 -65536，即 64MB)
+    sqlite_busy_timeout  写锁等待毫秒数 (默认 5000)
 """
+import atexit
 import json
-from sqlalchemy import create_engine
+import os
+import tempfile
+from datetime import datetime
+from typing import Dict
+from sqlalchemy import create_engine, event, func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from tool.ConfigTool import ConfigTool
@@ -35,17 +62,92 @@ except Exception as e:
     logger.warning("回退到内存数据库 (sqlite:///:memory:)")
 # --- 修正结束 ---
 
+def _tempSqliteUrl() -> str:
+    """
+    内存库换成临时文件库 (同步 / 异步 Engine 共用)，进程退出时删除
+    预加载模式下 worker 继承主进程的 URL，用的也是同一个文件
+    """
+    path = os.path.join(tempfile.gettempdir(), f"mytinyagent-{os.getpid()}.db")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    pid = os.getpid()
+
+    @atexit.register
+    def _cleanup():
+        # fork 出来的子进程不删 (它们退出时主进程还在用)
+        if os.getpid() != pid:
+            return
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.remove(path + suffix)
+            except OSError:
+                pass
+
+    return f"sqlite:///{path}"
+
 # 3. 创建 SQLAlchemy Engine (连接池)
-engine_args = {"pool_recycle": 3600}
-if DATABASE_URL.startswith("sqlite"):
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+if IS_SQLITE and (":memory:" in DATABASE_URL or DATABASE_URL.rstrip("/").endswith("sqlite:")):
+    DATABASE_URL = _tempSqliteUrl()
+    logger.warning(f"内存 SQLite 改用临时文件库 (同步和异步连接要看到同一个库): {DATABASE_URL}")
+
+engine_args = dict(
+    pool_size=ConfigTool.getInt("database", "pool_size", 10),
+    max_overflow=ConfigTool.getInt("database", "max_overflow", 20),
+    pool_timeout=ConfigTool.getInt("database", "pool_timeout", 30),
+    pool_recycle=ConfigTool.getInt("database", "pool_recycle", 3600),
+    pool_pre_ping=ConfigTool.getBoolean("database", "pool_pre_ping", True),
+)
+if IS_SQLITE:
     engine_args["connect_args"] = {"check_same_thread": False}
 
+# 同步驱动 -> 异步驱动 (同一个数据库，两套连接池)
+ASYNC_DRIVERS = {
+    "mysql+pymysql": "mysql+aiomysql",
+    "mysql": "mysql+aiomysql",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+def toAsyncUrl(url: str) -> str:
+    """把同步连接串换成对应的异步驱动，例如 mysql+pymysql:// -> mysql+aiomysql://"""
+    scheme, sep, rest = url.partition("://")
+    return ASYNC_DRIVERS.get(scheme, scheme) + sep + rest
+
+ASYNC_DATABASE_URL = toAsyncUrl(DATABASE_URL)
+
 def toShow(obj):
     """
     ensure_ascii=False -> 让中文直接以字符形式存储
     """
     return json.dumps(obj, ensure_ascii=False)
 
+def applySqliteProfile(engine) -> None:
+    """
+    给 SQLite 的 Engine 挂上 connect 事件，每个新连接执行一遍性能相关的 PRAGMA
+    异步 Engine 传 async_engine.sync_engine
+    """
+    pragmas = [
+        f"PRAGMA synchronous={ConfigTool.get('database', 'sqlite_synchronous', 'NORMAL')}",
+        f"PRAGMA mmap_size={ConfigTool.getInt('database', 'sqlite_mmap_size', 256 * 1024 * 1024)}",
+        f"PRAGMA cache_size={ConfigTool.getInt('database', 'sqlite_cache_size', -65536)}",
+        f"PRAGMA busy_timeout={ConfigTool.getInt('database', 'sqlite_busy_timeout', 5000)}",
+        "PRAGMA temp_store=MEMORY",
+    ]
+    # 内存库没有日志文件，设置 WAL 没有意义
+    if ConfigTool.getBoolean("database", "sqlite_wal", True) and engine.url.database not in (None, "", ":memory:"):
+        pragmas.insert(0, "PRAGMA journal_mode=WAL")
+
+    @event.listens_for(engine, "connect")
+    def _setPragmas(dbapi_conn, connection_record):
+        cursor = dbapi_conn.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
 try:
     engine = create_engine(DATABASE_URL, json_serializer=toShow, **engine_args)
     
@@ -58,6 +160,21 @@ try:
     
     logger.info("SQLAlchemy Engine 和 SessionLocal 创建成功。")
 
+    # 6. 异步 Engine 和会话工厂 (API 在事件循环上直接等待数据库，不占线程池)
+    # expire_on_commit=False: 提交后对象仍可读取，避免在异步环境里触发隐式加载
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, json_serializer=toShow, **engine_args)
+    AsyncSessionLocal = async_sessionmaker(
+        bind=async_engine, class_=AsyncSession,
+        autoflush=False, expire_on_commit=False
+    )
+
+    logger.info("SQLAlchemy AsyncEngine 和 AsyncSessionLocal 创建成功。")
+
+    if IS_SQLITE:
+        applySqliteProfile(engine)
+        applySqliteProfile(async_engine.sync_engine)
+        logger.info("已启用 SQLite 性能配置 (WAL / synchronous / mmap / cache)。")
+
 except Exception as e:
     logger.error(f"创建 SQLAlchemy Engine 失败: {e}", exc_info=True)
     raise e
@@ -78,6 +195,48 @@ def get_db():
     finally:
         db.close() 
 
+# 6.1 (函数) FastAPI 异步依赖注入
+async def get_async_db():
+    """
+    get_db 的异步版本，供 async def 接口使用
+    """
+    async with AsyncSessionLocal() as db:
+        try:
+            yield db
+        except Exception as e:
+            logger.error(f"数据库会话出错: {e}", exc_info=True)
+            await db.rollback()
+            raise
+
+# 6.2 (函数) 连接池状态
+def getPoolStats() -> Dict[str, Dict[str, int]]:
+    """
+    两个连接池的实时状态
+    size 常驻连接数 / checked_out 正在使用 / checked_in 空闲 / overflow 超出常驻的连接数
+    """
+    stats = {}
+    for name, pool in (("sync", engine.pool), ("async", async_engine.sync_engine.pool)):
+        item = {}
+        for key, attr in (("size", "size"), ("checked_out", "checkedout"),
+                          ("checked_in", "checkedin"), ("overflow", "overflow")):
+            fn = getattr(pool, attr, None)
+            if fn is not None:
+                item[key] = fn()
+        if "overflow" in item:
+            # QueuePool 的 overflow() 从 -pool_size 开始计数，这里只报超出常驻的部分
+            item["overflow"] = max(item["overflow"], 0)
+        stats[name] = item
+    return stats
+
+# 6.3 (函数) 数据库时钟
+def db_now(db) -> datetime:
+    """
+    数据库自己的当前时间 (不带时区)
+    和 server_default / func.now() 写入的时间列是同一个时钟 (MySQL 是服务器时区的本地时间，SQLite 是 UTC)，
+    按 "多少天没更新" 之类的条件筛选时用它算截止时间，不受应用服务器时区影响
+    """
+    return db.execute(select(func.now())).scalar()
+
 # 7. (函数) 初始化数据库表
 def init_db():
     """
@@ -92,4 +251,4 @@ def init_db():
         logger.info("数据库表初始化完成。")
     except Exception as e:
         logger.error(f"数据库表初始化失败: {e}", exc_info=True)
-        raise
\ No newline at end of file
+        raise